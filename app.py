@@ -1,643 +1,43 @@
 import streamlit as st
 import streamlit.components.v1 as components
-import pandas as pd
 import os
 import json
-from datetime import datetime, timedelta
-from slugify import slugify
+from datetime import datetime
 from urllib.parse import urlparse, parse_qs
 
-import re
 import html as html_lib  # per escapare valori UTM nell'HTML
-from pathlib import Path
 
-# Google Auth & Analytics import os
-import google.auth
-from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from google.analytics.admin import AnalyticsAdminServiceClient
-from google.analytics.data import BetaAnalyticsDataClient
-from google.analytics.data_v1beta.types import RunReportRequest, DateRange, Metric, Dimension
-
-import google.generativeai as genai
 from googleapi import get_persistent_api_key, save_persistent_api_key, get_user_email
-import ga4_mcp_tools # Import tools module
-from functools import partial
-
-# Import new Chatbot UI
-from chatbot_ui import render_chatbot_interface
+import utm_history_store
+from static_assets import stylesheet_tags
+from utm_core import (
+    GUIDE_TABLE_DATA,
+    get_source_options,
+    normalize_token,
+    normalize_medium_token,
+    validate_naming_rules,
+    filter_options_by_source_mode,
+    is_valid_url,
+    infer_expected_channel_group,
+    _extract_live_date_from_utm_campaign,
+    build_property_name_lookup,
+    build_utm_link,
+    build_variant_matrix,
+    split_values,
+    make_history_entry,
+)
+
+# Le dipendenze pesanti (pandas, client GA4, Gemini, chatbot, monitor) sono importate nelle
+# funzioni che le usano: la pagina di login di un worker appena avviato non le carica.
+# Tempi di import misurati con benchmarks/bench_import_time.py.
 
 # --- CONFIGURAZIONE ---
 st.set_page_config(page_title="Universal UTM Governance", layout="wide")
 
 # --- CSS (STILE CLEAN + CHECKER CORRETTO) ---
-st.markdown("""
-<style>
-    :root {
-        --bg-soft: #edf4ff;
-        --surface: #ffffff;
-        --surface-soft: #f7fbff;
-        --ink: #0f2338;
-        --muted: #4f6478;
-        --line: #c8d9ee;
-        --brand: #0b74e5;
-        --brand-strong: #0755b3;
-        --accent: #00a7a0;
-        --ok: #188038;
-        --warn: #e37400;
-        --danger: #d93025;
-    }
-
-    .stApp {
-        background:
-            radial-gradient(1200px 500px at 6% -10%, #dcebff 0%, rgba(220, 235, 255, 0) 60%),
-            radial-gradient(900px 420px at 95% 0%, #dff8f5 0%, rgba(223, 248, 245, 0) 62%),
-            var(--bg-soft);
-        font-family: "Inter", "Roboto", "Segoe UI", Arial, sans-serif;
-    }
-
-    .block-container {
-        max-width: 1220px;
-        margin: 0 auto;
-        padding-top: 1.4rem;
-        padding-bottom: 2rem;
-    }
-
-    .top-shell {
-        background: #ffffff;
-        border: 1px solid #dbe5f0;
-        border-radius: 14px;
-        box-shadow: 0 4px 14px rgba(20, 36, 52, 0.06);
-        padding: 16px 18px;
-        margin-bottom: 14px;
-    }
-    .top-shell-empty {
-        min-height: 8px;
-    }
-
-    .top-shell .title {
-        color: #1d2731;
-        font-size: 30px;
-        font-weight: 700;
-        margin: 0 0 4px 0;
-    }
-
-    .top-shell .subtitle {
-        color: #506172;
-        font-size: 14px;
-        margin: 0;
-    }
-
-    .user-pill {
-        display: inline-flex;
-        align-items: center;
-        gap: 8px;
-        border: 1px solid #d4e1ee;
-        border-radius: 999px;
-        background: #f4f8fc;
-        color: #2f455a;
-        padding: 6px 10px;
-        font-size: 12px;
-        font-weight: 600;
-    }
-
-    .user-avatar {
-        width: 24px;
-        height: 24px;
-        border-radius: 50%;
-        background: linear-gradient(140deg, #1f8fff, #50e3c2);
-        color: #082b46;
-        font-weight: 800;
-        display: inline-flex;
-        align-items: center;
-        justify-content: center;
-    }
-
-    /* 1. Header Sezioni */
-    .section-header {
-        font-size: 15px; font-weight: 800; color: #213142; margin-top: 0; margin-bottom: 10px;
-        text-transform: none; letter-spacing: .2px; font-family: sans-serif;
-    }
-    
-    /* 2. Messaggi Validazione */
-    .msg-error { color: var(--danger); font-size: 13px; margin-top: -5px; margin-bottom: 5px; display: flex; align-items: center; gap: 5px; }
-    .msg-warning { color: var(--warn); font-size: 13px; margin-top: -5px; margin-bottom: 5px; display: flex; align-items: center; gap: 5px; }
-    .msg-success { color: var(--ok); font-size: 13px; margin-top: -5px; margin-bottom: 5px; display: flex; align-items: center; gap: 5px; font-weight: 500; }
-    
-    /* 3. Output Box Builder */
-    .output-box-ready { background-color: #e8f0fe; color: #174ea6; padding: 15px; border-radius: 8px; border: 1px solid #d2e3fc; }
-    .output-box-success { background-color: #e6f4ea; color: #137333; padding: 15px; border-radius: 8px; border: 1px solid #ceead6; }
-
-    .hero {
-        background:
-            radial-gradient(700px 260px at 10% 0%, rgba(120, 212, 255, 0.20), transparent 60%),
-            radial-gradient(700px 260px at 90% 0%, rgba(123, 154, 255, 0.16), transparent 60%),
-            linear-gradient(180deg, #f8fbff 0%, #f2f7ff 100%);
-        border: 1px solid #d8e6fb;
-        border-radius: 18px;
-        padding: 34px 30px 26px 30px;
-        box-shadow: 0 8px 22px rgba(37, 58, 89, 0.08);
-        margin: 10px 0 14px 0;
-        text-align: center;
-    }
-
-    .hero-title {
-        font-size: 48px;
-        line-height: 1.05;
-        font-weight: 800;
-        color: #10243a;
-        margin-bottom: 10px;
-    }
-
-    .hero-sub {
-        font-size: 20px;
-        color: #1f3a58;
-        font-weight: 600;
-        margin-bottom: 12px;
-        text-transform: none;
-    }
-
-    .hero-desc {
-        max-width: 960px;
-        margin: 0 auto 18px auto;
-        font-size: 15px;
-        color: #42566f;
-        line-height: 1.55;
-    }
-
-    .chip-row {
-        display: flex;
-        justify-content: center;
-        flex-wrap: wrap;
-        gap: 8px;
-        margin-bottom: 8px;
-    }
-
-    .chip {
-        display: inline-flex;
-        align-items: center;
-        padding: 6px 10px;
-        border-radius: 999px;
-        font-size: 12px;
-        font-weight: 600;
-        border: 1px solid #cfe0f6;
-        color: #215b8f;
-        background: #f2f7ff;
-    }
-
-    .feature-grid {
-        display: grid;
-        grid-template-columns: repeat(4, minmax(0, 1fr));
-        gap: 12px;
-        margin: 0 0 12px 0;
-    }
-
-    .feature-card {
-        background: linear-gradient(180deg, #ffffff 0%, #f8fbff 100%);
-        border: 1px solid #cddff6;
-        border-radius: 14px;
-        padding: 14px;
-        box-shadow: 0 6px 16px rgba(30, 59, 96, 0.06);
-    }
-
-    .feature-title {
-        font-size: 15px;
-        font-weight: 700;
-        color: #173452;
-        margin-bottom: 4px;
-    }
-
-    .feature-copy {
-        font-size: 13px;
-        color: #4e647d;
-        line-height: 1.45;
-    }
-
-    .step-label {
-        display: inline-block;
-        font-size: 11px;
-        letter-spacing: .5px;
-        font-weight: 700;
-        color: #27537e;
-        background: #eaf3ff;
-        border: 1px solid #cadef7;
-        border-radius: 8px;
-        padding: 4px 8px;
-        margin: 2px 0 8px 0;
-        text-transform: uppercase;
-    }
-
-    .form-card {
-        background: linear-gradient(180deg, #ffffff 0%, #fbfdff 100%);
-        border: 1px solid #c9dcef;
-        border-radius: 12px;
-        padding: 14px;
-        margin-bottom: 14px;
-        box-shadow: 0 8px 20px rgba(15, 35, 56, 0.06);
-    }
-
-    .sticky-panel {
-        position: sticky;
-        top: 80px;
-    }
-
-    .output-card {
-        background: var(--surface);
-        border: 1px solid var(--line);
-        border-radius: 12px;
-        padding: 14px;
-        box-shadow: 0 2px 8px rgba(20, 36, 52, 0.04);
-    }
-
-    .param-chip-row {
-        display: flex;
-        flex-wrap: wrap;
-        gap: 8px;
-        margin: 10px 0 0 0;
-    }
-
-    .param-chip {
-        display: inline-flex;
-        align-items: center;
-        padding: 5px 8px;
-        border-radius: 8px;
-        font-size: 12px;
-        font-weight: 600;
-        border: 1px solid transparent;
-    }
-
-    .param-chip.source { background: #e7f5ef; border-color: #cdebdc; color: #1b6b45; }
-    .param-chip.medium { background: #ebefff; border-color: #d5defd; color: #3a4ea8; }
-    .param-chip.campaign { background: #fff3e7; border-color: #ffe2c2; color: #8a4f11; }
-    .param-chip.content { background: #f0f3f6; border-color: #dfe6ee; color: #465465; }
-
-    .tilda-panel {
-        background:
-            linear-gradient(180deg, #ffffff 0%, var(--surface-soft) 100%);
-        border: 1px solid #c9dcef;
-        border-radius: 14px;
-        padding: 20px;
-        margin-top: 8px;
-        box-shadow: 0 10px 24px rgba(18, 43, 70, 0.06);
-    }
-
-    .tilda-title {
-        font-size: 38px;
-        font-weight: 700;
-        color: #10263f;
-        margin-bottom: 2px;
-        letter-spacing: .2px;
-    }
-
-    .tilda-sub {
-        font-size: 14px;
-        color: #3f5b75;
-        margin-bottom: 14px;
-    }
-
-    .tilda-section {
-        font-size: 22px;
-        font-weight: 600;
-        color: #173756;
-        margin: 14px 0 8px 0;
-    }
-
-    .tilda-note {
-        font-size: 13px;
-        color: #4a627a;
-        margin: 4px 0 10px 0;
-    }
-    
-    /* 4. STILE UTM CHECKER (Riproduzione Screenshot) */
-    .utm-check-card {
-        background-color: white;
-        border: 1px solid #e0e0e0;
-        border-radius: 5px;
-        box-shadow: 0 1px 2px rgba(0,0,0,0.05);
-        margin-top: 15px;
-        overflow: hidden; /* Importante per i bordi */
-    }
-    
-    .utm-row {
-        display: flex;
-        align-items: center;
-        border-bottom: 1px solid #e9ecef;
-        padding: 12px 15px;
-    }
-    
-    .utm-row:last-child {
-        border-bottom: none;
-    }
-    
-    /* Colonna Etichetta (Tag) */
-    .utm-label-col {
-        width: 160px;
-        flex-shrink: 0;
-    }
-    
-    .utm-tag {
-        display: inline-block;
-        padding: 6px 12px;
-        border-radius: 4px;
-        color: white;
-        font-weight: 600;
-        font-size: 13px;
-        text-align: center;
-        min-width: 110px;
-    }
-    
-    .tag-blue { background-color: #0077c8; } 
-    .tag-gray { background-color: #6c757d; } 
-    
-    /* Colonna Valore */
-    .utm-value-col {
-        flex-grow: 1;
-        font-size: 15px;
-        color: #333;
-        display: flex;
-        align-items: center;
-        gap: 10px;
-        font-family: -apple-system, BlinkMacSystemFont, "Segoe UI", Roboto, Helvetica, Arial, sans-serif;
-    }
-    
-    .check-icon { color: #28a745; font-weight: bold; font-size: 18px; }
-    .error-icon { color: #dc3545; font-weight: bold; font-size: 18px; }
-    .error-text { color: #dc3545; font-weight: 500; font-size: 14px; font-style: italic; }
-
-    .status-badge {
-        display: inline-flex;
-        align-items: center;
-        justify-content: center;
-        border-radius: 999px;
-        padding: 4px 10px;
-        font-size: 11px;
-        font-weight: 700;
-        border: 1px solid transparent;
-    }
-
-    .badge-ok { background: #e7f5ec; color: #1a7a43; border-color: #cdebd9; }
-    .badge-warn { background: #fff2e6; color: #9f5b00; border-color: #ffddb8; }
-    .badge-bad { background: #fdeced; color: #a32828; border-color: #f6c9cc; }
-    .badge-opt { background: #eff3f7; color: #4f6071; border-color: #dbe3eb; }
-
-    .checks-grid {
-        display: grid;
-        grid-template-columns: repeat(3, minmax(0, 1fr));
-        gap: 10px;
-        margin-top: 8px;
-    }
-
-    .checks-item {
-        border: 1px solid var(--line);
-        border-radius: 10px;
-        background: #fff;
-        padding: 10px;
-    }
-
-    .checks-label {
-        font-size: 12px;
-        color: #4e5d6c;
-        margin-bottom: 6px;
-        font-weight: 600;
-    }
-
-    .utm-compact-grid {
-        display: grid;
-        grid-template-columns: repeat(2, minmax(0, 1fr));
-        gap: 10px;
-        margin-top: 8px;
-    }
-
-    .utm-param-item {
-        border: 1px solid var(--line);
-        border-radius: 10px;
-        padding: 10px;
-        background: #fff;
-    }
-
-    .utm-param-title {
-        font-size: 12px;
-        font-weight: 700;
-        color: #2f3f4f;
-        margin-bottom: 6px;
-    }
-
-    .utm-param-value {
-        font-size: 13px;
-        color: #1f2933;
-        word-break: break-word;
-        margin-top: 6px;
-    }
-
-    /* 5. STILE CHAT GEMINI (Riproduzione) */
-    .gemini-container {
-        max-width: 800px;
-        margin: 0 auto;
-        padding: 20px;
-    }
-    
-    .gemini-msg {
-        margin-bottom: 24px;
-        font-family: 'Google Sans', Roboto, Arial, sans-serif;
-        font-size: 16px;
-        line-height: 1.5;
-        color: #1f1f1f;
-    }
-    
-    .gemini-msg-user {
-        display: flex;
-        flex-direction: column;
-        align-items: flex-end;
-    }
-    
-    .gemini-msg-user .bubble {
-        background-color: #f0f4f9;
-        padding: 12px 20px;
-        border-radius: 18px;
-        max-width: 85%;
-        word-wrap: break-word;
-    }
-    
-    .gemini-msg-assistant {
-        display: flex;
-        gap: 16px;
-        align-items: flex-start;
-    }
-    
-    .gemini-msg-assistant .avatar {
-        width: 30px;
-        height: 30px;
-        background: linear-gradient(135deg, #4285f4, #9b72cb, #d96570);
-        border-radius: 50%;
-        flex-shrink: 0;
-        margin-top: 4px;
-    }
-    
-    .gemini-msg-assistant .content {
-        flex-grow: 1;
-        padding-top: 2px;
-    }
-
-    /* Override Streamlit Chat Input to look more like Gemini */
-    .stChatInputContainer {
-        border-radius: 28px !important;
-        border: 1px solid #757575 !important;
-        background-color: white !important;
-        max-width: 800px !important;
-        margin: 0 auto !important;
-    }
-
-    div[data-testid="stWidgetLabel"] p {
-        color: #243342 !important;
-        font-weight: 620 !important;
-        font-size: 0.94rem !important;
-    }
-
-    div[data-testid="stTabs"] [data-baseweb="tab-list"],
-    div[data-testid="stTabs"] [role="tablist"] {
-        display: flex !important;
-        justify-content: center !important;
-        align-items: center !important;
-        gap: 10px;
-        background: linear-gradient(180deg, #eef5ff 0%, #e8f1fe 100%) !important;
-        border: 1px solid #c8d9ee !important;
-        border-radius: 999px;
-        padding: 6px 8px;
-        width: fit-content;
-        margin: 8px auto 12px auto;
-    }
-
-    div[data-testid="stTabs"] > div,
-    div[data-testid="stTabs"] > div > div,
-    div[data-testid="stTabs"] [data-baseweb="tab-border"] {
-        background: transparent !important;
-        border: none !important;
-        box-shadow: none !important;
-        padding: 0 !important;
-    }
-    div[data-testid="stTabs"] [data-baseweb="tab-highlight"] {
-        display: none !important;
-    }
-    div[data-testid="stTabs"] [role="tabpanel"] {
-        background: transparent !important;
-        border: none !important;
-        box-shadow: none !important;
-        padding-top: 0 !important;
-    }
-
-    div[data-testid="stTabs"] [data-baseweb="tab"],
-    div[data-testid="stTabs"] [role="tab"] {
-        border-radius: 999px;
-        padding: 9px 18px;
-        font-weight: 700;
-        color: #27425d;
-        border: 1px solid transparent;
-        background: transparent;
-        transition: all .2s ease;
-    }
-
-    div[data-testid="stTabs"] [aria-selected="true"] {
-        background: linear-gradient(120deg, var(--brand), var(--brand-strong));
-        color: #fff !important;
-        border-color: #0b63c7;
-        box-shadow: 0 6px 14px rgba(11, 116, 229, 0.3);
-    }
-
-    div[data-testid="stTabs"] [data-baseweb="tab"]:hover,
-    div[data-testid="stTabs"] [role="tab"]:hover {
-        background: #f6faff;
-        border-color: #c8d9ee;
-    }
-
-    .stButton > button {
-        border-radius: 10px;
-        border: 1px solid #bcd2ea;
-        background: #f6fbff;
-        color: #1d3955;
-        font-weight: 600;
-    }
-
-    .stButton > button[kind="primary"] {
-        background: linear-gradient(120deg, var(--brand), var(--brand-strong));
-        border: none;
-        color: #fff;
-        font-weight: 700;
-    }
-
-    /* Allinea altezza e migliora leggibilità dei campi */
-    div[data-testid="stTextInput"] input,
-    div[data-baseweb="select"] > div,
-    div[data-testid="stDateInput"] input {
-        min-height: 42px !important;
-        border-radius: 10px !important;
-        border: 1px solid #b9d2ea !important;
-        background: #ffffff !important;
-        color: #12283f !important;
-        box-shadow: inset 0 1px 0 rgba(255,255,255,.6) !important;
-    }
-
-    div[data-testid="stTextInput"] input::placeholder {
-        color: #7d95ab !important;
-    }
-
-    div[data-baseweb="select"] > div {
-        background: #ffffff !important;
-    }
-
-    div[data-testid="stTextInput"] input:focus,
-    div[data-baseweb="select"] > div:focus-within,
-    div[data-testid="stDateInput"] input:focus {
-        border-color: var(--brand) !important;
-        box-shadow: 0 0 0 3px rgba(11, 116, 229, 0.16) !important;
-    }
-
-    /* Campi disabilitati (es. label utm_*) volutamente differenziati */
-    div[data-testid="stTextInput"] input:disabled {
-        background: linear-gradient(180deg, #dce9f9 0%, #cfdef2 100%) !important;
-        border: 1px solid #a9c2de !important;
-        color: #2f4d69 !important;
-        font-weight: 600 !important;
-    }
-
-    div[data-testid="stTextInput"] label,
-    div[data-testid="stSelectbox"] label,
-    div[data-testid="stDateInput"] label {
-        color: #23415e !important;
-        font-weight: 620 !important;
-    }
-
-    @media (max-width: 900px) {
-        .feature-grid {
-            grid-template-columns: repeat(2, minmax(0, 1fr));
-        }
-
-        .checks-grid,
-        .utm-compact-grid {
-            grid-template-columns: 1fr;
-        }
-
-        .sticky-panel {
-            position: static;
-        }
-
-        .hero-title {
-            font-size: 34px;
-        }
-
-        .hero-sub {
-            font-size: 18px;
-        }
-    }
-
-    @media (max-width: 640px) {
-        .feature-grid {
-            grid-template-columns: 1fr;
-        }
-    }
-
-</style>
-""", unsafe_allow_html=True)
+# Foglio di stile statico in static/app.css: a ogni rerun viaggia solo il tag <link>
+st.markdown(stylesheet_tags("app.css"), unsafe_allow_html=True)
 
 # --- GOOGLE AUTH FUNCTIONS ---
 SCOPES = [
@@ -697,31 +97,59 @@ def get_oauth_flow():
     flow.redirect_uri = redirect_uri
     return flow
 
+def set_session_credentials(manager):
+    """Rende `manager` la fonte unica delle credenziali della sessione (refresh anticipato in background)."""
+    import credential_manager
+
+    previous = st.session_state.get("credential_manager")
+    if previous is not None and previous is not manager:
+        credential_manager.unregister(previous)
+    credential_manager.register(manager)
+    st.session_state.credential_manager = manager
+    st.session_state.credentials = manager.credentials
+    # Salva credenziali scalari compatibili con JSON in session_state, NO file
+    st.session_state.google_credentials = manager.to_info()
+
+def clear_session_credentials():
+    """Logout: ferma il refresh e rilascia i client GA4 della sessione."""
+    import credential_manager
+
+    credential_manager.unregister(st.session_state.pop("credential_manager", None))
+    for key in ("credentials", "google_credentials"):
+        if key in st.session_state:
+            del st.session_state[key]
+
+def get_session_credentials():
+    """
+    Credentials della sessione: sempre lo stesso oggetto, rinnovato in background da
+    credential_manager. Blocca sul token endpoint solo se il token è già scaduto.
+    """
+    import credential_manager
+
+    manager = st.session_state.get("credential_manager")
+    if manager is None:
+        info = st.session_state.get("google_credentials")
+        if not info:
+            return None
+        manager = credential_manager.CredentialManager.from_info(info)
+        set_session_credentials(manager)
+    token = manager.credentials.token
+    if not manager.ensure_valid():
+        clear_session_credentials()
+        return None
+    if manager.credentials.token != token:
+        st.session_state.google_credentials = manager.to_info()
+    return manager.credentials
+
 def do_oauth_flow():
     """Gestisce il flow di autenticazione Google OAuth 2.0 Web"""
-    
+    import credential_manager
+
     # Controlla se le credenziali sono già in sessione
-    if 'google_credentials' in st.session_state and st.session_state.google_credentials:
-        creds = Credentials(
-            token=st.session_state.google_credentials['token'],
-            refresh_token=st.session_state.google_credentials.get('refresh_token'),
-            token_uri=st.session_state.google_credentials.get('token_uri'),
-            client_id=st.session_state.google_credentials.get('client_id'),
-            client_secret=st.session_state.google_credentials.get('client_secret'),
-            scopes=st.session_state.google_credentials.get('scopes')
-        )
-        
-        if creds.valid:
-            return creds
-        if creds.expired and creds.refresh_token:
-            try:
-                creds.refresh(Request())
-                # Aggiorna sessione
-                st.session_state.google_credentials['token'] = creds.token
-                return creds
-            except Exception:
-                st.session_state.google_credentials = None
-                
+    creds = get_session_credentials()
+    if creds:
+        return creds
+
     # Verifica se stiamo tornando da un redirect di login
     query_params = st.query_params
     if 'code' in query_params:
@@ -733,20 +161,9 @@ def do_oauth_flow():
             # Recupera il token
             code = query_params['code']
             flow.fetch_token(code=code)
-            creds = flow.credentials
-            
-            # Salva credenziali scalari compatibili con JSON in session_state, NO file
-            st.session_state.google_credentials = {
-                'token': creds.token,
-                'refresh_token': creds.refresh_token,
-                'token_uri': creds.token_uri,
-                'client_id': creds.client_id,
-                'client_secret': creds.client_secret,
-                'scopes': creds.scopes
-            }
+            set_session_credentials(credential_manager.CredentialManager(flow.credentials))
             
             # Ripulisci l'URL (rimuovi ?code=...) così se refresha la pagina non va in crash
-            import urllib.parse
             if hasattr(st, "query_params"):
                 st.query_params.clear()
             else:
@@ -759,19 +176,28 @@ def do_oauth_flow():
     # Se arriva qui, serve fare il login
     return None
 
-def get_ga4_accounts_structure(creds):
-    """Recupera la struttura Account -> Properties usando ga4_mcp_tools"""
+def get_ga4_accounts_structure(creds, force_refresh=False):
+    """Recupera la struttura Account -> Properties usando ga4_mcp_tools (cache per utente)"""
+    import ga4_mcp_tools
+
     try:
         # Usa la funzione centralizzata che ritorna già la gerarchia
-        return ga4_mcp_tools.get_account_summaries(creds)
+        result = ga4_mcp_tools.get_account_summaries(creds, force_refresh=force_refresh)
+        if isinstance(result, dict) and "error" in result:
+            st.error(f"Errore nel recupero property: {result['error']}")
+            return []
+        return result
     except Exception as e:
         st.error(f"Errore nel recupero property: {e}")
         return []
 
 def get_top_traffic_sources(property_id, creds):
-    """Recupera le sorgenti di traffico principali degli ultimi 30 giorni"""
+    """Recupera le sorgenti di traffico principali degli ultimi 30 giorni (None se GA4 è temporaneamente non disponibile)"""
+    from google.analytics.data_v1beta.types import DateRange, Dimension, Metric, RunReportRequest
+    import ga4_mcp_tools
+    import ga4_scheduler
+
     try:
-        client = BetaAnalyticsDataClient(credentials=creds)
         request = RunReportRequest(
             property=property_id,
             date_ranges=[DateRange(start_date="30daysAgo", end_date="today")],
@@ -779,20 +205,27 @@ def get_top_traffic_sources(property_id, creds):
             metrics=[Metric(name="sessions")],
             limit=50
         )
-        response = client.run_report(request)
+        response = ga4_mcp_tools.run_report_request(request, creds)
         
         sources = []
         for row in response.rows:
             sources.append(row.dimension_values[0].value)
         return sources
+    except ga4_scheduler.GA4TransientError as e:
+        # Quota/servizio temporaneamente non disponibile: non è "nessun dato", riproviamo al prossimo rerun
+        st.warning(f"GA4 temporaneamente non disponibile, sorgenti non caricati: {e}")
+        return None
     except Exception as e:
         st.warning(f"Impossibile recuperare sorgenti da GA4: {e}")
         return []
 
 def get_top_traffic_mediums(property_id, creds):
-    """Recupera i medium principali degli ultimi 30 giorni"""
+    """Recupera i medium principali degli ultimi 30 giorni (None se GA4 è temporaneamente non disponibile)"""
+    from google.analytics.data_v1beta.types import DateRange, Dimension, Metric, RunReportRequest
+    import ga4_mcp_tools
+    import ga4_scheduler
+
     try:
-        client = BetaAnalyticsDataClient(credentials=creds)
         request = RunReportRequest(
             property=property_id,
             date_ranges=[DateRange(start_date="30daysAgo", end_date="today")],
@@ -800,19 +233,26 @@ def get_top_traffic_mediums(property_id, creds):
             metrics=[Metric(name="sessions")],
             limit=50
         )
-        response = client.run_report(request)
+        response = ga4_mcp_tools.run_report_request(request, creds)
         mediums = []
         for row in response.rows:
             mediums.append(row.dimension_values[0].value)
         return mediums
+    except ga4_scheduler.GA4TransientError as e:
+        # Quota/servizio temporaneamente non disponibile: non è "nessun dato", riproviamo al prossimo rerun
+        st.warning(f"GA4 temporaneamente non disponibile, medium non caricati: {e}")
+        return None
     except Exception as e:
         st.warning(f"Impossibile recuperare medium da GA4: {e}")
         return []
 
 def get_source_medium_pairs(property_id, creds):
-    """Recupera coppie source-medium principali degli ultimi 30 giorni."""
+    """Recupera coppie source-medium principali degli ultimi 30 giorni (None se GA4 è temporaneamente non disponibile)."""
+    from google.analytics.data_v1beta.types import DateRange, Dimension, Metric, RunReportRequest
+    import ga4_mcp_tools
+    import ga4_scheduler
+
     try:
-        client = BetaAnalyticsDataClient(credentials=creds)
         request = RunReportRequest(
             property=property_id,
             date_ranges=[DateRange(start_date="30daysAgo", end_date="today")],
@@ -820,196 +260,152 @@ def get_source_medium_pairs(property_id, creds):
             metrics=[Metric(name="sessions")],
             limit=200
         )
-        response = client.run_report(request)
+        response = ga4_mcp_tools.run_report_request(request, creds)
         pairs = []
         for row in response.rows:
             src = row.dimension_values[0].value
             med = row.dimension_values[1].value
             pairs.append((src, med))
         return pairs
+    except ga4_scheduler.GA4TransientError as e:
+        # Quota/servizio temporaneamente non disponibile: non è "nessun dato", riproviamo al prossimo rerun
+        st.warning(f"GA4 temporaneamente non disponibile, coppie source-medium non caricati: {e}")
+        return None
     except Exception as e:
         st.warning(f"Impossibile recuperare coppie source-medium da GA4: {e}")
         return []
 
-# --- DATI GUIDA (Fallback e Mapping) ---
-GUIDE_TABLE_DATA = [
-    {"Traffic type": "Organic", "utm_medium": "organic", "utm_source": "google, bing, yahoo"},
-    {"Traffic type": "Referral", "utm_medium": "referral", "utm_source": "(domain)"},
-    {"Traffic type": "Direct", "utm_medium": "(none)", "utm_source": "(direct)"},
-    {"Traffic type": "Paid Search", "utm_medium": "cpc", "utm_source": "google, bing"},
-    {"Traffic type": "Affiliate", "utm_medium": "affiliate", "utm_source": "tradetracker, awin"},
-    {"Traffic type": "Display", "utm_medium": "cpm", "utm_source": "reservation, display, dv360, google"},
-    {"Traffic type": "Video", "utm_medium": "cpv", "utm_source": "youtube, vimeo, google"},
-    {"Traffic type": "Programmatic", "utm_medium": "cpm", "utm_source": "rcs, mediamond, rai, manzoni"},
-    {"Traffic type": "Email", "utm_medium": "email|mailing_campaign", "utm_source": "newsletter, email, crm, sfmc, mailchimp"},
-    {"Traffic type": "Organic Social", "utm_medium": "social_org", "utm_source": "facebook, instagram, tiktok, linkedin, pinterest"},
-    {"Traffic type": "Paid Social", "utm_medium": "social_paid", "utm_source": "facebook, instagram, tiktok, linkedin, pinterest"},
-    {"Traffic type": "App traffic", "utm_medium": "-", "utm_source": "app"},
-    {"Traffic type": "SMS", "utm_medium": "offline", "utm_source": "sms"},
-    {"Traffic type": "Altro", "utm_medium": "other", "utm_source": ""},
-]
+def get_value_indexes(property_id, creds, user_email=""):
+    """Indici fuzzy di source e medium: dalla property se selezionata, altrimenti dallo storico dell'utente e dalla tabella guida."""
+    import utm_vocabulary
+    import ga4_scheduler
 
-# --- UTILS ---
-def get_source_options():
-    sources = set()
-    for row in GUIDE_TABLE_DATA:
-        parts = row["utm_source"].split(",")
-        for p in parts:
-            clean = p.strip().replace("...", "")
-            if clean and "(" not in clean and "[" not in clean:
-                sources.add(clean)
-    return [""] + sorted(list(sources)) + ["Altro (Inserisci manuale)"]
+    if property_id:
+        try:
+            with st.spinner("Indicizzazione source e medium della property..."):
+                return utm_vocabulary.get_property_index(property_id, creds)
+        except ga4_scheduler.GA4TransientError as e:
+            st.warning(f"GA4 temporaneamente non disponibile, suggerimenti basati sullo storico: {e}")
+        except Exception as e:
+            st.warning(f"Impossibile indicizzare source e medium da GA4: {e}")
+    return {
+        "source": utm_vocabulary.get_offline_index("source", property_id, user_email=user_email),
+        "medium": utm_vocabulary.get_offline_index("medium", property_id, user_email=user_email),
+    }
+
+def render_value_hint(label, value, index):
+    """Avvisa se un valore scritto a mano non compare tra quelli noti ma ne somiglia a uno."""
+    if not value or index is None:
+        return
+    result = index.check(value)
+    if result["known"] or not result["suggestions"]:
+        return
+    best = result["suggestions"][0]
+    others = ", ".join(html_lib.escape(s["value"]) for s in result["suggestions"][1:3])
+    sessions = f" ({best['sessions']:,} sessioni)" if best["sessions"] else ""
+    st.markdown(
+        f'<div class="msg-warning">⚠️ {label} \'{html_lib.escape(result["value"])}\' non compare tra i valori noti: '
+        f'forse intendevi <b>{html_lib.escape(best["value"])}</b>{sessions}'
+        f'{f" (altri: {others})" if others else ""}</div>',
+        unsafe_allow_html=True
+    )
 
-SOURCE_OPTIONS = get_source_options()
+def run_fragmentation_audit(property_id, creds):
+    """Audit della frammentazione source/medium/campaign (None se GA4 non risponde)."""
+    import utm_fragmentation
+    import ga4_scheduler
 
-def get_compatible_channels(selected_source, all_client_channels):
-    if not selected_source or selected_source == "Altro (Inserisci manuale)":
-        return [""] + all_client_channels
-    norm_source = selected_source.strip().lower()
-    compatible_types = set()
-    for row in GUIDE_TABLE_DATA:
-        row_sources = [s.strip().lower() for s in row["utm_source"].split(",")]
-        if norm_source in row_sources:
-            compatible_types.add(row["Traffic type"])
-    if not compatible_types:
-        return [""] + all_client_channels
-    filtered_channels = [c for c in all_client_channels if c in compatible_types]
-    return [""] + sorted(filtered_channels) if filtered_channels else [""] + all_client_channels
-
-def normalize_token(text):
-    if not text: return ""
-    return slugify(text, separator="-", lowercase=True)
-
-def normalize_medium_token(text):
-    """Normalizza utm_medium preservando underscore GA4 (es. social_paid)."""
-    if not text:
-        return ""
-    value = str(text).strip().lower()
-    value = value.replace("-", "_")
-    value = re.sub(r"\s+", "_", value)
-    value = re.sub(r"[^a-z0-9_-]", "", value)
-    value = re.sub(r"_+", "_", value).strip("_")
-    return value
-
-def suggest_naming_value(text, prefer_hyphen=True):
-    """Produce a best-practice suggestion for campaign naming values."""
-    if not text:
-        return ""
-    value = str(text).strip().lower()
-    value = re.sub(r"\s+", "-", value)
-    value = re.sub(r"[^a-z0-9_-]", "", value)
-    if prefer_hyphen:
-        value = value.replace("_", "-")
-    value = re.sub(r"-{2,}", "-", value)
-    value = re.sub(r"_{2,}", "_", value)
-    return value.strip("-_")
-
-def validate_naming_rules(text, prefer_hyphen=True):
-    """Return (issues, suggestion) for naming best-practices validation."""
-    issues = []
-    if not text:
-        return issues, ""
-    raw = str(text).strip()
-    suggestion = suggest_naming_value(raw, prefer_hyphen=prefer_hyphen)
-
-    if raw != raw.lower():
-        issues.append("usa solo minuscole")
-    if re.search(r"\s", raw):
-        issues.append("evita spazi")
-    if re.search(r"[^A-Za-z0-9_-]", raw):
-        issues.append("evita caratteri speciali")
-    if prefer_hyphen and "_" in raw:
-        issues.append("preferisci trattini (-) agli underscore (_)")
-    if len(raw) > 50:
-        issues.append("mantieni il nome descrittivo ma conciso")
-    return issues, suggestion
-
-def filter_options_by_source_mode(options, mode, field):
-    """Filter source/medium options according to selected traffic source mode."""
-    if field == "medium":
-        tokens = [normalize_medium_token(o) for o in options if normalize_medium_token(o)]
-    else:
-        tokens = [normalize_token(o) for o in options if normalize_token(o)]
-    if mode == "Custom values":
-        return sorted(set(tokens))
-
-    if field == "source":
-        source_map = {
-            "Google Ads": ["google", "adwords", "googleads", "bing"],
-            "Social": ["facebook", "instagram", "tiktok", "linkedin", "pinterest", "social", "meta", "twitter", "x"],
-            "Email": ["email", "newsletter", "crm", "mailchimp", "sfmc"],
-        }
-        hints = source_map.get(mode, [])
-    else:
-        medium_map = {
-            "Google Ads": ["cpc", "ppc", "paid-search", "paid_search", "sem"],
-            "Social": ["social", "social_paid", "social_org", "paid-social", "organic-social", "organic_social", "paid_social"],
-            "Email": ["email", "mailing_campaign", "newsletter", "mail"],
-        }
-        hints = medium_map.get(mode, [])
-
-    filtered = [t for t in tokens if any(h in t for h in hints)]
-    return sorted(set(filtered))
-
-def is_valid_url(url):
-    regex = re.compile(r'^https?://(?:(?:[A-Z0-9](?:[A-Z0-9-]{0,61}[A-Z0-9])?\.)+[A-Z]{2,6}\.?|localhost|\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3})(?::\d+)?(?:/?|[/?]\S+)$', re.IGNORECASE)
-    return re.match(regex, url) is not None
-
-def load_utm_history():
-    if 'utm_history' not in st.session_state:
-        st.session_state.utm_history = []
-    return st.session_state.utm_history
-
-def save_utm_history(items):
-    st.session_state.utm_history = items
-
-def infer_expected_channel_group(utm_medium: str) -> str:
-    m = normalize_medium_token(utm_medium)
-    if m in ("social_paid", "paid_social", "paid-social"):
-        return "Paid Social"
-    if m in ("social_org", "organic_social", "organic-social"):
-        return "Organic Social"
-    if m in ("email", "mailing_campaign", "newsletter"):
-        return "Email"
-    if m in ("cpc", "ppc", "sem", "paid_search", "paid-search"):
-        return "Paid Search"
-    if m in ("cpm", "display"):
-        return "Display"
-    if m == "referral":
-        return "Referral"
-    if m == "organic":
-        return "Organic Search"
-    return "Other"
+    try:
+        with st.spinner("Lettura del vocabolario completo della property..."):
+            return utm_fragmentation.audit_property(property_id, creds)
+    except ga4_scheduler.GA4TransientError as e:
+        st.warning(f"GA4 temporaneamente non disponibile, audit non eseguito: {e}")
+    except Exception as e:
+        st.warning(f"Impossibile eseguire l'audit di frammentazione: {e}")
+    return None
 
-def upsert_utm_history_entry(entry: dict):
-    items = load_utm_history()
-    key_fields = ("user_email", "property_id", "final_url")
-    idx = next(
-        (i for i, x in enumerate(items) if all(x.get(k) == entry.get(k) for k in key_fields)),
-        None
+def render_fragmentation_audit(audit: dict):
+    """Gruppi di valori quasi duplicati per campo, dal più frammentato."""
+    import pandas as pd
+
+    st.caption(
+        f"{audit['combinations']:,} combinazioni source × medium × campaign negli ultimi {audit['days']} giorni "
+        f"({audit['combinations_after_cleanup']:,} dopo la normalizzazione) · "
+        f"GA4 {audit['fetch_seconds']} s, analisi {audit['cluster_seconds']} s"
     )
-    if idx is None:
-        items.append(entry)
-    else:
-        items[idx].update(entry)
-    save_utm_history(items)
+    if audit["truncated"]:
+        st.warning(f"Vocabolario troncato: la property ha {audit['row_count']:,} combinazioni.")
+    for field, summary in audit["fields"].items():
+        st.markdown(
+            f"**{field}**: {summary['distinct']:,} valori distinti, {summary['cluster_count']:,} gruppi frammentati, "
+            f"{summary['fragmented_sessions']:,} sessioni fuori dal valore più usato"
+        )
+        if summary["clusters"]:
+            st.dataframe(pd.DataFrame([
+                {
+                    "Valore canonico": c["canonical"],
+                    "Più usato": c["dominant"],
+                    "Sessioni": c["sessions"],
+                    "Frammentate": c["fragmented_sessions"],
+                    "Varianti": ", ".join(f"{v['value']} ({v['sessions']:,}, {v['reason']})" for v in c["values"]),
+                }
+                for c in summary["clusters"]
+            ]), use_container_width=True, hide_index=True)
 
-def parse_ddmmyyyy_to_date(date_str: str):
-    try:
-        return datetime.strptime(date_str, "%d/%m/%Y").date()
-    except Exception:
-        return None
+# --- UTILS ---
+SOURCE_OPTIONS = get_source_options()
 
-def _extract_live_date_from_utm_campaign(utm_campaign: str) -> str:
-    campaign = (utm_campaign or "").strip().lower()
-    for token in campaign.split("_"):
-        if re.fullmatch(r"\d{8}", token):
-            try:
-                dt = datetime.strptime(token, "%d%m%Y")
-                return dt.strftime("%d/%m/%Y")
-            except Exception:
-                continue
-    return datetime.today().strftime("%d/%m/%Y")
+# Lo storico è persistito su SQLite (utm_history_store), condiviso tra sessioni e con la CLI utm_bulk.py
+HISTORY_PAGE_SIZES = [25, 50, 100, 200]
+
+def load_utm_history_page(user_email, page=1, page_size=50, **filters):
+    """Una pagina dello storico dell'utente, filtrata e ordinata nel database."""
+    return utm_history_store.query_entries(
+        user_email, limit=page_size, offset=(page - 1) * page_size, **filters
+    )
+
+def upsert_utm_history_entry(entry: dict):
+    utm_history_store.upsert_entry(entry)
+    wake_launch_monitor([entry])
+
+def format_launch_hits(stats) -> str:
+    if not stats:
+        return "-"
+    if not stats["first_hit_at"]:
+        return "⏳ nessun hit"
+    label = f"{stats['first_hour_hits']} dalle {stats['first_hit_at'].strftime('%H:%M')}"
+    return label if stats["complete"] else f"{label} (in corso)"
+
+def wake_launch_monitor(entries):
+    """I link che vanno live oggi entrano subito nel monitor realtime del lancio."""
+    import launch_monitor
+
+    today = datetime.now().strftime("%d/%m/%Y")
+    if any(e.get("live_date") == today for e in entries):
+        launch_monitor.ensure_started().wake()
+
+def render_landing_result(result: dict):
+    """Esito della verifica landing page (landing_verifier) con la catena di redirect."""
+    import pandas as pd
+    from utm_tracking import STATUS_ICONS
+
+    status_icon = STATUS_ICONS.get(result["status"], "ℹ️")
+    st.markdown(
+        f"""
+        <div class="output-box-ready">
+            <b>{status_icon} Landing page: {result['status']}</b><br>
+            <small>{html_lib.escape(result['message'])}</small>
+        </div>
+        """,
+        unsafe_allow_html=True,
+    )
+    chain = [{"HTTP": hop["status"], "URL": hop["url"]} for hop in result["redirects"]]
+    chain.append({"HTTP": result["status_code"] or "-", "URL": result["final_url"]})
+    st.table(pd.DataFrame(chain))
+    st.caption(
+        f"Tag GA4 nella pagina: {', '.join(result['ga4_ids']) or '-'} · GTM: {', '.join(result['gtm_ids']) or '-'} · "
+        f"verificata alle {result['checked_at']} ({result['elapsed_ms']} ms)"
+    )
 
 def save_chatbot_url_to_history(final_url: str, property_id: str = "") -> bool:
     try:
@@ -1054,109 +450,33 @@ def save_chatbot_url_to_history(final_url: str, property_id: str = "") -> bool:
     except Exception:
         return False
 
-def build_property_name_lookup(accounts_structure):
-    lookup = {}
-    if not isinstance(accounts_structure, list):
-        return lookup
-    for acc in accounts_structure:
-        for p in acc.get("properties", []) or []:
-            pid_raw = str(p.get("property_id", "")).strip()
-            if not pid_raw:
-                continue
-            pid_num = pid_raw.replace("properties/", "")
-            name = p.get("display_name", "")
-            if name:
-                lookup[pid_raw] = name
-                lookup[pid_num] = name
-    return lookup
-
-def check_tracking_status_for_entry(entry: dict, creds, grace_days: int = 2):
-    property_id = entry.get("property_id")
-    if not property_id:
-        return {"status": "ERROR", "message": "Property non disponibile", "sessions": 0, "observed": "-"}
-    try:
-        client = BetaAnalyticsDataClient(credentials=creds)
-        ga4_prop = property_id if str(property_id).startswith("properties/") else f"properties/{property_id}"
-        report = client.run_report(
-            RunReportRequest(
-                property=ga4_prop,
-                date_ranges=[DateRange(start_date="30daysAgo", end_date="today")],
-                dimensions=[
-                    Dimension(name="sessionSource"),
-                    Dimension(name="sessionMedium"),
-                    Dimension(name="sessionCampaignName"),
-                    Dimension(name="sessionPrimaryChannelGroup"),
-                    Dimension(name="sessionDefaultChannelGroup"),
-                ],
-                metrics=[Metric(name="sessions")],
-                limit=1000,
-            )
-        )
-        src = normalize_token(entry.get("utm_source", ""))
-        med = normalize_medium_token(entry.get("utm_medium", ""))
-        cmpn = normalize_token(entry.get("utm_campaign", ""))
-
-        matched = []
-        for row in report.rows:
-            ds = normalize_token(row.dimension_values[0].value)
-            dm = normalize_medium_token(row.dimension_values[1].value)
-            dc = normalize_token(row.dimension_values[2].value)
-            sessions = int(float(row.metric_values[0].value or 0))
-            observed = row.dimension_values[3].value or row.dimension_values[4].value or "Unassigned"
-            if ds == src and dm == med and dc == cmpn:
-                matched.append((sessions, observed))
-
-        total_sessions = sum(x[0] for x in matched)
-        observed_channel = "-"
-        if matched:
-            by_channel = {}
-            for s, ch in matched:
-                by_channel[ch] = by_channel.get(ch, 0) + s
-            observed_channel = sorted(by_channel.items(), key=lambda x: x[1], reverse=True)[0][0]
-
-        expected = entry.get("expected_channel_group", "Other")
-        live_date = parse_ddmmyyyy_to_date(entry.get("live_date", ""))
-        today = datetime.today().date()
-        after_grace = bool(live_date and today > (live_date + timedelta(days=grace_days)))
-
-        if total_sessions == 0 and after_grace:
-            return {
-                "status": "ERROR",
-                "message": "Nessun traffico rilevato con questi UTM",
-                "sessions": 0,
-                "observed": observed_channel,
-            }
-        if total_sessions > 0 and observed_channel != expected:
-            return {
-                "status": "WARNING",
-                "message": f"Il traffico è finito in {observed_channel} invece di {expected}",
-                "sessions": total_sessions,
-                "observed": observed_channel,
-            }
-        if total_sessions > 0 and observed_channel == expected:
-            return {
-                "status": "OK",
-                "message": "Tracking e canalizzazione corretti",
-                "sessions": total_sessions,
-                "observed": observed_channel,
-            }
-        return {
-            "status": "PENDING",
-            "message": "Campagna recente: in attesa di traffico",
-            "sessions": total_sessions,
-            "observed": observed_channel,
-        }
-    except Exception as e:
-        return {"status": "ERROR", "message": f"Errore GA4: {e}", "sessions": 0, "observed": "-"}
-
-# --- SERVER-SIDE OAUTH CACHE ---
-# Necessario perché Streamlit distrugge st.session_state quando l'utente cambia tab o naviga via,
-# perdendo il PKCE code_verifier autogenerato da google-auth.
-@st.cache_resource
-def get_oauth_cache():
-    return {}
-
 # --- LOGIN PAGE ---
+def get_login_url():
+    """
+    URL di consenso Google per questa sessione. Il code_verifier PKCE va nello store
+    lato server (oauth_state_store) agganciato allo state, per recuperarlo al callback
+    anche in un nuovo tab o su un altro worker. Lo stesso URL vale per i rerun della
+    pagina di login finché lo state non sta per scadere, invece di generarne uno a ogni rerun.
+    """
+    import time
+    import oauth_state_store
+
+    pending = st.session_state.get("oauth_login")
+    if pending and pending["expires_at"] - time.time() > 60:
+        return pending["url"]
+
+    flow = get_oauth_flow()
+    if not flow:
+        return None
+    auth_url, state_token = flow.authorization_url(prompt='consent')
+    if getattr(flow, 'code_verifier', None):
+        oauth_state_store.save_pending_state(state_token, flow.code_verifier)
+    st.session_state.oauth_login = {
+        "url": auth_url,
+        "expires_at": time.time() + oauth_state_store.STATE_TTL_SECONDS,
+    }
+    return auth_url
+
 def show_login_page():
     st.container()
     c1, c2, c3 = st.columns([1, 2, 1])
@@ -1170,22 +490,30 @@ def show_login_page():
         st.write("")
         
         # Link OAuth generato web-side (Gestione sicura PKCE via Server Cache)
-        flow = get_oauth_flow()
-        if flow:
-            auth_url, state_token = flow.authorization_url(prompt='consent')
-            
-            # Salviamo il code_verifier nella cache persistente del server, non nella sessione del browser,
-            # agganciandolo all'ID univoco 'state' per recuperarlo quando l'utente torna (anche in un nuovo tab)
-            cache = get_oauth_cache()
-            if hasattr(flow, 'code_verifier'):
-                cache[state_token] = flow.code_verifier
-
+        auth_url = get_login_url()
+        if auth_url:
             st.link_button("🔐 Login con Google Analytics", auth_url, type="primary", use_container_width=True)
         else:
             st.error("Configurazione Google Auth mancante.")
 
 # --- DASHBOARD PAGE ---
 def show_dashboard():
+    import pandas as pd
+    import chat_metrics
+    import ga4_mcp_tools
+    import ga4_quota
+    import landing_verifier
+    import launch_monitor
+    import tracking_monitor
+    from chatbot_ui import render_chatbot_interface
+    from utm_tracking import (
+        RESULT_TTL_SECONDS,
+        STATUS_ICONS,
+        check_tracking_status_for_entry,
+        is_result_fresh,
+        iter_tracking_checks,
+    )
+
     # --- INITIALIZE USER EMAIL AND API KEY ---
     if "user_email" not in st.session_state:
         st.session_state.user_email = get_user_email(st.session_state.credentials)
@@ -1194,6 +522,18 @@ def show_dashboard():
         # Try to load saved API key for this user
         saved_key = get_persistent_api_key(st.session_state.user_email)
         st.session_state.gemini_api_key = saved_key
+
+    # --- MONITOR TRACKING IN BACKGROUND ---
+    # Il monitor verifica i link dello storico con le credenziali delle sessioni attive;
+    # il monitor di lancio segue in realtime i link che vanno live oggi
+    if st.session_state.user_email:
+        monitor = tracking_monitor.ensure_started()
+        launch = launch_monitor.ensure_started()
+        tracking_monitor.register_credentials(st.session_state.user_email, st.session_state.credentials)
+        if not st.session_state.get("tracking_monitor_registered"):
+            st.session_state.tracking_monitor_registered = True
+            monitor.wake()
+            launch.wake()
     
     # --- HEADER PRINCIPALE ---
     if "show_user_menu" not in st.session_state:
@@ -1212,14 +552,12 @@ def show_dashboard():
                 if st.button("Impostazioni", key="settings_btn_menu", use_container_width=True):
                     st.session_state.show_settings = True
                 if st.button("Logout", key="logout_btn", use_container_width=True):
-                    if "credentials" in st.session_state:
-                        del st.session_state.credentials
+                    clear_session_credentials()
                     if "user_email" in st.session_state:
+                        tracking_monitor.unregister_credentials(st.session_state.user_email)
                         del st.session_state.user_email
                     if "gemini_api_key" in st.session_state:
                         del st.session_state.gemini_api_key
-                    if "google_credentials" in st.session_state:
-                        del st.session_state.google_credentials
                     st.rerun()
         else:
             if st.button("Account ▾", key="user_menu_btn", use_container_width=True):
@@ -1229,14 +567,12 @@ def show_dashboard():
                     st.session_state.show_settings = not st.session_state.get("show_settings", False)
                     st.session_state.show_user_menu = False
                 if st.button("Logout", key="logout_btn_fallback", use_container_width=True):
-                    if "credentials" in st.session_state:
-                        del st.session_state.credentials
+                    clear_session_credentials()
                     if "user_email" in st.session_state:
+                        tracking_monitor.unregister_credentials(st.session_state.user_email)
                         del st.session_state.user_email
                     if "gemini_api_key" in st.session_state:
                         del st.session_state.gemini_api_key
-                    if "google_credentials" in st.session_state:
-                        del st.session_state.google_credentials
                     st.rerun()
 
     # --- SETTINGS MODAL ---
@@ -1286,7 +622,10 @@ def show_dashboard():
             st.markdown("### 🔌 Connessione GA4")
             if st.button("🔁 Test connessione GA4", key="test_ga4_btn"):
                 with st.spinner("Verifica connessione GA4..."):
-                    result = ga4_mcp_tools.get_account_summaries(st.session_state.credentials)
+                    result = ga4_mcp_tools.get_account_summaries(st.session_state.credentials, force_refresh=True)
+                if isinstance(result, list):
+                    # Il test rilegge l'elenco da GA4: aggiorna anche quello usato dal builder
+                    st.session_state.ga4_accounts = result
                 if isinstance(result, list) and len(result) > 0:
                     st.success(f"✅ Connessione GA4 OK! Trovati {len(result)} account.")
                 elif isinstance(result, list) and len(result) == 0:
@@ -1299,6 +638,38 @@ def show_dashboard():
                         st.warning("💡 Il token OAuth potrebbe avere scope insufficienti. Prova a fare **Logout** e ri-accedere con Google.")
                 else:
                     st.info(f"Risposta inattesa: {result}")
+
+            # --- Chatbot Diagnostics ---
+            st.markdown("---")
+            st.markdown("### 📊 Diagnostica chatbot")
+            turn_records = chat_metrics.get_turn_records(st.session_state.get("user_email"))
+            if not turn_records:
+                st.caption("Nessun turno registrato in questa istanza.")
+            else:
+                turns_df = pd.DataFrame(turn_records).drop(columns=["tools", "user_email"])
+                d1, d2, d3, d4 = st.columns(4)
+                d1.metric("Turni", len(turns_df))
+                d2.metric("Tempo medio", f"{turns_df['wall_ms'].mean() / 1000:.1f}s")
+                d3.metric("Quota tool", f"{turns_df['tool_ms'].sum() / max(turns_df['wall_ms'].sum(), 1):.0%}")
+                d4.metric("Token totali", int(turns_df["total_tokens"].sum()))
+                st.dataframe(turns_df.iloc[::-1], use_container_width=True, hide_index=True)
+                tool_rows = []
+                for r in turn_records:
+                    for tool_name, t in r["tools"].items():
+                        tool_rows.append({"tool": tool_name, "calls": t["calls"], "total_ms": t["total_ms"], "max_ms": t["max_ms"]})
+                if tool_rows:
+                    tools_df = pd.DataFrame(tool_rows).groupby("tool", as_index=False).agg(
+                        calls=("calls", "sum"), total_ms=("total_ms", "sum"), max_ms=("max_ms", "max")
+                    )
+                    tools_df["avg_ms"] = (tools_df["total_ms"] / tools_df["calls"]).round(1)
+                    st.dataframe(tools_df.sort_values("total_ms", ascending=False), use_container_width=True, hide_index=True)
+                st.download_button(
+                    "⬇️ Esporta CSV",
+                    data=chat_metrics.turn_records_to_csv(turn_records),
+                    file_name="chatbot_turns.csv",
+                    mime="text/csv",
+                    key="chat_metrics_csv_btn",
+                )
         st.markdown('</div>', unsafe_allow_html=True)
 
     st.markdown("""
@@ -1358,6 +729,11 @@ def show_dashboard():
             with st.spinner("Caricamento Account GA4..."):
                 st.session_state.ga4_accounts = get_ga4_accounts_structure(st.session_state.credentials)
         accounts_structure = st.session_state.ga4_accounts
+        with ga_col1:
+            if st.button("🔄 Aggiorna elenco account", key="refresh_ga4_accounts_btn", help="Rilegge account e property da GA4 ignorando la cache"):
+                with st.spinner("Aggiornamento Account GA4..."):
+                    st.session_state.ga4_accounts = get_ga4_accounts_structure(st.session_state.credentials, force_refresh=True)
+                st.rerun()
         if accounts_structure:
             account_names = [a["display_name"] for a in accounts_structure]
             with ga_col1:
@@ -1369,18 +745,26 @@ def show_dashboard():
                     selected_prop_name = st.selectbox("GA4 Property", list(prop_map.keys()))
                 if selected_prop_name:
                     sel_prop_id = prop_map[selected_prop_name]
+                    # I risultati None (GA4 temporaneamente non disponibile) non vengono memorizzati:
+                    # verranno richiesti di nuovo al prossimo rerun.
                     current_prop_key = f"sources_{sel_prop_id}"
                     if current_prop_key not in st.session_state:
                         with st.spinner("Lettura sorgenti reali dalla property..."):
-                            st.session_state[current_prop_key] = get_top_traffic_sources(sel_prop_id, st.session_state.credentials)
+                            loaded = get_top_traffic_sources(sel_prop_id, st.session_state.credentials)
+                        if loaded is not None:
+                            st.session_state[current_prop_key] = loaded
                     current_medium_key = f"mediums_{sel_prop_id}"
                     if current_medium_key not in st.session_state:
                         with st.spinner("Lettura medium reali dalla property..."):
-                            st.session_state[current_medium_key] = get_top_traffic_mediums(sel_prop_id, st.session_state.credentials)
+                            loaded = get_top_traffic_mediums(sel_prop_id, st.session_state.credentials)
+                        if loaded is not None:
+                            st.session_state[current_medium_key] = loaded
                     current_pairs_key = f"source_medium_pairs_{sel_prop_id}"
                     if current_pairs_key not in st.session_state:
                         with st.spinner("Lettura relazione source-medium dalla property..."):
-                            st.session_state[current_pairs_key] = get_source_medium_pairs(sel_prop_id, st.session_state.credentials)
+                            loaded = get_source_medium_pairs(sel_prop_id, st.session_state.credentials)
+                        if loaded is not None:
+                            st.session_state[current_pairs_key] = loaded
                     real_sources = st.session_state.get(current_prop_key, [])
                     real_mediums = st.session_state.get(current_medium_key, [])
                     pairs = st.session_state.get(current_pairs_key, [])
@@ -1398,6 +782,24 @@ def show_dashboard():
                     if real_mediums:
                         medium_preview = ", ".join(real_mediums[:6])
                         st.markdown(f'<div class="tilda-note">Medium recenti da GA4: {html_lib.escape(medium_preview)}</div>', unsafe_allow_html=True)
+                    quota_status = ga4_quota.get_quota_status(sel_prop_id)
+                    if quota_status and quota_status.get("daily_remaining") is not None:
+                        st.markdown(
+                            f'<div class="tilda-note">Quota GA4 residua: {quota_status["hourly_remaining"]:,} token/ora, '
+                            f'{quota_status["daily_remaining"]:,} token/giorno '
+                            f'(consumati da questo tool: {quota_status["hour_consumed"]:,} nell\'ora, {quota_status["day_consumed"]:,} oggi; '
+                            f'richieste nell\'ora, retry compresi: {quota_status["hour_attempts"]:,})</div>',
+                            unsafe_allow_html=True
+                        )
+                    with st.expander("🧩 Frammentazione di source, medium e campaign", expanded=False):
+                        st.caption("Raggruppa i valori quasi duplicati (maiuscole, separatori, abbreviazioni, refusi) osservati nella property e indica il valore canonico.")
+                        fragmentation_key = f"fragmentation_{sel_prop_id}"
+                        if st.button("Analizza la property", key="fragmentation_audit_btn"):
+                            audit = run_fragmentation_audit(sel_prop_id, st.session_state.credentials)
+                            if audit is not None:
+                                st.session_state[fragmentation_key] = audit
+                        if fragmentation_key in st.session_state:
+                            render_fragmentation_audit(st.session_state[fragmentation_key])
             else:
                 st.warning("Nessuna property disponibile nell'account selezionato.")
         else:
@@ -1495,6 +897,8 @@ def show_dashboard():
                         placeholder="google, facebook",
                         help="Su quale piattaforma o canale stai attivando questa campagna?"
                     )
+                    # Il vocabolario si carica solo quando c'è un valore scritto a mano da controllare
+                    render_value_hint("Source", utm_source, get_value_indexes(sel_prop_id, st.session_state.credentials, st.session_state.get("user_email", ""))["source"] if utm_source else None)
                 else:
                     utm_source = selected_source_value
                 source_issues, source_suggest = validate_naming_rules(utm_source, prefer_hyphen=True)
@@ -1546,6 +950,7 @@ def show_dashboard():
                         placeholder="cpc, email, banner, article",
                         help="Che tipo di campagna sarà? organic, social organico, social paid, email, ecc"
                     )
+                    render_value_hint("Medium", utm_medium, get_value_indexes(sel_prop_id, st.session_state.credentials, st.session_state.get("user_email", ""))["medium"] if utm_medium else None)
                 else:
                     utm_medium = selected_medium_value
                 medium_issues, medium_suggest = validate_naming_rules(utm_medium, prefer_hyphen=False)
@@ -1654,74 +1059,35 @@ def show_dashboard():
                         unsafe_allow_html=True
                     )
 
-        p_src = normalize_token(utm_source)
-        p_med = normalize_medium_token(utm_medium)
-        p_cmp_name = normalize_token(utm_campaign)
-        p_cmp_type = normalize_token(campaign_type)
-        p_cmp_lang = normalize_token(campaign_language)
-        p_cmp_date = campaign_start_date.strftime("%d%m%Y")
-        cmp_parts = [p for p in [p_cmp_lang, p_cmp_type, p_cmp_name, p_cmp_date] if p]
-        p_cmp = "_".join(cmp_parts)
-        p_cnt = normalize_token(utm_content)
-        p_trm = normalize_token(utm_term)
-
-        errors = []
-        if not destination_url or not is_valid_url(destination_url):
-            errors.append("URL")
-        if not p_src:
-            errors.append("utm_source")
-        if not p_med:
-            errors.append("utm_medium")
-        if not p_cmp_name:
-            errors.append("nome_campagna")
-        if not p_cmp_type:
-            errors.append("campaign_type")
-        if not p_cmp_lang:
-            errors.append("country_lingua")
-        if source_issues:
-            errors.append("source_naming")
-        if medium_issues:
-            errors.append("medium_naming")
-        if cmp_issues:
-            errors.append("campaign_name_naming")
-        if type_issues:
-            errors.append("campaign_type_naming")
-        if lang_issues:
-            errors.append("country_lingua_naming")
-        if utm_content and cnt_issues:
-            errors.append("content_naming")
-        if utm_term and trm_issues:
-            errors.append("term_naming")
+        link = build_utm_link(
+            destination_url,
+            utm_source,
+            utm_medium,
+            utm_campaign,
+            campaign_type,
+            campaign_language,
+            campaign_start_date,
+            utm_content=utm_content,
+            utm_term=utm_term,
+        )
+        errors = link["errors"]
+        final_url = link["final_url"]
 
         st.markdown('<div class="tilda-section">Result URL</div>', unsafe_allow_html=True)
-        final_url = ""
         if errors:
             st.markdown(
                 f'<div class="output-box-ready"><b>Compila i campi obbligatori.</b><br><small>Mancano: {", ".join(errors)}</small></div>',
                 unsafe_allow_html=True
             )
         else:
-            sep = "&" if "?" in destination_url else "?"
-            final_url = f"{destination_url}{sep}utm_source={p_src}&utm_medium={p_med}&utm_campaign={p_cmp}"
-            if p_cnt:
-                final_url += f"&utm_content={p_cnt}"
-            if p_trm:
-                final_url += f"&utm_term={p_trm}"
-
             # Save candidate entry for history tab
-            history_entry = {
-                "created_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                "user_email": st.session_state.get("user_email", ""),
-                "property_id": sel_prop_id or "",
-                "property_name": selected_prop_name or "",
-                "campaign_name": utm_campaign,
-                "live_date": campaign_start_date.strftime("%d/%m/%Y"),
-                "utm_source": p_src,
-                "utm_medium": p_med,
-                "utm_campaign": p_cmp,
-                "final_url": final_url,
-                "expected_channel_group": infer_expected_channel_group(p_med),
-            }
+            history_entry = make_history_entry(
+                link,
+                utm_campaign,
+                user_email=st.session_state.get("user_email", ""),
+                property_id=sel_prop_id or "",
+                property_name=selected_prop_name or "",
+            )
         result_btn_col, result_input_col = st.columns([0.12, 0.88], gap="small")
         with result_btn_col:
             copy_value = json.dumps(final_url if final_url else "")
@@ -1776,9 +1142,104 @@ def show_dashboard():
                 label_visibility="collapsed"
             )
         if final_url:
-            if st.button("Salva nello storico", key="save_history_btn", use_container_width=True):
-                upsert_utm_history_entry(history_entry)
-                st.success("Link salvato nello storico UTM.")
+            save_col, landing_col = st.columns(2, gap="small")
+            with save_col:
+                if st.button("Salva nello storico", key="save_history_btn", use_container_width=True):
+                    upsert_utm_history_entry(history_entry)
+                    st.success("Link salvato nello storico UTM.")
+            with landing_col:
+                verify_landing = st.button("Verifica landing page", key="verify_landing_btn", use_container_width=True)
+            if verify_landing:
+                with st.spinner("Verifica della landing page..."):
+                    landing_result = landing_verifier.verify_landing_page(
+                        final_url,
+                        landing_verifier.get_measurement_ids(sel_prop_id, st.session_state.credentials) if sel_prop_id else (),
+                    )
+                render_landing_result(landing_result)
+
+        with st.expander("🧮 Matrice varianti (più sorgenti, content, term e country)", expanded=False):
+            st.caption(
+                "Un valore per riga o separati da virgola; una lista vuota usa il valore del form. URL, medium, "
+                "nome e tipo campagna e data sono quelli del form: viene generata ogni combinazione dei valori indicati."
+            )
+            mx_col1, mx_col2 = st.columns(2, gap="small")
+            with mx_col1:
+                mx_sources = st.text_area("Sorgenti", key="matrix_sources", height=90, placeholder=utm_source or "")
+                mx_countries = st.text_area("Country/Lingua", key="matrix_countries", height=90, placeholder=campaign_language or "")
+            with mx_col2:
+                mx_contents = st.text_area("Content (varianti creative)", key="matrix_contents", height=90, placeholder=utm_content or "")
+                mx_terms = st.text_area("Term", key="matrix_terms", height=90, placeholder=utm_term or "")
+            try:
+                matrix = build_variant_matrix(
+                    destination_url,
+                    utm_medium,
+                    utm_campaign,
+                    campaign_type,
+                    campaign_start_date,
+                    split_values(mx_sources) or split_values(utm_source),
+                    split_values(mx_countries) or split_values(campaign_language),
+                    split_values(mx_contents) or split_values(utm_content),
+                    split_values(mx_terms) or split_values(utm_term),
+                )
+            except ValueError as e:
+                st.markdown(f'<div class="msg-error">❌ {html_lib.escape(str(e))}</div>', unsafe_allow_html=True)
+                matrix = []
+            if matrix:
+                matrix_df = pd.DataFrame([
+                    {
+                        "Includi": bool(cell["final_url"]),
+                        "Source": cell["source_raw"],
+                        "Country/Lingua": cell["country_raw"],
+                        "Content": cell["content_raw"],
+                        "Term": cell["term_raw"],
+                        "URL finale": cell["final_url"],
+                        "Errori": ", ".join(cell["errors"]),
+                        "Suggerimenti": "; ".join(f"{field}: {sugg}" for field, (_, sugg) in cell["issues"].items()),
+                    }
+                    for cell in matrix
+                ])
+                # La key cambia con le combinazioni, così le spunte non finiscono su righe diverse
+                editor_key = f"matrix_editor_{hash(tuple(c['final_url'] or c['utm_campaign'] + c['utm_source'] for c in matrix))}"
+                edited_df = st.data_editor(
+                    matrix_df,
+                    key=editor_key,
+                    hide_index=True,
+                    use_container_width=True,
+                    disabled=[c for c in matrix_df.columns if c != "Includi"],
+                )
+                selected_cells = [cell for cell, keep in zip(matrix, edited_df["Includi"]) if keep and cell["final_url"]]
+                valid_cells = sum(1 for cell in matrix if cell["final_url"])
+                st.caption(f"{len(matrix)} combinazioni, {valid_cells} valide, {len(selected_cells)} selezionate.")
+                mx_save_col, mx_dl_col = st.columns(2, gap="small")
+                with mx_save_col:
+                    if st.button(
+                        f"Salva {len(selected_cells)} link nello storico",
+                        key="save_matrix_history_btn",
+                        disabled=not selected_cells,
+                        use_container_width=True,
+                    ):
+                        matrix_entries = [
+                            make_history_entry(
+                                cell,
+                                utm_campaign,
+                                user_email=st.session_state.get("user_email", ""),
+                                property_id=sel_prop_id or "",
+                                property_name=selected_prop_name or "",
+                            )
+                            for cell in selected_cells
+                        ]
+                        saved = utm_history_store.upsert_entries(matrix_entries)
+                        wake_launch_monitor(matrix_entries)
+                        st.success(f"{saved} link salvati nello storico UTM.")
+                with mx_dl_col:
+                    st.download_button(
+                        "⬇️ Scarica CSV",
+                        data=edited_df[edited_df["Includi"]].drop(columns=["Includi"]).to_csv(index=False).encode("utf-8"),
+                        file_name="utm_matrice_varianti.csv",
+                        mime="text/csv",
+                        disabled=not selected_cells,
+                        use_container_width=True,
+                    )
 
         with st.expander("📘 Tabella guida parametri UTM"):
             st.table(pd.DataFrame(GUIDE_TABLE_DATA))
@@ -1866,6 +1327,18 @@ def show_dashboard():
                     html_output += "</div>"
                     st.markdown(html_output, unsafe_allow_html=True)
 
+                    # 3. LANDING PAGE: redirect, UTM all'arrivo e tag GA4 della property selezionata nel builder
+                    st.markdown("### Landing page")
+                    if parsed.scheme in ("http", "https") and parsed.netloc:
+                        with st.spinner("Verifica della landing page..."):
+                            landing_result = landing_verifier.verify_landing_page(
+                                check_url_input,
+                                landing_verifier.get_measurement_ids(sel_prop_id, st.session_state.credentials) if sel_prop_id else (),
+                            )
+                        render_landing_result(landing_result)
+                    else:
+                        st.info("Inserisci un URL http(s) completo per verificare la landing page.")
+
                 except Exception as e:
                     st.error(f"Errore analisi URL: {e}")
 
@@ -1876,20 +1349,72 @@ def show_dashboard():
         st.markdown("### UTM History & Tracking")
         st.markdown("Storico dei link UTM creati, con verifica del corretto channel grouping in GA4.")
 
-        history_items = load_utm_history()
-        prop_lookup = build_property_name_lookup(st.session_state.get("ga4_accounts", []))
         user_email = st.session_state.get("user_email", "")
-        if user_email:
-            history_items = [x for x in history_items if x.get("user_email") == user_email]
-        history_items = sorted(
-            history_items,
-            key=lambda x: (x.get("live_date", ""), x.get("campaign_name", "")),
-            reverse=True
-        )
+        prop_lookup = build_property_name_lookup(st.session_state.get("ga4_accounts", []))
+        filter_options = utm_history_store.get_filter_options(user_email)
+        history_items = []
 
-        if not history_items:
+        if not user_email:
+            # Lo storico è condiviso tra gli utenti: senza email non si mostra nulla
+            st.error("Impossibile leggere l'email dell'account Google: lo storico non è disponibile. Esci e rientra per riprovare.")
+        elif not filter_options["properties"]:
             st.info("Nessun link storico disponibile. Genera un link e clicca 'Salva nello storico'.")
         else:
+            # Filtri e paginazione sono applicati nella query SQL: si carica solo la pagina visibile
+            property_labels = {
+                prop_id: f"{prop_name or prop_lookup.get(prop_id, prop_id) or '-'} ({prop_id or '-'})"
+                for prop_id, prop_name in filter_options["properties"]
+            }
+            f_col1, f_col2, f_col3, f_col4 = st.columns(4)
+            with f_col1:
+                filter_property = st.selectbox(
+                    "Property", ["Tutte"] + list(property_labels),
+                    format_func=lambda x: x if x == "Tutte" else property_labels[x],
+                    key="history_filter_property",
+                )
+            with f_col2:
+                filter_channel = st.selectbox(
+                    "Canale atteso", ["Tutti"] + filter_options["channels"], key="history_filter_channel"
+                )
+            with f_col3:
+                filter_status = st.selectbox(
+                    "Stato tracking",
+                    ["Tutti", utm_history_store.UNVERIFIED_STATUS] + list(STATUS_ICONS),
+                    key="history_filter_status",
+                )
+            with f_col4:
+                filter_dates = st.date_input("Periodo live", value=(), format="DD/MM/YYYY", key="history_filter_dates")
+
+            date_from = filter_dates[0].isoformat() if len(filter_dates) >= 1 else None
+            date_to = filter_dates[-1].isoformat() if len(filter_dates) == 2 else None
+            filters = {
+                "property_id": None if filter_property == "Tutte" else filter_property,
+                "channel": None if filter_channel == "Tutti" else filter_channel,
+                "status": None if filter_status == "Tutti" else filter_status,
+                "date_from": date_from,
+                "date_to": date_to,
+            }
+
+            p_col1, p_col2 = st.columns([1, 3])
+            with p_col1:
+                page_size = st.selectbox("Righe per pagina", HISTORY_PAGE_SIZES, index=1, key="history_page_size")
+            total_rows = utm_history_store.count_entries(user_email, **filters)
+            page_count = max(1, -(-total_rows // page_size))
+            # Filtri più restrittivi possono ridurre le pagine sotto quella selezionata
+            if st.session_state.get("history_page", 1) > page_count:
+                st.session_state["history_page"] = page_count
+            with p_col2:
+                page = st.number_input(
+                    f"Pagina (di {page_count})", min_value=1, max_value=page_count, step=1, key="history_page"
+                )
+            history_items = load_utm_history_page(user_email, page=int(page), page_size=page_size, **filters)
+
+        if filter_options["properties"] and not history_items:
+            st.info("Nessun link corrisponde ai filtri selezionati.")
+        elif history_items:
+            st.caption(
+                f"Righe {(int(page) - 1) * page_size + 1}-{(int(page) - 1) * page_size + len(history_items)} di {total_rows}"
+            )
             base_rows = []
             for item in history_items:
                 base_rows.append(
@@ -1898,22 +1423,90 @@ def show_dashboard():
                         "Periodo": item.get("live_date", "-"),
                         "UTM (source / medium / campaign)": f"{item.get('utm_source','-')} / {item.get('utm_medium','-')} / {item.get('utm_campaign','-')}",
                         "Canale atteso": item.get("expected_channel_group", "-"),
-                        "Stato tracking": "Da verificare",
+                        "Stato tracking": (
+                            f"{STATUS_ICONS.get(item['tracking_status'], 'ℹ️')} {item['tracking_status']}"
+                            if item.get("tracking_status") else utm_history_store.UNVERIFIED_STATUS
+                        ),
+                        "Ultima verifica": item.get("tracking_checked_at") or "-",
+                        "Hit prima ora (realtime)": format_launch_hits(launch_monitor.get_launch_stats(item)),
                     }
                 )
-            st.dataframe(pd.DataFrame(base_rows), use_container_width=True, hide_index=True)
+            # Placeholder: "Verifica tutte" aggiorna la tabella man mano che arrivano gli esiti
+            history_table = st.empty()
+            history_table.dataframe(pd.DataFrame(base_rows), use_container_width=True, hide_index=True)
 
-            selected_campaign = st.selectbox(
+            campaign_labels = [f"{x.get('campaign_name','-')} ({x.get('live_date','-')})" for x in history_items]
+            selected_index = st.selectbox(
                 "Seleziona campagna da verificare",
-                [f"{x.get('campaign_name','-')} ({x.get('live_date','-')})" for x in history_items],
+                range(len(history_items)),
+                format_func=lambda i: campaign_labels[i],
             )
-            selected_index = [f"{x.get('campaign_name','-')} ({x.get('live_date','-')})" for x in history_items].index(selected_campaign)
             selected_item = history_items[selected_index]
             grace_days = st.number_input("Giorni di grace period post-live", min_value=0, max_value=30, value=2, step=1)
 
+            if st.button(
+                "Verifica tutte le campagne visibili",
+                key="verify_all_history_btn",
+                help=f"Verifica in parallelo le righe della pagina corrente; gli esiti degli ultimi {RESULT_TTL_SECONDS // 60} minuti non vengono ricalcolati.",
+            ):
+                to_check = [item for item in history_items if not is_result_fresh(item)]
+                if not to_check:
+                    st.info(f"Tutte le campagne sono state verificate negli ultimi {RESULT_TTL_SECONDS // 60} minuti.")
+                else:
+                    row_by_id = {item["id"]: i for i, item in enumerate(history_items)}
+                    progress = st.progress(0.0, text=f"Verifica di {len(to_check)} campagne...")
+                    deferred = 0
+                    for done, (item, result) in enumerate(
+                        iter_tracking_checks(to_check, st.session_state.credentials, grace_days=int(grace_days)), start=1
+                    ):
+                        row = base_rows[row_by_id[item["id"]]]
+                        row["Stato tracking"] = f"{STATUS_ICONS.get(result['status'], 'ℹ️')} {result['status']}"
+                        if result["status"] == "DEFERRED":
+                            deferred += 1
+                        else:
+                            utm_history_store.save_tracking_result(item["id"], result)
+                            row["Ultima verifica"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                        history_table.dataframe(pd.DataFrame(base_rows), use_container_width=True, hide_index=True)
+                        progress.progress(done / len(to_check), text=f"Verificate {done} di {len(to_check)} campagne")
+                    if deferred:
+                        st.warning(f"{deferred} verifiche rimandate: GA4 temporaneamente non disponibile o quota in esaurimento.")
+
+            if st.button(
+                "Verifica landing page visibili",
+                key="verify_landing_history_btn",
+                help="Redirect, UTM all'arrivo e tag GA4 della property per i link della pagina corrente.",
+            ):
+                ids_by_property = {
+                    prop: landing_verifier.get_measurement_ids(prop, st.session_state.credentials)
+                    for prop in {item.get("property_id", "") for item in history_items}
+                }
+                ids_by_url = {item["final_url"]: ids_by_property.get(item.get("property_id", ""), ()) for item in history_items}
+                landing_progress = st.progress(0.0, text=f"Verifica di {len(ids_by_url)} landing page...")
+                landing_results = {}
+                for done, (url, result) in enumerate(landing_verifier.iter_landing_checks(list(ids_by_url), ids_by_url), start=1):
+                    landing_results[url] = result
+                    landing_progress.progress(done / len(ids_by_url), text=f"Verificate {done} di {len(ids_by_url)} landing page")
+                landing_rows = []
+                for item in history_items:
+                    result = landing_results.get(item.get("final_url"))
+                    if not result:
+                        continue
+                    landing_rows.append(
+                        {
+                            "Campagna": item.get("campaign_name", "-"),
+                            "Landing": f"{STATUS_ICONS.get(result['status'], 'ℹ️')} {result['status']}",
+                            "HTTP": result["status_code"] or "-",
+                            "Redirect": len(result["redirects"]),
+                            "Dettaglio": result["message"],
+                        }
+                    )
+                st.dataframe(pd.DataFrame(landing_rows), use_container_width=True, hide_index=True)
+
             if st.button("Verifica tracking su GA4", key="check_tracking_history_btn", type="primary"):
                 result = check_tracking_status_for_entry(selected_item, st.session_state.credentials, grace_days=int(grace_days))
-                status_icon = {"OK": "✅", "WARNING": "⚠️", "ERROR": "❌", "PENDING": "⏳"}.get(result["status"], "ℹ️")
+                if result["status"] != "DEFERRED":
+                    utm_history_store.save_tracking_result(selected_item["id"], result)
+                status_icon = STATUS_ICONS.get(result["status"], "ℹ️")
 
                 st.markdown(
                     f"""
@@ -1965,17 +1558,15 @@ if __name__ == "__main__":
         SCOPES.append('https://www.googleapis.com/auth/userinfo.email')
 
     # Auto-login check
+    import credential_manager
     base_path = os.path.dirname(os.path.abspath(__file__))
     token_path = os.path.join(base_path, 'token.json')
     
-    if st.session_state.credentials is None and os.path.exists(token_path):
+    if st.session_state.credentials is None and "credential_manager" not in st.session_state and os.path.exists(token_path):
          try:
-             creds = Credentials.from_authorized_user_file(token_path, SCOPES)
-             if creds and creds.valid:
-                  st.session_state.credentials = creds
-             elif creds and creds.expired and creds.refresh_token:
-                  creds.refresh(Request())
-                  st.session_state.credentials = creds
+             manager = credential_manager.CredentialManager(Credentials.from_authorized_user_file(token_path, SCOPES))
+             if manager.ensure_valid():
+                  set_session_credentials(manager)
          except:
              pass
 
@@ -1989,25 +1580,16 @@ if __name__ == "__main__":
             flow = get_oauth_flow()
             if flow:
                 try:
-                    # Recupera il code_verifier dalla cache server-side usando lo state token
-                    if auth_state:
-                        cache = get_oauth_cache()
-                        if auth_state in cache:
-                            flow.code_verifier = cache[auth_state]
-                            
+                    # Recupera (e consuma) il code_verifier dallo store server-side usando lo state token
+                    import oauth_state_store
+                    code_verifier = oauth_state_store.consume_pending_state(auth_state)
+                    if code_verifier:
+                        flow.code_verifier = code_verifier
+                    st.session_state.pop("oauth_login", None)
+
                     flow.fetch_token(code=auth_code)
-                    creds = flow.credentials
-                    st.session_state.credentials = creds
-                    
-                    # Store as primitive dict to be completely safe with st.session_state
-                    st.session_state.google_credentials = {
-                        'token': creds.token,
-                        'refresh_token': creds.refresh_token,
-                        'token_uri': creds.token_uri,
-                        'client_id': creds.client_id,
-                        'client_secret': creds.client_secret,
-                        'scopes': creds.scopes
-                    }
+                    # Un solo oggetto Credentials per sessione, rinnovato in background prima della scadenza
+                    set_session_credentials(credential_manager.CredentialManager(flow.credentials))
                     
                     # Clean up URL params so we don't re-trigger the auth flow
                     st.query_params.clear()
@@ -2017,17 +1599,8 @@ if __name__ == "__main__":
             else:
                 st.error("Configurazione Flow mancante durante la validazione del codice.")
 
-    # Restoring from session state primitive dict if page reloads
-    if not st.session_state.credentials and "google_credentials" in st.session_state:
-        g_creds = st.session_state.google_credentials
-        st.session_state.credentials = Credentials(
-            token=g_creds.get('token'),
-            refresh_token=g_creds.get('refresh_token'),
-            token_uri=g_creds.get('token_uri'),
-            client_id=g_creds.get('client_id'),
-            client_secret=g_creds.get('client_secret'),
-            scopes=g_creds.get('scopes')
-        )
+    # Stesso oggetto Credentials a ogni rerun (ricostruito dal dict primitivo dopo un riavvio del worker)
+    st.session_state.credentials = get_session_credentials()
 
     # Routing
     if st.session_state.credentials:
@@ -0,0 +1,94 @@
+"""
+Benchmark dell'audit di frammentazione (utm_fragmentation) su un vocabolario
+sintetico da oltre 100k combinazioni source × medium × campaign, con varianti di
+maiuscole e separatori, abbreviazioni e refusi come in una property reale, e su
+un vocabolario di campagne che condividono un prefisso lungo.
+
+Uso:
+    python benchmarks/bench_fragmentation.py
+    python benchmarks/bench_fragmentation.py --save benchmarks/baselines/fragmentation.json
+    python benchmarks/bench_fragmentation.py --compare benchmarks/baselines/fragmentation.json
+
+Ogni operazione è un audit completo: ops/sec basse sono attese, conta che resti
+sotto pochi secondi per passaggio.
+"""
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import harness  # noqa: E402
+
+SEED = 20260227
+COMBINATIONS = 120000
+
+_SOURCES = ["google", "facebook", "instagram", "newsletter", "linkedin", "youtube", "bing", "tiktok", "criteo", "awin"]
+_MEDIUMS = ["cpc", "social_paid", "social_org", "email", "display", "affiliate", "cpm", "video"]
+_LETTERS = "abcdefghijklmnopqrstuvwxyz"
+_WORDS = ["saldi", "invernali", "black", "friday", "natale", "lancio", "collezione", "sconto", "estate", "outlet"]
+
+
+def _variant(rng, value):
+    """Una variante "sporca" di value: maiuscole, separatori o un refuso."""
+    kind = rng.random()
+    if kind < 0.4:
+        return value.upper() if rng.random() < 0.5 else value.title()
+    if kind < 0.7:
+        return value.replace("_", "-") if "_" in value else value[:len(value) // 2] + "-" + value[len(value) // 2:]
+    i = rng.randrange(len(value))
+    return value[:i] + value[i + 1:]
+
+
+def build_rows():
+    rng = random.Random(SEED)
+    sources = _SOURCES + [f"partner{i}" for i in range(200)] + [f"{rng.choice(_WORDS)}{rng.choice(_WORDS)}.it" for _ in range(300)]
+    campaigns = [
+        f"{rng.choice(['it', 'en', 'de', 'fr'])}_{rng.choice(['promo', 'ed', 'tr', 'awr'])}_"
+        f"{rng.choice(_WORDS)}-{rng.choice(_WORDS)}_{rng.randint(1, 28):02d}{rng.randint(1, 12):02d}2026"
+        for _ in range(40000)
+    ]
+    rows = []
+    for _ in range(COMBINATIONS):
+        source, medium, campaign = rng.choice(sources), rng.choice(_MEDIUMS), rng.choice(campaigns)
+        if rng.random() < 0.05:
+            source = _variant(rng, source)
+        if rng.random() < 0.05:
+            medium = _variant(rng, medium)
+        if rng.random() < 0.05:
+            campaign = _variant(rng, campaign)
+        rows.append((source, medium, campaign, rng.randint(1, 2000)))
+    return rows
+
+
+def build_shared_prefix_rows():
+    """Campagne con un prefisso lungo in comune ("promozione_autunnale_<nome>"): il caso peggiore per un blocking su prefissi."""
+    rng = random.Random(SEED)
+    names = {"".join(rng.choice(_LETTERS) for _ in range(rng.randint(5, 10))) for _ in range(COMBINATIONS)}
+    rows = []
+    for name in sorted(names):
+        campaign = f"promozione_autunnale_{name}"
+        if rng.random() < 0.05:
+            campaign = _variant(rng, campaign)
+        rows.append((rng.choice(_SOURCES), rng.choice(_MEDIUMS), campaign, rng.randint(1, 2000)))
+    return rows
+
+
+def build_cases():
+    if harness.REPO_ROOT not in sys.path:
+        sys.path.insert(0, harness.REPO_ROOT)
+    import utm_fragmentation
+
+    rows = build_rows()
+    campaigns = {}
+    for row in rows:
+        campaigns[row[2]] = campaigns.get(row[2], 0) + row[3]
+
+    return [
+        ("audit_vocabulary", utm_fragmentation.audit_vocabulary, [rows]),
+        ("audit_vocabulary_shared_prefix", utm_fragmentation.audit_vocabulary, [build_shared_prefix_rows()]),
+        ("cluster_values_campaign", lambda weights: utm_fragmentation.cluster_values("campaign", weights), [campaigns]),
+    ]
+
+
+if __name__ == "__main__":
+    sys.exit(harness.run_suite("fragmentation", build_cases()))
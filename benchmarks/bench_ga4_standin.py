@@ -0,0 +1,100 @@
+"""
+Benchmark end-to-end dei percorsi GA4 (verifica tracking e caricamento vocabolario
+sorgenti/medium) contro lo stand-in locale delle API (ga4_standin.py): client reali,
+trasporto REST, scheduler e contabilità quota inclusi, nessuna property reale.
+
+Uso:
+    python benchmarks/bench_ga4_standin.py
+    python benchmarks/bench_ga4_standin.py --latency-ms 80 --quota-error-rate 0.02
+    python benchmarks/bench_ga4_standin.py --save benchmarks/baselines/ga4_standin.json
+
+Il throughput è limitato anche da ga4_scheduler (REQUESTS_PER_SECOND per property):
+i casi distribuiscono le richieste su tutte le property del dataset sintetico.
+Le verifiche tracking sono incrementali (partizioni in un database temporaneo): dopo il
+warm-up il benchmark misura le ri-verifiche, che scaricano solo gli ultimi giorni.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import harness  # noqa: E402
+
+SEED = 20260227
+TRACKING_CORPUS_SIZE = 24
+
+
+def start_standin(argv=None):
+    """Avvia lo stand-in e punta ga4_mcp_tools verso di esso. Ritorna (server, argomenti restanti per run_suite)."""
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--quota-error-rate", type=float, default=0.0)
+    parser.add_argument("--rows-per-property", type=int, default=3000)
+    args, rest = parser.parse_known_args(argv)
+
+    if harness.REPO_ROOT not in sys.path:
+        sys.path.insert(0, harness.REPO_ROOT)
+    import ga4_standin
+
+    dataset = ga4_standin.build_synthetic_dataset(seed=SEED, rows_per_property=args.rows_per_property)
+    server, base_url = ga4_standin.start_server(
+        dataset=dataset, latency_ms=args.latency_ms, quota_error_rate=args.quota_error_rate, seed=SEED
+    )
+    os.environ["GA4_API_ENDPOINT"] = base_url
+    # Partizioni del tracking in un database temporaneo, non nello storico reale
+    os.environ["UTM_HISTORY_DB"] = os.path.join(tempfile.mkdtemp(prefix="bench_ga4_"), "utm_history.db")
+    return server, rest
+
+
+def build_tracking_corpus(dataset):
+    """Entry di storico costruite da righe reali del dataset (match) e da UTM inesistenti (nessun match)."""
+    rng = random.Random(SEED)
+    props = sorted(dataset["properties"])
+    corpus = []
+    for i in range(TRACKING_CORPUS_SIZE):
+        prop_id = props[i % len(props)]
+        row = rng.choice(dataset["properties"][prop_id]["rows"])
+        entry = {
+            "property_id": f"properties/{prop_id}",
+            "utm_source": row["sessionSource"],
+            "utm_medium": row["sessionMedium"],
+            "utm_campaign": row["sessionCampaignName"],
+            "expected_channel_group": row["sessionDefaultChannelGroup"],
+            "live_date": "01/01/2026",
+        }
+        if i % 3 == 2:
+            entry["utm_campaign"] = f"it_promo_inesistente-{i}_01012026"
+        corpus.append(entry)
+    return corpus
+
+
+def build_cases(dataset):
+    app, _ = harness.import_app_modules()
+    import ga4_mcp_tools
+    from utm_tracking import check_tracking_status_for_entry
+    props = [f"properties/{p}" for p in sorted(dataset["properties"])]
+    tracking = build_tracking_corpus(dataset)
+
+    def load_vocabulary(prop):
+        # Le tre query che il builder esegue alla selezione di una property
+        app.get_top_traffic_sources(prop, None)
+        app.get_top_traffic_mediums(prop, None)
+        app.get_source_medium_pairs(prop, None)
+
+    return [
+        ("check_tracking_status_for_entry", lambda e: check_tracking_status_for_entry(e, None), tracking),
+        ("load_vocabulary", load_vocabulary, props),
+        ("get_account_summaries", lambda _: ga4_mcp_tools.get_account_summaries(None, force_refresh=True), [None]),
+    ]
+
+
+if __name__ == "__main__":
+    server, rest = start_standin(sys.argv[1:])
+    try:
+        code = harness.run_suite("ga4_standin", build_cases(server.state.dataset), rest)
+        print(f"\nRichieste servite dallo stand-in: {server.state.request_count}")
+    finally:
+        server.shutdown()
+    sys.exit(code)
@@ -0,0 +1,144 @@
+"""
+Tempo di import a freddo dell'app (cold start di un worker Streamlit).
+
+Ogni scenario gira in un processo Python nuovo con `-X importtime`, come un worker
+appena avviato dopo un deploy o uno scale-out:
+  - login:     import di app.py, cioè ciò che serve per la pagina di login;
+  - dashboard: in più i moduli che show_dashboard importa al primo accesso.
+Per ogni scenario si riportano il tempo totale (mediana delle ripetizioni), il picco
+di memoria del processo e il tempo cumulativo dei moduli più costosi.
+
+Uso:
+    python benchmarks/bench_import_time.py
+    python benchmarks/bench_import_time.py --save benchmarks/baselines/import_time.json
+    python benchmarks/bench_import_time.py --compare benchmarks/baselines/import_time.json
+
+Il confronto usa gli "import al secondo" (1 / tempo totale), così la soglia di
+regressione di harness.compare_reports vale anche qui.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import harness  # noqa: E402
+
+DASHBOARD_MODULES = [
+    "pandas",
+    "chat_metrics",
+    "ga4_mcp_tools",
+    "ga4_quota",
+    "landing_verifier",
+    "launch_monitor",
+    "tracking_monitor",
+    "chatbot_ui",
+    "utm_tracking",
+]
+SCENARIOS = {
+    "login": ["app"],
+    "dashboard": ["app"] + DASHBOARD_MODULES,
+}
+
+_CHILD = """
+import logging, resource, sys, time, warnings
+warnings.simplefilter("ignore")
+logging.disable(logging.WARNING)
+sys.path.insert(0, {root!r})
+started = time.perf_counter()
+for name in {modules!r}:
+    __import__(name)
+elapsed = time.perf_counter() - started
+print(f"{{elapsed}} {{resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024}}")
+"""
+
+
+def parse_importtime(stderr):
+    """
+    Tempo cumulativo (secondi) dei moduli importati direttamente dallo scenario e,
+    per app, dei moduli importati direttamente da app.py (chiave "app > modulo").
+    L'output di -X importtime elenca i figli prima del padre, indentati di due spazi per livello.
+    """
+    cumulative = {}
+    pending_children = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cum_us, raw_name = line[len("import time:"):].split("|")
+        name = raw_name.strip()
+        depth = (len(raw_name) - len(raw_name.lstrip()) - 1) // 2
+        seconds = int(cum_us) / 1e6
+        if depth == 1:
+            pending_children.append((name, seconds))
+        elif depth == 0:
+            cumulative[name] = seconds
+            if name == "app":
+                cumulative.update({f"app > {child}": t for child, t in pending_children})
+            pending_children = []
+    return cumulative
+
+
+def run_scenario(modules):
+    """Importa `modules` in un processo nuovo. Ritorna (secondi, picco RSS in byte, tempi per modulo)."""
+    code = _CHILD.format(root=harness.REPO_ROOT, modules=modules)
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True, text=True, cwd=harness.REPO_ROOT, check=True,
+    )
+    elapsed, peak_rss = proc.stdout.split()
+    return float(elapsed), int(peak_rss), parse_importtime(proc.stderr)
+
+
+def measure_scenario(name, modules, repeats, top):
+    runs = [run_scenario(modules) for _ in range(repeats)]
+    seconds = [r[0] for r in runs]
+    # Tempi per modulo della ripetizione mediana
+    median_run = sorted(runs, key=lambda r: r[0])[len(runs) // 2]
+    # Solo i moduli dello scenario e gli import di app.py, non quelli dell'avvio dell'interprete
+    top_modules = sorted(
+        ((m, t) for m, t in median_run[2].items() if m in modules or m.startswith("app > ")),
+        key=lambda kv: kv[1], reverse=True,
+    )
+    return {
+        "name": name,
+        "corpus_size": 1,
+        "ops_per_sec": round(1 / min(seconds), 3),
+        "ops_per_sec_median": round(1 / statistics.median(seconds), 3),
+        "peak_alloc_bytes_per_pass": max(r[1] for r in runs),
+        "retained_bytes_per_pass": 0,
+        "seconds_median": round(statistics.median(seconds), 4),
+        "modules": {m: round(t, 4) for m, t in top_modules[:top]},
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark: tempo di import a freddo")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--top", type=int, default=12, help="moduli più lenti da riportare per scenario")
+    parser.add_argument("--save", metavar="PATH")
+    parser.add_argument("--compare", metavar="PATH")
+    parser.add_argument("--threshold", type=float, default=0.10)
+    args = parser.parse_args(argv)
+
+    results = [measure_scenario(name, modules, args.repeats, args.top) for name, modules in SCENARIOS.items()]
+    for r in results:
+        print(f"\n{r['name']}: {r['seconds_median'] * 1000:,.0f} ms (mediana di {args.repeats}), "
+              f"picco RSS {r['peak_alloc_bytes_per_pass'] / 2**20:,.0f} MiB")
+        for module, seconds in r["modules"].items():
+            print(f"    {module:<40}{seconds * 1000:>10,.1f} ms")
+
+    report = harness.build_report("import_time", results)
+    if args.save:
+        harness.save_report(report, args.save)
+        print(f"\nBaseline salvata in {args.save}")
+    if args.compare:
+        rows, regressions = harness.compare_reports(harness.load_report(args.compare), report, args.threshold)
+        harness.print_comparison(rows, regressions)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,150 @@
+"""
+Micro-benchmark degli hot path di testo (normalizzazione UTM, validazione naming,
+pulizia risposte del chatbot). Girano a ogni rerun del builder e a ogni turno chat.
+
+Uso:
+    python benchmarks/bench_text_processing.py
+    python benchmarks/bench_text_processing.py --save benchmarks/baselines/text_processing.json
+    python benchmarks/bench_text_processing.py --compare benchmarks/baselines/text_processing.json
+
+I corpora sono sintetici e generati con seed fisso, quindi identici tra run e macchine.
+"""
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import harness  # noqa: E402
+
+SEED = 20260227
+CORPUS_SIZE = 200
+
+_WORDS = [
+    "saldi", "invernali", "Black Friday", "promo", "newsletter", "Facebook", "instagram",
+    "social_paid", "Paid-Search", "cpc", "CTA", "banner", "awareness", "lancio", "Natale",
+    "estate 2026", "back to school", "città", "perché", "sconto%", "offerta!", "nuova&collezione",
+]
+_DOMAINS = ["chicco.it", "www.example.com", "shop.brand.de", "localhost:8501", "192.168.0.10", "sito", "my-site.co.uk"]
+_PATHS = ["", "/", "/collezione-abbigliamento.html", "/it/promo?ref=home", "/a/b/c", "/search?q=passeggino"]
+
+
+def _rng():
+    return random.Random(SEED)
+
+
+def _phrase(rng, min_words=1, max_words=4):
+    return " ".join(rng.choice(_WORDS) for _ in range(rng.randint(min_words, max_words)))
+
+
+def build_token_corpus():
+    rng = _rng()
+    corpus = []
+    for _ in range(CORPUS_SIZE):
+        value = _phrase(rng)
+        if rng.random() < 0.3:
+            value = value.upper()
+        if rng.random() < 0.3:
+            value = value.replace(" ", rng.choice(["_", "-", "  ", "__"]))
+        corpus.append(value)
+    return corpus
+
+
+def build_url_corpus():
+    rng = _rng()
+    corpus = []
+    for _ in range(CORPUS_SIZE):
+        scheme = rng.choice(["https://", "http://", "", "ftp://"])
+        url = f"{scheme}{rng.choice(_DOMAINS)}{rng.choice(_PATHS)}"
+        if rng.random() < 0.5:
+            sep = "&" if "?" in url else "?"
+            url += f"{sep}utm_source={rng.choice(['google', 'facebook'])}&utm_medium=cpc&utm_campaign=it_promo_{rng.randint(1, 99)}_27022026"
+        corpus.append(url)
+    return corpus
+
+
+def build_bot_response_corpus():
+    rng = _rng()
+    corpus = []
+    for i in range(CORPUS_SIZE):
+        kind = i % 4
+        if kind == 0:
+            words = _phrase(rng, 3, 8)
+            corpus.append(f"Perfetto! {words} {words.split(' ')[0]} {words.split(' ')[0]}. Quale utm_medium preferisci?")
+        elif kind == 1:
+            corpus.append(
+                "```json\n{\"url\": \"%s\", \"utm_source\": \"facebook\", \"utm_medium\": \"social_paid\", "
+                "\"utm_campaign\": \"it_promo_saldi-invernali_27-02-2026\", \"utm_content\": null}\n```"
+                % rng.choice(_DOMAINS)
+            )
+        elif kind == 2:
+            corpus.append(
+                f"Copia e incolla questo link completo:\n`https://{rng.choice(_DOMAINS)}{rng.choice(_PATHS)}"
+                f"?utm_source=newsletter&utm_medium=email&utm_campaign=it_ed_{_phrase(rng, 1, 2).replace(' ', '-')}_10.02.26`."
+            )
+        else:
+            corpus.append(f"<div>Ecco alcune opzioni:<br>- social\\_paid<br>- social\\_org</div> awarenessawareness IT IT {_phrase(rng)}")
+    return corpus
+
+
+def build_user_input_corpus():
+    rng = _rng()
+    corpus = []
+    for i in range(CORPUS_SIZE):
+        kind = i % 4
+        if kind == 0:
+            corpus.append(f"vorrei un link per {rng.choice(_DOMAINS)}{rng.choice(_PATHS)}")
+        elif kind == 1:
+            corpus.append(f"campagna social, medium: social_paid source: {rng.choice(['facebook', 'instagram'])}")
+        elif kind == 2:
+            corpus.append(f"newsletter di {_phrase(rng, 1, 3)} campaign = it_promo_saldi_27022026")
+        else:
+            corpus.append(_phrase(rng, 2, 6))
+    return corpus
+
+
+def _new_context():
+    return {
+        "current_step": 0,
+        "params": {
+            "destination_url": None,
+            "traffic_type": None,
+            "ga4_channel": None,
+            "utm_medium": None,
+            "utm_source": None,
+            "utm_campaign": None,
+            "utm_content": None,
+            "utm_term": None,
+        },
+        "ga4_property_id": None,
+        "tool_cache": {},
+    }
+
+
+def build_cases():
+    app, chatbot_ui = harness.import_app_modules()
+
+    tokens = build_token_corpus()
+    urls = build_url_corpus()
+    responses = build_bot_response_corpus()
+    user_inputs = build_user_input_corpus()
+    response_and_input = list(zip(responses, user_inputs))
+
+    def update_context(pair):
+        # Contesto nuovo a ogni chiamata, come a inizio conversazione (la creazione è inclusa nel tempo)
+        chatbot_ui._update_context_from_response(pair[0], pair[1], _new_context())
+
+    return [
+        ("normalize_token", app.normalize_token, tokens),
+        ("normalize_medium_token", app.normalize_medium_token, tokens),
+        ("validate_naming_rules", app.validate_naming_rules, tokens),
+        ("is_valid_url", app.is_valid_url, urls),
+        ("clean_bot_response", chatbot_ui.clean_bot_response, responses),
+        ("_dedupe_repetitions", chatbot_ui._dedupe_repetitions, responses),
+        ("_extract_first_url", chatbot_ui._extract_first_url, responses + user_inputs),
+        ("_update_context_from_response", update_context, response_and_input),
+        ("_normalize_destination_url", chatbot_ui._normalize_destination_url, urls),
+    ]
+
+
+if __name__ == "__main__":
+    sys.exit(harness.run_suite("text_processing", build_cases()))
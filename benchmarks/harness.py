@@ -0,0 +1,170 @@
+"""
+Harness minimale per i micro-benchmark.
+
+Ogni caso è una funzione applicata a un corpus fisso: si misurano ops/sec
+(miglior ripetizione e mediana) e la memoria allocata (picco tracemalloc) per
+un passaggio completo sul corpus. I risultati si salvano in JSON e si possono
+confrontare con una baseline salvata in precedenza.
+"""
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+BASELINE_SCHEMA = 1
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def import_app_modules():
+    """Importa app.py / chatbot_ui.py in bare mode senza il rumore dei warning Streamlit."""
+    import logging
+    import warnings
+    warnings.simplefilter("ignore")
+    if REPO_ROOT not in sys.path:
+        sys.path.insert(0, REPO_ROOT)
+    logging.disable(logging.WARNING)
+    try:
+        import app
+        import chatbot_ui
+    finally:
+        logging.disable(logging.NOTSET)
+    return app, chatbot_ui
+
+
+def _run_pass(fn, corpus):
+    for item in corpus:
+        fn(item)
+
+
+def measure(name, fn, corpus, repeats=5, min_seconds=0.2):
+    """
+    Misura `fn(item)` su tutti gli elementi del corpus.
+    Il numero di passaggi per ripetizione è calibrato per durare almeno `min_seconds`.
+    """
+    _run_pass(fn, corpus)  # warm-up (regex compilate, cache interne)
+
+    passes = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(passes):
+            _run_pass(fn, corpus)
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_seconds or passes >= 1 << 20:
+            break
+        passes *= 2
+
+    rates = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        for _ in range(passes):
+            _run_pass(fn, corpus)
+        elapsed = time.perf_counter() - started
+        rates.append(passes * len(corpus) / elapsed)
+
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    before, _ = tracemalloc.get_traced_memory()
+    _run_pass(fn, corpus)
+    after, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "name": name,
+        "corpus_size": len(corpus),
+        "ops_per_sec": round(max(rates), 1),
+        "ops_per_sec_median": round(statistics.median(rates), 1),
+        "peak_alloc_bytes_per_pass": peak - before,
+        "retained_bytes_per_pass": after - before,
+    }
+
+
+def build_report(suite, results):
+    return {
+        "schema": BASELINE_SCHEMA,
+        "suite": suite,
+        "created_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": {r["name"]: r for r in results},
+    }
+
+
+def save_report(report, path):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+
+
+def load_report(path):
+    with open(path, "r", encoding="utf-8") as f:
+        report = json.load(f)
+    if report.get("schema") != BASELINE_SCHEMA:
+        raise ValueError(f"Baseline {path}: schema {report.get('schema')} non supportato")
+    return report
+
+
+def compare_reports(baseline, current, threshold=0.10):
+    """
+    Confronta ops/sec (mediana) e picco allocazioni.
+    Ritorna (righe, regressioni): una regressione è un calo di throughput oltre `threshold`.
+    """
+    rows, regressions = [], []
+    for name, cur in current["results"].items():
+        base = baseline["results"].get(name)
+        if not base:
+            rows.append((name, None, cur["ops_per_sec_median"], None, cur["peak_alloc_bytes_per_pass"]))
+            continue
+        delta = (cur["ops_per_sec_median"] - base["ops_per_sec_median"]) / base["ops_per_sec_median"]
+        rows.append((name, base["ops_per_sec_median"], cur["ops_per_sec_median"], delta, cur["peak_alloc_bytes_per_pass"]))
+        if delta < -threshold:
+            regressions.append(name)
+    return rows, regressions
+
+
+def print_results(results):
+    print(f"{'benchmark':<34}{'ops/sec':>14}{'median':>14}{'peak alloc/pass':>18}")
+    for r in results:
+        print(f"{r['name']:<34}{r['ops_per_sec']:>14,.0f}{r['ops_per_sec_median']:>14,.0f}{r['peak_alloc_bytes_per_pass']:>16,} B")
+
+
+def print_comparison(rows, regressions):
+    print(f"\n{'benchmark':<34}{'baseline':>14}{'current':>14}{'delta':>10}")
+    for name, base, cur, delta, _ in rows:
+        base_txt = f"{base:,.0f}" if base is not None else "-"
+        delta_txt = f"{delta:+.1%}" if delta is not None else "new"
+        flag = "  <-- REGRESSION" if name in regressions else ""
+        print(f"{name:<34}{base_txt:>14}{cur:>14,.0f}{delta_txt:>10}{flag}")
+
+
+def run_suite(suite, cases, argv=None):
+    """Entry point comune: parse argomenti, esegue i casi, salva/confronta la baseline."""
+    import argparse
+    parser = argparse.ArgumentParser(description=f"Benchmark suite: {suite}")
+    parser.add_argument("--filter", default="", help="esegue solo i casi il cui nome contiene questo testo")
+    parser.add_argument("--save", metavar="PATH", help="salva i risultati come baseline JSON")
+    parser.add_argument("--compare", metavar="PATH", help="confronta con una baseline JSON salvata")
+    parser.add_argument("--threshold", type=float, default=0.10, help="calo di ops/sec considerato regressione (default 0.10)")
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    results = []
+    for name, fn, corpus in cases:
+        if args.filter and args.filter not in name:
+            continue
+        results.append(measure(name, fn, corpus, repeats=args.repeats))
+    print_results(results)
+
+    report = build_report(suite, results)
+    if args.save:
+        save_report(report, args.save)
+        print(f"\nBaseline salvata in {args.save}")
+    if args.compare:
+        rows, regressions = compare_reports(load_report(args.compare), report, args.threshold)
+        print_comparison(rows, regressions)
+        if regressions:
+            return 1
+    return 0
@@ -0,0 +1,232 @@
+"""
+Registrazione/replay delle chiamate esterne (API GA4, Gemini).
+
+Le funzioni decorate con @recordable(name) si comportano normalmente se CALL_RECORDER_MODE
+non è impostata:
+
+    record  ogni chiamata viene eseguita e argomenti, risultato (o eccezione) e durata
+            vengono aggiunti a CALL_RECORDER_DIR/<name>.jsonl
+    replay  le chiamate non vengono mai eseguite: si restituisce il risultato registrato
+            (o si solleva l'eccezione registrata) dopo la durata originale moltiplicata per
+            CALL_RECORDER_TIME_SCALE (1.0 = tempi originali, 0 = immediato)
+
+Le chiamate si abbinano sul nome della funzione e su un hash degli argomenti canonicalizzati;
+credenziali, API key e gli altri parametri in `ignore` non vengono mai scritti né usati
+nell'hash. I parametri in `outputs` sono dict che la funzione riempie sul posto (es. le
+statistiche di un turno): non entrano nell'hash, il loro contenuto finale viene registrato
+e in replay ricopiato nell'argomento passato. Chiamate identiche vengono riprodotte
+nell'ordine di registrazione; esaurite, si riusa l'ultima. Una chiamata assente dalle
+registrazioni solleva RecordingNotFound.
+"""
+import functools
+import hashlib
+import importlib
+import inspect
+import json
+import os
+import threading
+import time
+
+MODE_ENV = "CALL_RECORDER_MODE"
+DIR_ENV = "CALL_RECORDER_DIR"
+TIME_SCALE_ENV = "CALL_RECORDER_TIME_SCALE"
+DEFAULT_DIR = "recordings"
+
+DEFAULT_IGNORED_PARAMS = ("creds", "api_key")
+
+_file_lock = threading.Lock()
+_replay_lock = threading.Lock()
+_replay_index = {}  # name -> {key: [records]}
+_replay_cursor = {}  # (name, key) -> next position
+
+
+class RecordingNotFound(Exception):
+    """Modalità replay: nessuna registrazione corrisponde alla chiamata."""
+
+
+def get_mode():
+    mode = os.environ.get(MODE_ENV, "").strip().lower()
+    return mode if mode in ("record", "replay") else ""
+
+
+def _recordings_dir():
+    return os.environ.get(DIR_ENV, "").strip() or DEFAULT_DIR
+
+
+def _time_scale():
+    try:
+        return max(0.0, float(os.environ.get(TIME_SCALE_ENV, "1") or 1))
+    except ValueError:
+        return 1.0
+
+
+def _is_proto_message(value):
+    return hasattr(type(value), "to_json") and hasattr(type(value), "pb")
+
+
+def _canonical(value):
+    """Vista deterministica e compatibile JSON di un argomento (usata solo per l'abbinamento)."""
+    if _is_proto_message(value):
+        return type(value).to_dict(value)
+    if isinstance(value, dict):
+        return {str(k): _canonical(v) for k, v in sorted(value.items(), key=lambda kv: str(kv[0]))}
+    if isinstance(value, (list, tuple)):
+        return [_canonical(v) for v in value]
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    if callable(value):
+        return getattr(value, "__name__", type(value).__name__)
+    return type(value).__name__
+
+
+def _encode(value):
+    """Serializza un risultato in modo che _decode lo ricostruisca con gli stessi tipi."""
+    if _is_proto_message(value):
+        cls = type(value)
+        return {"__proto__": f"{cls.__module__}:{cls.__qualname__}", "json": cls.to_json(value)}
+    if isinstance(value, tuple):
+        return {"__tuple__": [_encode(v) for v in value]}
+    if isinstance(value, list):
+        return [_encode(v) for v in value]
+    if isinstance(value, dict):
+        return {k: _encode(v) for k, v in value.items()}
+    return value
+
+
+def _load_class(path):
+    module_name, qualname = path.split(":", 1)
+    obj = importlib.import_module(module_name)
+    for part in qualname.split("."):
+        obj = getattr(obj, part)
+    return obj
+
+
+def _decode(value):
+    if isinstance(value, dict):
+        if "__proto__" in value:
+            return _load_class(value["__proto__"]).from_json(value["json"], ignore_unknown_fields=True)
+        if "__tuple__" in value:
+            return tuple(_decode(v) for v in value["__tuple__"])
+        return {k: _decode(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_decode(v) for v in value]
+    return value
+
+
+def _rebuild_exception(error):
+    try:
+        cls = _load_class(error["type"])
+        if isinstance(cls, type) and issubclass(cls, Exception):
+            return cls(error["message"])
+    except Exception:
+        pass
+    return Exception(f"{error['type']}: {error['message']}")
+
+
+def _call_key(name, bound_args, ignore):
+    args = {k: _canonical(v) for k, v in bound_args.items() if k not in ignore}
+    payload = json.dumps(args, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(f"{name}:{payload}".encode("utf-8")).hexdigest()[:32], args
+
+
+def _append_record(name, record):
+    directory = _recordings_dir()
+    os.makedirs(directory, exist_ok=True)
+    line = json.dumps(record, ensure_ascii=False, default=str)
+    with _file_lock:
+        with open(os.path.join(directory, f"{name}.jsonl"), "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+
+def _next_recording(name, key):
+    with _replay_lock:
+        index = _replay_index.get(name)
+        if index is None:
+            index = {}
+            path = os.path.join(_recordings_dir(), f"{name}.jsonl")
+            if os.path.exists(path):
+                with open(path, "r", encoding="utf-8") as f:
+                    for line in f:
+                        if line.strip():
+                            record = json.loads(line)
+                            index.setdefault(record["key"], []).append(record)
+            _replay_index[name] = index
+        records = index.get(key)
+        if not records:
+            return None
+        position = _replay_cursor.get((name, key), 0)
+        _replay_cursor[(name, key)] = position + 1
+        return records[min(position, len(records) - 1)]
+
+
+def reset_replay():
+    """Dimentica registrazioni caricate e posizioni di replay (es. dopo aver cambiato CALL_RECORDER_DIR)."""
+    with _replay_lock:
+        _replay_index.clear()
+        _replay_cursor.clear()
+
+
+def _capture_outputs(record, bound_args, outputs):
+    captured = {p: _encode(bound_args[p]) for p in outputs if isinstance(bound_args.get(p), dict)}
+    if captured:
+        record["outputs"] = captured
+
+
+def _restore_outputs(bound_args, outputs):
+    for param, value in outputs.items():
+        target = bound_args.get(param)
+        if isinstance(target, dict):
+            target.clear()
+            target.update(_decode(value))
+
+
+def recordable(name, ignore=DEFAULT_IGNORED_PARAMS, outputs=()):
+    """Decoratore: registra o riproduce le chiamate della funzione sotto `name` (vedi docstring del modulo)."""
+    outputs = tuple(outputs)
+    ignore = set(ignore) | set(outputs)
+
+    def decorator(fn):
+        signature = inspect.signature(fn)
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            mode = get_mode()
+            if not mode:
+                return fn(*args, **kwargs)
+
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            key, canonical_args = _call_key(name, bound.arguments, ignore)
+
+            if mode == "replay":
+                record = _next_recording(name, key)
+                if record is None:
+                    raise RecordingNotFound(f"Nessuna registrazione per {name} ({key}) in {_recordings_dir()}")
+                delay = record.get("elapsed", 0) * _time_scale()
+                if delay:
+                    time.sleep(delay)
+                _restore_outputs(bound.arguments, record.get("outputs", {}))
+                if "error" in record:
+                    raise _rebuild_exception(record["error"])
+                return _decode(record["result"])
+
+            started = time.perf_counter()
+            record = {"key": key, "name": name, "recorded_at": time.time(), "args": canonical_args}
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                record["elapsed"] = round(time.perf_counter() - started, 4)
+                _capture_outputs(record, bound.arguments, outputs)
+                cls = type(e)
+                record["error"] = {"type": f"{cls.__module__}:{cls.__qualname__}", "message": str(e)}
+                _append_record(name, record)
+                raise
+            record["elapsed"] = round(time.perf_counter() - started, 4)
+            _capture_outputs(record, bound.arguments, outputs)
+            record["result"] = _encode(result)
+            _append_record(name, record)
+            return result
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,151 @@
+"""
+Strumentazione dei turni del chatbot.
+
+Per ogni turno registra modello, token (somma di tutti gli step del loop di
+function calling), tempo totale diviso tra modello e tool, e chiamate/latenze
+per singolo tool. I record restano in un ring in memoria di dimensione fissa,
+condiviso dal processo, e sono esportabili in CSV dal pannello diagnostica.
+"""
+import csv
+import functools
+import io
+import json
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+CHAT_METRICS_MAX_TURNS = 500
+
+CSV_FIELDS = [
+    "timestamp",
+    "user_email",
+    "status",
+    "model",
+    "model_steps",
+    "prompt_tokens",
+    "output_tokens",
+    "total_tokens",
+    "wall_ms",
+    "model_ms",
+    "tool_ms",
+    "tool_calls",
+    "ga4_requests",
+    "tools_json",
+]
+
+_turns = deque(maxlen=CHAT_METRICS_MAX_TURNS)
+_turns_lock = threading.Lock()
+
+
+def new_turn_stats() -> Dict[str, Any]:
+    """Accumulatore per un singolo turno (usato da un solo thread alla volta)."""
+    return {
+        "model_steps": 0,
+        "prompt_tokens": 0,
+        "output_tokens": 0,
+        "total_tokens": 0,
+        "model_seconds": 0.0,
+        "tools": {},
+    }
+
+
+def instrument_tool(fn: Callable, stats: Dict[str, Any]) -> Callable:
+    """
+    Avvolge un tool misurando chiamate e latenza.
+    functools.wraps preserva nome, docstring e firma letti da Gemini per la dichiarazione.
+    """
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - started
+            tool = stats["tools"].setdefault(fn.__name__, {"calls": 0, "total_seconds": 0.0, "max_seconds": 0.0})
+            tool["calls"] += 1
+            tool["total_seconds"] += elapsed
+            tool["max_seconds"] = max(tool["max_seconds"], elapsed)
+    return wrapper
+
+
+def instrument_model(model: Any, stats: Dict[str, Any]) -> None:
+    """
+    Misura ogni chiamata generate_content del modello (anche quelle del loop
+    automatico di function calling, che passano tutte da model.generate_content).
+    """
+    original = model.generate_content
+
+    @functools.wraps(original)
+    def generate_content(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            response = original(*args, **kwargs)
+        finally:
+            stats["model_seconds"] += time.perf_counter() - started
+            stats["model_steps"] += 1
+        usage = getattr(response, "usage_metadata", None)
+        if usage is not None:
+            stats["prompt_tokens"] += int(getattr(usage, "prompt_token_count", 0) or 0)
+            stats["output_tokens"] += int(getattr(usage, "candidates_token_count", 0) or 0)
+            stats["total_tokens"] += int(getattr(usage, "total_token_count", 0) or 0)
+        return response
+
+    model.generate_content = generate_content
+
+
+def record_turn(
+    stats: Dict[str, Any],
+    *,
+    user_email: str,
+    model_name: Optional[str],
+    wall_seconds: float,
+    status: str,
+    ga4_requests: int = 0,
+) -> Dict[str, Any]:
+    """Chiude il turno e lo aggiunge al ring."""
+    tools = {
+        name: {
+            "calls": t["calls"],
+            "total_ms": round(t["total_seconds"] * 1000, 1),
+            "max_ms": round(t["max_seconds"] * 1000, 1),
+        }
+        for name, t in stats["tools"].items()
+    }
+    record = {
+        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "user_email": user_email or "",
+        "status": status,
+        "model": model_name or "",
+        "model_steps": stats["model_steps"],
+        "prompt_tokens": stats["prompt_tokens"],
+        "output_tokens": stats["output_tokens"],
+        "total_tokens": stats["total_tokens"],
+        "wall_ms": round(wall_seconds * 1000, 1),
+        "model_ms": round(stats["model_seconds"] * 1000, 1),
+        "tool_ms": round(sum(t["total_seconds"] for t in stats["tools"].values()) * 1000, 1),
+        "tool_calls": sum(t["calls"] for t in stats["tools"].values()),
+        "ga4_requests": ga4_requests,
+        "tools": tools,
+    }
+    with _turns_lock:
+        _turns.append(record)
+    return record
+
+
+def get_turn_records(user_email: str) -> List[Dict[str, Any]]:
+    """Ritorna i turni registrati dell'utente (i più recenti per ultimi); lista vuota senza email."""
+    if not user_email:
+        return []
+    with _turns_lock:
+        return [r for r in _turns if r["user_email"] == user_email]
+
+
+def turn_records_to_csv(records: List[Dict[str, Any]]) -> str:
+    buf = io.StringIO()
+    writer = csv.DictWriter(buf, fieldnames=CSV_FIELDS, extrasaction="ignore")
+    writer.writeheader()
+    for r in records:
+        writer.writerow({**r, "tools_json": json.dumps(r.get("tools", {}), sort_keys=True)})
+    return buf.getvalue()
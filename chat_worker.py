@@ -0,0 +1,78 @@
+"""
+Esecuzione in background dei turni del chatbot.
+
+La chiamata a Gemini (con i tool GA4 chiamati in automatico) gira in un pool di
+thread condiviso dal processo: lo script Streamlit salva solo il job id in
+session_state e interroga lo stato con un breve auto-refresh, restando libero di
+servire il builder nel frattempo.
+
+I job non devono usare `st.*`: i worker non hanno uno ScriptRunContext.
+"""
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+CHAT_WORKER_MAX_THREADS = 4
+# Job completati ma mai ritirati (es. sessione chiusa) vengono scartati dopo questo tempo
+CHAT_JOB_RETENTION_SECONDS = 15 * 60
+
+_executor = ThreadPoolExecutor(max_workers=CHAT_WORKER_MAX_THREADS, thread_name_prefix="chat-turn")
+_jobs = {}
+_jobs_lock = threading.Lock()
+
+
+def _purge_stale_jobs() -> None:
+    now = time.monotonic()
+    with _jobs_lock:
+        stale = [
+            job_id for job_id, job in _jobs.items()
+            if job["future"].done() and now - job["submitted_at"] > CHAT_JOB_RETENTION_SECONDS
+        ]
+        for job_id in stale:
+            del _jobs[job_id]
+
+
+def submit_turn(fn, *args, **kwargs) -> str:
+    """
+    Accoda `fn(*args, cancel_event=..., **kwargs)` nel pool e ritorna il job id.
+    `cancel_event` viene impostato quando il turno diventa obsoleto.
+    """
+    _purge_stale_jobs()
+    job_id = uuid.uuid4().hex
+    cancel_event = threading.Event()
+    future = _executor.submit(fn, *args, cancel_event=cancel_event, **kwargs)
+    with _jobs_lock:
+        _jobs[job_id] = {
+            "future": future,
+            "cancel_event": cancel_event,
+            "submitted_at": time.monotonic(),
+        }
+    return job_id
+
+
+def cancel_turn(job_id: str) -> None:
+    """Annulla un turno: se non è ancora partito non verrà eseguito, altrimenti il risultato viene scartato."""
+    with _jobs_lock:
+        job = _jobs.pop(job_id, None)
+    if job:
+        job["cancel_event"].set()
+        job["future"].cancel()
+
+
+def get_turn_status(job_id: str) -> str:
+    """Ritorna 'running', 'done' oppure 'missing' (job annullato o scaduto)."""
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+    if not job:
+        return "missing"
+    return "done" if job["future"].done() else "running"
+
+
+def pop_turn_result(job_id: str):
+    """Ritira il risultato di un job completato (rilancia l'eccezione del worker, se presente)."""
+    with _jobs_lock:
+        job = _jobs.pop(job_id, None)
+    if not job:
+        return None
+    return job["future"].result()
@@ -1,27 +1,25 @@
 import streamlit as st
-import os
-import base64
 import re
 import json
+import time
 from datetime import datetime
 from typing import Optional, List, Dict, Any, Tuple
 from urllib.parse import urlparse, parse_qsl, urlencode, urlunparse
 
 import google.generativeai as genai
 import ga4_mcp_tools  # Importa il modulo con i tool GA4
+import ga4_metadata  # Metadata per property e pre-validazione dei report
+import tool_output  # Risultati dei tool compatti e con tetto di token
+import utm_vocabulary  # Indice fuzzy di source/medium osservati
+import chat_worker  # Esecuzione in background dei turni chat
+import chat_metrics  # Metriche per turno (latenza, token, tool)
+import call_recorder  # Registrazione/replay delle chiamate Gemini e GA4 (CALL_RECORDER_MODE)
+import static_assets  # CSS e icona serviti come file statici
 
 
 # -------------------------
 # Utility (UI / cleaning)
 # -------------------------
-def get_base64_image(image_path: str) -> Optional[str]:
-    """Helper per convertire immagini in base64 (se necessario per UI future)"""
-    if os.path.exists(image_path):
-        with open(image_path, "rb") as image_file:
-            return base64.b64encode(image_file.read()).decode()
-    return None
-
-
 def _dedupe_repetitions(text: str) -> str:
     """
     Riduce ripetizioni accidentali tipiche dei LLM:
@@ -544,9 +542,16 @@ REGOLE GA4: QUANDO USARLO
   b) medium/source rischiano di mandare nel canale sbagliato
   c) servono opzioni coerenti con lo storico
 
+FORMATO DEI RISULTATI GA4
+- Report e lista property arrivano come tabella: "columns" (nomi delle colonne) e "rows" (una lista di valori per riga, nello stesso ordine).
+- Le righe dei report sono le prime per la prima metrica; "row_count" è il numero totale di righe e "totals" i totali delle metriche su tutte le righe.
+- Se "more_available" è true ci sono altre righe: non dire che i dati mostrati sono tutti; se servono, rilancia tool_run_report con un "limit" più alto o filtri più stretti.
+- Se c'è "corrections", i nomi di dimensioni/metriche sono stati corretti automaticamente: usa quelli corretti nelle chiamate successive.
+
 GESTIONE ERRORI GA4
 - Se un tool GA4 restituisce un dict con chiave "error", riporta all'utente il messaggio esatto: es. "Errore GA4: <valore di error>".
 - Se l'errore contiene "error_type", segnalalo: es. "Tipo: PermissionDenied".
+- Se l'errore contiene "retryable": true, GA4 è temporaneamente non disponibile (quota o servizio): NON dire che non ci sono dati, suggerisci di riprovare più tardi.
 - Non assumere che sia sempre un problema di permessi: potrebbe essere un token scaduto, uno scope mancante, o un property_id errato.
 - Se GA4 non è disponibile, continua comunque il flusso UTM usando le regole statiche e i mapping definiti sopra.
 - Non bloccare il flusso UTM a causa di errori GA4: prosegui e proponi opzioni basate sulle regole.
@@ -566,6 +571,7 @@ STEP 4: utm_medium
 STEP 5: utm_source
 - Proponi 2-4 opzioni coerenti (vedi MAPPING sopra)
 - Se possibile, verifica con GA4: dimensions ["sessionPrimaryChannelGroup","sessionSource"], metric ["sessions"]
+- Se l'utente scrive un utm_source o utm_medium a mano, controllalo con tool_suggest_utm_value(property_id, field, value): se known è false e ci sono suggestions, proponi il valore noto (es. "facebok" -> "facebook") prima di usarlo
 STEP 6: utm_campaign
 - Costruisci chiedendo solo i token mancanti:
   1) country-lingua, 2) campaignType (suggerisci promo/ed/tr/awr ma accetta anche nuovi tipi personalizzati), 3) campaignName, 4) data, 5) CTA (opzionale)
@@ -597,15 +603,18 @@ ISTRUZIONI BASATE SULLO STATO
 # -------------------------
 # Gemini wrapper
 # -------------------------
+@call_recorder.recordable("gemini_response", ignore=("api_key",), outputs=("turn_stats",))
 def get_gemini_response_safe(
     user_input: str,
     history: List[Dict[str, Any]],
     tools: List[Any],
     system_instruction: str,
-    api_key: str
+    api_key: str,
+    turn_stats: Optional[Dict[str, Any]] = None
 ) -> Tuple[str, str]:
     """
     Tenta di ottenere una risposta provando una lista estesa di modelli.
+    Se `turn_stats` è passato (vedi chat_metrics.new_turn_stats) accumula tempi e token del modello.
     Ritorna: (testo, nome_modello)
     """
     models_to_try = [
@@ -626,6 +635,8 @@ def get_gemini_response_safe(
                 tools=tools,
                 system_instruction=system_instruction
             )
+            if turn_stats is not None:
+                chat_metrics.instrument_model(model, turn_stats)
 
             chat = model.start_chat(
                 history=history,
@@ -651,6 +662,348 @@ def get_gemini_response_safe(
     )
 
 
+# -------------------------
+# Turni chat in background
+# -------------------------
+CHAT_POLL_INTERVAL_SECONDS = 1.0
+# Righe massime per report chieste dal modello (il default del tool resta 10)
+REPORT_MAX_ROWS = 100
+CANCELLED_TOOL_RESULT = {"error": "Turno annullato: l'utente ha inviato un nuovo messaggio", "error_type": "Cancelled"}
+
+
+def _build_ga4_tools(creds, utm_ctx: dict, cancel_event=None, user_email: str = "") -> Tuple[List[Any], Any]:
+    """
+    Costruisce i tool GA4 esposti a Gemini.
+    Ritorna (tool, tool di stima della property dall'URL), il secondo usato anche per l'auto-selezione.
+    Se il turno viene annullato i tool smettono di chiamare GA4.
+    """
+    def _cancelled() -> bool:
+        return bool(cancel_event and cancel_event.is_set())
+
+    def tool_list_properties() -> Any:
+        cache_key = "list_properties"
+        if cache_key in utm_ctx["tool_cache"]:
+            return utm_ctx["tool_cache"][cache_key]
+        if _cancelled():
+            return CANCELLED_TOOL_RESULT
+        result = tool_output.compact_account_summaries(ga4_mcp_tools.get_account_summaries(creds))
+        utm_ctx["tool_cache"][cache_key] = result
+        return result
+
+    def tool_get_metadata(property_id: str) -> Any:
+        if _cancelled():
+            return CANCELLED_TOOL_RESULT
+        return ga4_mcp_tools.get_property_details(property_id, creds)
+
+    def tool_run_report(property_id: str, dimensions: List[str], metrics: List[str], start_date: str = "30daysAgo", end_date: str = "today", limit: int = 10) -> Any:
+        limit = min(max(int(limit or 10), 1), REPORT_MAX_ROWS)
+        cache_key = f"run_report:{property_id}:{dimensions}:{metrics}:{start_date}:{end_date}:{limit}"
+        if cache_key in utm_ctx["tool_cache"]:
+            return utm_ctx["tool_cache"][cache_key]
+        if _cancelled():
+            return CANCELLED_TOOL_RESULT
+        # Nomi controllati sui metadata della property prima della chiamata: gli errori evidenti
+        # tornano al modello senza round trip GA4, quelli correggibili vengono corretti
+        checked = ga4_metadata.prepare_report(property_id, dimensions, metrics, creds)
+        if checked["errors"]:
+            result = {"error": "; ".join(checked["errors"]), "error_type": "InvalidRequest", "sent_to_ga4": False}
+            if checked["suggestions"]:
+                result["suggestions"] = checked["suggestions"]
+            utm_ctx["tool_cache"][cache_key] = result
+            return result
+        result = ga4_mcp_tools.run_report(
+            property_id, checked["dimensions"], checked["metrics"], [{"start_date": start_date, "end_date": end_date}], creds, limit=limit
+        )
+        ga4_metadata.record_report_outcome(property_id, checked["dimensions"], checked["metrics"], result)
+        if checked["corrections"] and not (isinstance(result, dict) and "error" in result):
+            result = {**result, "corrections": checked["corrections"]}
+        utm_ctx["tool_cache"][cache_key] = result
+        return result
+
+    def tool_run_realtime_report(property_id: str, dimensions: List[str], metrics: List[str]) -> Any:
+        if _cancelled():
+            return CANCELLED_TOOL_RESULT
+        return ga4_mcp_tools.run_realtime_report(property_id, dimensions, metrics, creds)
+
+    def tool_list_ads_links(property_id: str) -> Any:
+        if _cancelled():
+            return CANCELLED_TOOL_RESULT
+        return ga4_mcp_tools.list_google_ads_links(property_id, creds)
+
+    def tool_suggest_utm_value(property_id: str, field: str, value: str) -> Any:
+        """Valori noti di source/medium più vicini a `value` nella property (refusi, maiuscole, abbreviazioni)."""
+        field = str(field or "").lower().replace("utm_", "")
+        if field not in ("source", "medium"):
+            return {"error": "field deve essere 'source' o 'medium'", "error_type": "InvalidRequest"}
+        if _cancelled():
+            return CANCELLED_TOOL_RESULT
+        try:
+            index = utm_vocabulary.get_property_index(property_id, creds)[field] if property_id else None
+        except Exception:
+            # GA4 non disponibile: si ripiega sullo storico e sulla tabella guida
+            index = None
+        result = (index or utm_vocabulary.get_offline_index(field, property_id, user_email=user_email)).check(value)
+        result["suggestions"] = [{k: s[k] for k in ("value", "distance", "sessions", "reason")} for s in result["suggestions"]]
+        result["vocabulary"] = "ga4" if index is not None else "storico"
+        return result
+
+    def tool_guess_property_from_url(destination_url: str) -> Dict[str, Any]:
+        cache_key = f"guess_property:{destination_url}"
+        if cache_key in utm_ctx["tool_cache"]:
+            return utm_ctx["tool_cache"][cache_key]
+        if _cancelled():
+            return CANCELLED_TOOL_RESULT
+        url = _normalize_destination_url(destination_url)
+        host = urlparse(url).netloc.lower().replace("www.", "")
+        host_root = host.split(":")[0]
+        summaries = ga4_mcp_tools.get_account_summaries(creds)
+        props = []
+        if isinstance(summaries, dict):
+            for k in ["propertySummaries", "properties", "items", "data"]:
+                if k in summaries and isinstance(summaries[k], list):
+                    props = summaries[k]
+                    break
+            if not props and "accountSummaries" in summaries:
+                for acc in summaries["accountSummaries"]:
+                    ps = acc.get("propertySummaries") or []
+                    if isinstance(ps, list):
+                        props.extend(ps)
+        elif isinstance(summaries, list):
+            for acc in summaries:
+                ps = acc.get("propertySummaries") or acc.get("properties") or []
+                if isinstance(ps, list):
+                    props.extend(ps)
+
+        candidates = []
+        for p in props:
+            display_name = p.get("displayName") or p.get("display_name")
+            display = (display_name or p.get("name") or "").lower()
+            pid = ""
+            m = re.search(r"properties/(\d+)", p.get("name") or p.get("property_id") or "")
+            if m:
+                pid = m.group(1)
+            score = 0
+            if host_root and host_root in display:
+                score += 3
+            candidates.append(
+                {"property_id": pid, "display_name": display_name, "score": score}
+            )
+
+        candidates.sort(key=lambda x: x["score"], reverse=True)
+        result = {"candidates": candidates[:5], "domain": host_root}
+        utm_ctx["tool_cache"][cache_key] = result
+        return result
+
+    tools = [
+        tool_list_properties,
+        tool_get_metadata,
+        tool_run_report,
+        tool_run_realtime_report,
+        tool_list_ads_links,
+        tool_suggest_utm_value,
+        tool_guess_property_from_url,
+    ]
+    return tools, tool_guess_property_from_url
+
+
+def _auto_select_property(utm_ctx: dict, guess_tool, url: Optional[str]) -> None:
+    """Seleziona automaticamente la property GA4 migliore per l'URL (senza chiedere conferma)."""
+    try:
+        if not url or utm_ctx.get("ga4_property_id"):
+            return
+        guessed = guess_tool(url)
+        candidates = guessed.get("candidates", []) if isinstance(guessed, dict) else []
+        if candidates:
+            best = sorted(
+                candidates,
+                key=lambda x: (x.get("score", 0), bool(x.get("property_id"))),
+                reverse=True
+            )[0]
+            best_pid = best.get("property_id")
+            if best_pid:
+                utm_ctx["ga4_property_id"] = best_pid
+    except Exception:
+        pass
+
+
+def _run_chat_turn(pending_text: str, history: List[Dict[str, Any]], utm_ctx: dict, creds, api_key: str, user_email: str = "", cancel_event=None) -> Dict[str, Any]:
+    """
+    Job eseguito nel worker: auto-selezione property, system instruction e chiamata Gemini.
+    Non usa st.*: il post-processing avviene nello script Streamlit.
+    `utm_ctx` è una copia del contesto di sessione: cache dei tool e property scelta tornano
+    in `context` e vengono riportate nella sessione da _collect_finished_chat_turn.
+    Ogni turno (anche fallito o annullato) viene registrato in chat_metrics.
+    """
+    started = time.perf_counter()
+    stats = chat_metrics.new_turn_stats()
+    ga4_mcp_tools.reset_ga4_request_count()
+    model_name = None
+    status = "error"
+    try:
+        genai.configure(api_key=api_key)
+        tools, guess_tool = _build_ga4_tools(creds, utm_ctx, cancel_event, user_email)
+        wrapped = {t: chat_metrics.instrument_tool(tool_output.capped(t), stats) for t in tools}
+        my_tools = list(wrapped.values())
+        guess_tool = wrapped[guess_tool]
+
+        # Auto-select GA4 property from destination URL without asking user confirmation
+        _auto_select_property(utm_ctx, guess_tool, utm_ctx["params"].get("destination_url"))
+
+        # --- Dynamic system instruction ---
+        current_date = datetime.now().strftime("%Y-%m-%d")
+        system_instruction = _build_system_instruction(utm_ctx, current_date)
+
+        response_text, model_name = get_gemini_response_safe(
+            pending_text,
+            history,
+            my_tools,
+            system_instruction,
+            api_key,
+            turn_stats=stats,
+        )
+        status = "ok"
+        result = {"response_text": response_text, "model_name": model_name}
+        if not (cancel_event is not None and cancel_event.is_set()):
+            result["context"] = {"tool_cache": utm_ctx["tool_cache"], "ga4_property_id": utm_ctx.get("ga4_property_id")}
+        return result
+    finally:
+        if cancel_event is not None and cancel_event.is_set():
+            status = "cancelled"
+        chat_metrics.record_turn(
+            stats,
+            user_email=user_email,
+            model_name=model_name,
+            wall_seconds=time.perf_counter() - started,
+            status=status,
+            ga4_requests=ga4_mcp_tools.get_ga4_request_count(),
+        )
+
+
+def _submit_chat_turn(user_text: str, creds) -> None:
+    """Accoda un nuovo turno; un turno ancora in corso diventa obsoleto e viene annullato."""
+    stale_job_id = st.session_state.get("chat_job_id")
+    if stale_job_id:
+        chat_worker.cancel_turn(stale_job_id)
+        for msg in reversed(st.session_state.messages):
+            if msg["role"] == "user":
+                msg["cancelled"] = True
+                break
+        st.session_state.chat_job_id = None
+        st.session_state.chat_is_responding = False
+
+    # --- History (prima del nuovo messaggio, senza i turni annullati) ---
+    history = []
+    for msg in st.session_state.messages:
+        if msg.get("cancelled"):
+            continue
+        role = "user" if msg["role"] == "user" else "model"
+        text = msg.get("raw_content", msg["content"])
+        history.append({"role": role, "parts": [text]})
+
+    st.session_state.messages.append({"role": "user", "content": user_text})
+
+    api_key = st.session_state.get("gemini_api_key")
+    if not api_key:
+        st.session_state.messages.append(
+            {"role": "assistant", "content": "Configura prima la API Key nelle impostazioni."}
+        )
+        return
+
+    utm_ctx = st.session_state.utm_context
+    # Aggiorna subito il contesto col testo utente corrente
+    # (cosi' destination_url e altri campi sono disponibili
+    # prima dell'auto-selezione property GA4).
+    _update_context_from_response("", user_text, utm_ctx)
+
+    # Il worker lavora su una copia: la sessione Streamlit non viene toccata da un altro thread
+    job_ctx = {**utm_ctx, "params": dict(utm_ctx["params"]), "tool_cache": dict(utm_ctx["tool_cache"])}
+    st.session_state.chat_job_id = chat_worker.submit_turn(
+        _run_chat_turn, user_text, history, job_ctx, creds, api_key,
+        user_email=st.session_state.get("user_email", ""),
+    )
+    st.session_state.pending_user_text = user_text
+    st.session_state.chat_is_responding = True
+
+
+def _collect_finished_chat_turn(creds, history_save_func=None) -> None:
+    """Se il job del turno corrente è terminato, aggiunge la risposta alla chat."""
+    job_id = st.session_state.get("chat_job_id")
+    if not job_id:
+        return
+    status = chat_worker.get_turn_status(job_id)
+    if status == "running":
+        return
+
+    pending_text = st.session_state.pending_user_text
+    st.session_state.chat_job_id = None
+    st.session_state.chat_is_responding = False
+    st.session_state.pending_user_text = None
+    if status == "missing":
+        return
+
+    try:
+        result = chat_worker.pop_turn_result(job_id)
+        response_text = result["response_text"]
+        cleaned = clean_bot_response(response_text)
+        utm_ctx = st.session_state.utm_context
+        # Solo i turni non annullati riportano cache e property nella sessione
+        job_ctx = result.get("context")
+        if job_ctx:
+            utm_ctx["tool_cache"].update(job_ctx["tool_cache"])
+            if job_ctx.get("ga4_property_id") and not utm_ctx.get("ga4_property_id"):
+                utm_ctx["ga4_property_id"] = job_ctx["ga4_property_id"]
+
+        st.session_state.messages.append(
+            {
+                "role": "assistant",
+                "content": cleaned,
+                "raw_content": response_text,
+            }
+        )
+
+        # Update conversation context
+        _update_context_from_response(response_text, pending_text, utm_ctx)
+
+        # Salva automaticamente nello storico UTM, se disponibile un link finale.
+        if callable(history_save_func):
+            try:
+                final_url = _extract_first_url(cleaned or "")
+                if final_url and "utm_" in final_url:
+                    # Retry auto-selezione property se ancora mancante
+                    # usando prima URL di destinazione, poi URL finale.
+                    _, guess_tool = _build_ga4_tools(creds, utm_ctx)
+                    _auto_select_property(
+                        utm_ctx,
+                        guess_tool,
+                        utm_ctx["params"].get("destination_url") or final_url,
+                    )
+                    saved = history_save_func(
+                        final_url,
+                        utm_ctx.get("ga4_property_id") or ""
+                    )
+                    if saved:
+                        if hasattr(st, "toast"):
+                            st.toast("Link salvato nello storico UTM", icon="✅")
+                        else:
+                            st.success("Link salvato nello storico UTM.")
+            except Exception:
+                pass
+
+    except Exception as e:
+        st.session_state.messages.append({"role": "assistant", "content": f"Errore: {str(e)}"})
+
+
+def _chat_job_poller() -> None:
+    """Auto-refresh leggero: quando il job termina fa ripartire l'app per mostrare la risposta."""
+    job_id = st.session_state.get("chat_job_id")
+    if job_id and chat_worker.get_turn_status(job_id) != "running":
+        st.rerun()
+
+
+if hasattr(st, "fragment"):
+    _chat_job_poller = st.fragment(run_every=CHAT_POLL_INTERVAL_SECONDS)(_chat_job_poller)
+
+
 # -------------------------
 # Main UI
 # -------------------------
@@ -667,6 +1020,8 @@ def render_chatbot_interface(creds, api_key_func=None, history_save_func=None) -
         st.session_state.chat_is_responding = False
     if "pending_user_text" not in st.session_state:
         st.session_state.pending_user_text = None
+    if "chat_job_id" not in st.session_state:
+        st.session_state.chat_job_id = None
     if "chat_welcome_sent" not in st.session_state:
         st.session_state.chat_welcome_sent = False
     if "utm_context" not in st.session_state:
@@ -686,241 +1041,11 @@ def render_chatbot_interface(creds, api_key_func=None, history_save_func=None) -
             "tool_cache": {},
         }
 
-    # Carica icona
-    base_path = os.path.dirname(os.path.abspath(__file__))
-    icon_path = os.path.join(base_path, "wr_assistant_icon.png.png")
-    icon_b64 = get_base64_image(icon_path)
-    
-    # CSS per Floating Button e Window
-    # Usa selettori molto specifici e un container ID unico per evitare conflitti
-    
-    # 1. STYLE PER IL BUTTON (FAB)
-    # CSS per Floating Button e Window
-    # Usa selettori molto specifici e un container ID unico per evitare conflitti
-    
-    # 1. STYLE PER IL BUTTON (FAB)
-    fab_css = f"""
-        /* Targettiamo SOLO la colonna specifica che contiene il nostro marker univoco */
-        /* Questo evita di matchare il main container o blocchi generici che contengono altri bottoni */
-        div[data-testid="stColumn"]:has(div.fab-unique-marker) {{
-            position: fixed;
-            bottom: 30px;
-            right: 30px;
-            width: auto !important;
-            height: auto !important;
-            z-index: 999999;
-            background: transparent !important;
-            pointer-events: none;
-            overflow: visible !important; /* Importante per far uscire il fixed */
-        }}
-        
-        div[data-testid="stColumn"]:has(div.fab-unique-marker) button {{
-            pointer-events: auto;
-            width: 70px !important;
-            height: 70px !important;
-            border-radius: 50% !important;
-            border: none !important;
-            box-shadow: 0 6px 16px rgba(0,0,0,0.2) !important;
-            transition: transform 0.2s, box-shadow 0.2s !important;
-            background-color: white !important;
-            background-size: cover !important;
-            background-position: center !important;
-            background-repeat: no-repeat !important;
-            display: block !important;
-            margin: 0 !important;
-        }}
-        
-        div[data-testid="stColumn"]:has(div.fab-unique-marker) button:hover {{
-            transform: scale(1.05);
-            box-shadow: 0 8px 20px rgba(0,0,0,0.3) !important;
-        }}
-        
-        div[data-testid="stColumn"]:has(div.fab-unique-marker) button p {{
-            display: none !important;
-        }}
-        
-        /* Nasconde il marker stesso */
-        .fab-unique-marker {{
-            display: none;
-        }}
-    """
-    
-    if icon_b64:
-        fab_css += f"""
-        div[data-testid="stColumn"]:has(div.fab-unique-marker) button {{
-            background-image: url("data:image/png;base64,{icon_b64}") !important;
-        }}
-        """
-    else:
-        fab_css += """
-        div[data-testid="stColumn"]:has(div.fab-unique-marker) button {
-            background-color: #2563eb !important;
-        }
-        div[data-testid="stColumn"]:has(div.fab-unique-marker) button::after {
-            content: "💬";
-            font-size: 30px;
-            display: flex;
-            align-items: center;
-            justify-content: center;
-            height: 100%;
-            color: white;
-        }
-        """
-
-    # 2. STYLE PER LA WINDOW
-    window_css = """
-        /* ------------------------------------------------
-         * CHAT WINDOW: fixed overlay, non disturba il layout
-         * Il selector prende il vertical block piu' interno
-         * con marker dedicato per evitare side effect sui parent.
-         * ------------------------------------------------ */
-        div[data-testid="stVerticalBlock"]:has(div.chat-window-scope):not(:has(div[data-testid="stVerticalBlock"] div.chat-window-scope)) {
-            position: fixed;
-            bottom: 110px;
-            right: 30px;
-            width: 380px !important;
-            max-width: 90vw;
-            height: 600px !important;
-            max-height: 80vh;
-            background-color: white;
-            border-radius: 16px;
-            box-shadow: 0 10px 40px rgba(0,0,0,0.15);
-            z-index: 999998;
-            border: 1px solid #e5e7eb;
-            overflow: hidden;
-            display: flex;
-            flex-direction: column;
-            padding: 0 !important;
-            gap: 0 !important;
-        }
-
-        div[data-testid="stVerticalBlock"]:has(div.chat-window-scope):not(:has(div[data-testid="stVerticalBlock"] div.chat-window-scope))
-            > div[data-testid="element-container"] {
-            margin-bottom: 0 !important;
-        }
-        div[data-testid="stVerticalBlock"]:has(div.chat-window-scope):not(:has(div[data-testid="stVerticalBlock"] div.chat-window-scope))
-            > div[data-testid="element-container"]:last-child {
-            margin-bottom: 0 !important;
-            padding-bottom: 0 !important;
-        }
-
-        /* Scroll storico messaggi in area dedicata */
-        .chat-messages-area {
-            height: clamp(180px, 48vh, 360px);
-            min-height: 0;
-            overflow-y: auto;
-            padding: 10px 8px;
-            display: flex;
-            flex-direction: column-reverse;
-            gap: 8px;
-            background: #f9fafb;
-            flex: 0 0 auto;
-            overflow-anchor: none;
-        }
-
-        /* Input area dentro la window */
-        div[data-testid="stVerticalBlock"]:has(div.chat-window-scope):not(:has(div[data-testid="stVerticalBlock"] div.chat-window-scope))
-            > div[data-testid="element-container"]:has(div[data-testid="stForm"]) {
-            margin-top: auto !important;
-            margin-bottom: 0 !important;
-        }
-        div[data-testid="stVerticalBlock"]:has(div.chat-window-scope):not(:has(div[data-testid="stVerticalBlock"] div.chat-window-scope))
-            div[data-testid="stForm"] {
-            padding: 8px 8px 0 !important;
-            border-top: 1px solid #e5e7eb;
-            background: white;
-            position: sticky;
-            bottom: 0;
-            z-index: 3;
-            margin-bottom: 0 !important;
-        }
-        div[data-testid="stVerticalBlock"]:has(div.chat-window-scope):not(:has(div[data-testid="stVerticalBlock"] div.chat-window-scope))
-            div[data-testid="stForm"] form {
-            margin-bottom: 0 !important;
-            padding-bottom: 0 !important;
-        }
-        div[data-testid="stVerticalBlock"]:has(div.chat-window-scope):not(:has(div[data-testid="stVerticalBlock"] div.chat-window-scope))
-            div[data-testid="stFormSubmitButton"] {
-            margin-bottom: 0 !important;
-            padding-bottom: 0 !important;
-        }
-        div[data-testid="stVerticalBlock"]:has(div.chat-window-scope):not(:has(div[data-testid="stVerticalBlock"] div.chat-window-scope))
-            div[data-testid="element-container"]:has([data-testid="stSpinner"]) {
-            display: none !important;
-        }
+    # Risposta pronta dal worker? (anche a finestra chiusa)
+    _collect_finished_chat_turn(creds, history_save_func)
 
-        .chat-header {
-            background: #2563eb;
-            color: white;
-            padding: 12px 16px;
-            display: flex;
-            justify-content: space-between;
-            align-items: center;
-            font-weight: 600;
-            font-size: 15px;
-            border-bottom: 1px solid #1d4ed8;
-            flex-shrink: 0;
-        }
-        .debug-badge {
-            display: inline-flex;
-            align-items: center;
-            gap: 6px;
-            font-size: 11px;
-            color: #1e3a8a;
-            background: #dbeafe;
-            border: 1px solid #bfdbfe;
-            border-radius: 999px;
-            padding: 4px 8px;
-            margin: 4px 8px 8px 8px;
-            width: fit-content;
-        }
-
-        .msg-bubble {
-            padding: 10px 14px;
-            border-radius: 12px;
-            font-size: 14px;
-            line-height: 1.5;
-            max-width: 85%;
-            word-wrap: break-word;
-        }
-        .msg-user {
-            background: #2563eb;
-            color: white;
-            align-self: flex-end;
-            border-bottom-right-radius: 2px;
-        }
-        .msg-bot {
-            background: white;
-            color: #1f2937;
-            border: 1px solid #e5e7eb;
-            align-self: flex-start;
-            border-bottom-left-radius: 2px;
-            box-shadow: 0 1px 2px rgba(0,0,0,0.05);
-        }
-        .msg-loading {
-            display: inline-flex;
-            align-items: center;
-            gap: 8px;
-            color: #334155;
-            background: #eff6ff;
-            border-color: #bfdbfe;
-        }
-        .chat-loader {
-            width: 14px;
-            height: 14px;
-            border-radius: 50%;
-            border: 2px solid #bfdbfe;
-            border-top-color: #2563eb;
-            animation: chat-loader-spin .8s linear infinite;
-            flex-shrink: 0;
-        }
-        @keyframes chat-loader-spin {
-            from { transform: rotate(0deg); }
-            to { transform: rotate(360deg); }
-        }
-    """
-
-    st.markdown(f"<style>{fab_css}{window_css}</style>", unsafe_allow_html=True)
+    # CSS di FAB e finestra in static/chatbot.css (asset statico con hash, vedi static_assets)
+    st.markdown(static_assets.stylesheet_tags("chatbot.css"), unsafe_allow_html=True)
 
     # Marker esterno: collassa l'intera sezione chatbot nel layout Streamlit
     # in modo che non occupi spazio verticale nella pagina
@@ -963,7 +1088,7 @@ def render_chatbot_interface(creds, api_key_func=None, history_save_func=None) -
 
             # MESSAGES – render come HTML puro per evitare spazio nel layout Streamlit
             if not st.session_state.messages and not st.session_state.chat_is_responding:
-                img_tag = f'<img src="data:image/png;base64,{icon_b64}" style="width:60px;height:60px;margin-bottom:12px;opacity:0.8;border-radius:50%;"><br>' if icon_b64 else ''
+                img_tag = f'<img src="{static_assets.asset_src("wr_assistant_icon.png")}" style="width:60px;height:60px;margin-bottom:12px;opacity:0.8;border-radius:50%;"><br>'
                 msgs_html = f'<div class="chat-messages-area"><div style="text-align:center;padding:30px 16px;color:#6b7280;font-size:14px;">{img_tag}<b>Ciao!</b><br>Sono qui per aiutarti coi parametri UTM.</div></div>'
             else:
                 rows = []
@@ -985,211 +1110,25 @@ def render_chatbot_interface(creds, api_key_func=None, history_save_func=None) -
             st.markdown(msgs_html, unsafe_allow_html=True)
 
             # INPUT
-            chat_locked = bool(st.session_state.chat_is_responding)
-            input_placeholder = "WR Assistant sta rispondendo..." if chat_locked else "Scrivi qui..."
+            # L'input resta attivo: un nuovo messaggio annulla il turno ancora in corso.
+            input_placeholder = "Scrivi per inviare un nuovo messaggio..." if st.session_state.chat_is_responding else "Scrivi qui..."
 
             with st.form("chat_input_form", clear_on_submit=True):
                 user_text = st.text_input(
                     "Messaggio",
                     label_visibility="collapsed",
                     placeholder=input_placeholder,
-                    disabled=chat_locked,
                 )
-                submitted = st.form_submit_button("Invia", use_container_width=True, disabled=chat_locked)
+                submitted = st.form_submit_button("Invia", use_container_width=True)
 
-            if submitted and user_text and not chat_locked:
-                st.session_state.messages.append({"role": "user", "content": user_text})
-                st.session_state.pending_user_text = user_text
-                st.session_state.chat_is_responding = True
+            if submitted and user_text:
+                _submit_chat_turn(user_text, creds)
                 st.rerun()
 
-            if st.session_state.chat_is_responding and st.session_state.pending_user_text:
-                pending_text = st.session_state.pending_user_text
-
-                try:
-                    with st.spinner("WR Assistant sta rispondendo..."):
-                        api_key = st.session_state.get("gemini_api_key")
-                        if not api_key:
-                            st.session_state.messages.append(
-                                {"role": "assistant", "content": "Configura prima la API Key nelle impostazioni."}
-                            )
-                        else:
-                            genai.configure(api_key=api_key)
-                            utm_ctx = st.session_state.utm_context
-                            # Aggiorna subito il contesto col testo utente corrente
-                            # (cosi' destination_url e altri campi sono disponibili
-                            # prima dell'auto-selezione property GA4).
-                            _update_context_from_response("", pending_text, utm_ctx)
-
-                            # --- TOOLS ---
-                            def tool_list_properties() -> Any:
-                                cache_key = "list_properties"
-                                if cache_key in utm_ctx["tool_cache"]:
-                                    return utm_ctx["tool_cache"][cache_key]
-                                result = ga4_mcp_tools.get_account_summaries(creds)
-                                utm_ctx["tool_cache"][cache_key] = result
-                                return result
-
-                            def tool_get_metadata(property_id: str) -> Any:
-                                return ga4_mcp_tools.get_property_details(property_id, creds)
-
-                            def tool_run_report(property_id: str, dimensions: List[str], metrics: List[str], start_date: str = "30daysAgo", end_date: str = "today") -> Any:
-                                cache_key = f"run_report:{property_id}:{dimensions}:{metrics}:{start_date}:{end_date}"
-                                if cache_key in utm_ctx["tool_cache"]:
-                                    return utm_ctx["tool_cache"][cache_key]
-                                result = ga4_mcp_tools.run_report(property_id, dimensions, metrics, [{"start_date": start_date, "end_date": end_date}], creds)
-                                utm_ctx["tool_cache"][cache_key] = result
-                                return result
-
-                            def tool_run_realtime_report(property_id: str, dimensions: List[str], metrics: List[str]) -> Any:
-                                return ga4_mcp_tools.run_realtime_report(property_id, dimensions, metrics, creds)
-
-                            def tool_list_ads_links(property_id: str) -> Any:
-                                return ga4_mcp_tools.list_google_ads_links(property_id, creds)
-
-                            def tool_guess_property_from_url(destination_url: str) -> Dict[str, Any]:
-                                cache_key = f"guess_property:{destination_url}"
-                                if cache_key in utm_ctx["tool_cache"]:
-                                    return utm_ctx["tool_cache"][cache_key]
-                                url = _normalize_destination_url(destination_url)
-                                host = urlparse(url).netloc.lower().replace("www.", "")
-                                host_root = host.split(":")[0]
-                                summaries = ga4_mcp_tools.get_account_summaries(creds)
-                                props = []
-                                if isinstance(summaries, dict):
-                                    for k in ["propertySummaries", "properties", "items", "data"]:
-                                        if k in summaries and isinstance(summaries[k], list):
-                                            props = summaries[k]
-                                            break
-                                    if not props and "accountSummaries" in summaries:
-                                        for acc in summaries["accountSummaries"]:
-                                            ps = acc.get("propertySummaries") or []
-                                            if isinstance(ps, list):
-                                                props.extend(ps)
-                                elif isinstance(summaries, list):
-                                    for acc in summaries:
-                                        ps = acc.get("propertySummaries") or []
-                                        if isinstance(ps, list):
-                                            props.extend(ps)
-
-                                candidates = []
-                                for p in props:
-                                    display = (p.get("displayName") or p.get("name") or "").lower()
-                                    pid = ""
-                                    m = re.search(r"properties/(\d+)", p.get("name") or "")
-                                    if m:
-                                        pid = m.group(1)
-                                    score = 0
-                                    if host_root and host_root in display:
-                                        score += 3
-                                    candidates.append(
-                                        {"property_id": pid, "display_name": p.get("displayName"), "score": score}
-                                    )
-
-                                candidates.sort(key=lambda x: x["score"], reverse=True)
-                                result = {"candidates": candidates[:5], "domain": host_root}
-                                utm_ctx["tool_cache"][cache_key] = result
-                                return result
-
-                            my_tools = [
-                                tool_list_properties,
-                                tool_get_metadata,
-                                tool_run_report,
-                                tool_run_realtime_report,
-                                tool_list_ads_links,
-                                tool_guess_property_from_url,
-                            ]
-
-                            # Auto-select GA4 property from destination URL without asking user confirmation
-                            try:
-                                dest_url = utm_ctx["params"].get("destination_url")
-                                if dest_url and not utm_ctx.get("ga4_property_id"):
-                                    guessed = tool_guess_property_from_url(dest_url)
-                                    candidates = guessed.get("candidates", []) if isinstance(guessed, dict) else []
-                                    if candidates:
-                                        best = sorted(
-                                            candidates,
-                                            key=lambda x: (x.get("score", 0), bool(x.get("property_id"))),
-                                            reverse=True
-                                        )[0]
-                                        best_pid = best.get("property_id")
-                                        if best_pid:
-                                            utm_ctx["ga4_property_id"] = best_pid
-                            except Exception:
-                                pass
-
-                            # --- Dynamic system instruction ---
-                            current_date = datetime.now().strftime("%Y-%m-%d")
-                            system_instruction = _build_system_instruction(utm_ctx, current_date)
-
-                            # --- History ---
-                            history = []
-                            for msg in st.session_state.messages:
-                                if msg == st.session_state.messages[-1]:
-                                    continue
-                                role = "user" if msg["role"] == "user" else "model"
-                                text = msg.get("raw_content", msg["content"])
-                                history.append({"role": role, "parts": [text]})
-
-                            response_text, _ = get_gemini_response_safe(
-                                pending_text,
-                                history,
-                                my_tools,
-                                system_instruction,
-                                api_key,
-                            )
-                            cleaned = clean_bot_response(response_text)
-
-                            st.session_state.messages.append(
-                                {
-                                    "role": "assistant",
-                                    "content": cleaned,
-                                    "raw_content": response_text,
-                                }
-                            )
-
-                            # Update conversation context
-                            _update_context_from_response(response_text, pending_text, utm_ctx)
-
-                            # Salva automaticamente nello storico UTM, se disponibile un link finale.
-                            if callable(history_save_func):
-                                try:
-                                    final_url = _extract_first_url(cleaned or "")
-                                    if final_url and "utm_" in final_url:
-                                        # Retry auto-selezione property se ancora mancante
-                                        # usando prima URL di destinazione, poi URL finale.
-                                        if not utm_ctx.get("ga4_property_id"):
-                                            try:
-                                                guess_url = utm_ctx["params"].get("destination_url") or final_url
-                                                guessed = tool_guess_property_from_url(guess_url)
-                                                candidates = guessed.get("candidates", []) if isinstance(guessed, dict) else []
-                                                if candidates:
-                                                    best = sorted(
-                                                        candidates,
-                                                        key=lambda x: (x.get("score", 0), bool(x.get("property_id"))),
-                                                        reverse=True
-                                                    )[0]
-                                                    best_pid = best.get("property_id")
-                                                    if best_pid:
-                                                        utm_ctx["ga4_property_id"] = best_pid
-                                            except Exception:
-                                                pass
-                                        saved = history_save_func(
-                                            final_url,
-                                            utm_ctx.get("ga4_property_id") or ""
-                                        )
-                                        if saved:
-                                            if hasattr(st, "toast"):
-                                                st.toast("Link salvato nello storico UTM", icon="✅")
-                                            else:
-                                                st.success("Link salvato nello storico UTM.")
-                                except Exception:
-                                    pass
-
-                except Exception as e:
-                    st.session_state.messages.append({"role": "assistant", "content": f"Errore: {str(e)}"})
-                finally:
-                    st.session_state.chat_is_responding = False
-                    st.session_state.pending_user_text = None
-
-                st.rerun()
+    # 3. POLLING DEL JOB IN BACKGROUND
+    if st.session_state.chat_job_id:
+        if hasattr(st, "fragment"):
+            _chat_job_poller()
+        else:
+            time.sleep(CHAT_POLL_INTERVAL_SECONDS)
+            st.rerun()
@@ -0,0 +1,175 @@
+"""
+Credenziali Google della sessione con refresh anticipato in background.
+
+Ogni sessione tiene un solo oggetto Credentials (CredentialManager in
+st.session_state): lo stesso oggetto va ai client GA4 in pool di ga4_mcp_tools,
+al registro di tracking_monitor e ai thread del chatbot. Un thread daemon per
+processo rinnova l'access token REFRESH_AHEAD_SECONDS prima della scadenza e il
+refresh aggiorna l'oggetto sul posto, quindi nessuna richiesta dell'utente
+aspetta il token endpoint. Il refresh sincrono resta solo come ripiego, quando
+il token è già scaduto (es. worker appena riavviato).
+"""
+import logging
+import threading
+import time
+import weakref
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional
+
+from google.oauth2.credentials import Credentials
+
+logger = logging.getLogger(__name__)
+
+# Margine sopra la soglia di google-auth (3m45s): i client non vedono mai un token "scaduto"
+REFRESH_AHEAD_SECONDS = 10 * 60
+CHECK_INTERVAL_SECONDS = 30
+RETRY_SECONDS = 60
+
+# id_token serve a googleapi.get_user_email per leggere l'email senza chiamate di rete
+INFO_FIELDS = ("token", "refresh_token", "id_token", "token_uri", "client_id", "client_secret", "scopes")
+
+
+def _utcnow() -> datetime:
+    # google-auth usa datetime UTC naive per expiry
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+class CredentialManager:
+    """Un oggetto Credentials per sessione, rinnovato sul posto (thread-safe)."""
+
+    def __init__(self, credentials: Credentials):
+        self.credentials = credentials
+        self.last_refresh_at: Optional[datetime] = None
+        self.last_error: Optional[str] = None
+        self._next_attempt = 0.0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_info(cls, info: Dict[str, Any]) -> "CredentialManager":
+        """Ricostruisce le credenziali dal dict salvato in st.session_state.google_credentials."""
+        expiry = info.get("expiry")
+        credentials = Credentials(
+            **{field: info.get(field) for field in INFO_FIELDS},
+            expiry=datetime.fromisoformat(expiry) if expiry else None,
+        )
+        return cls(credentials)
+
+    def to_info(self) -> Dict[str, Any]:
+        """Valori scalari, compatibili con JSON, per st.session_state."""
+        info = {field: getattr(self.credentials, field, None) for field in INFO_FIELDS}
+        expiry = self.credentials.expiry
+        info["expiry"] = expiry.isoformat() if expiry else None
+        return info
+
+    def seconds_to_expiry(self) -> Optional[float]:
+        expiry = self.credentials.expiry
+        return (expiry - _utcnow()).total_seconds() if expiry else None
+
+    def can_refresh(self) -> bool:
+        return bool(self.credentials.refresh_token)
+
+    def needs_refresh(self, margin: float = REFRESH_AHEAD_SECONDS) -> bool:
+        """Token assente, scaduto o in scadenza entro `margin` secondi."""
+        if not self.credentials.token:
+            return True
+        remaining = self.seconds_to_expiry()
+        if remaining is None:
+            # Scadenza ignota (dict salvati prima che contenessero expiry): un refresh la rende nota
+            return self.can_refresh()
+        return remaining <= margin
+
+    def refresh(self, force: bool = False) -> bool:
+        """Rinnova il token se serve (o sempre con force). Ritorna False se il refresh è fallito."""
+        from google.auth.transport.requests import Request
+
+        with self._lock:
+            # Un altro thread può averlo già rinnovato mentre si aspettava il lock
+            if not force and not self.needs_refresh():
+                return True
+            if not self.can_refresh():
+                return not self.needs_refresh(margin=0)
+            try:
+                self.credentials.refresh(Request())
+            except Exception as e:
+                self.last_error = f"{type(e).__name__}: {e}"
+                self._next_attempt = time.monotonic() + RETRY_SECONDS
+                logger.warning("Refresh delle credenziali fallito: %s", self.last_error)
+                return False
+            self.last_refresh_at = _utcnow()
+            self.last_error = None
+            return True
+
+    def ensure_valid(self) -> bool:
+        """Sul percorso della richiesta: blocca solo se il token è già inutilizzabile."""
+        if self.credentials.valid:
+            return True
+        return self.refresh()
+
+    def refresh_due(self) -> bool:
+        return self.can_refresh() and self.needs_refresh() and time.monotonic() >= self._next_attempt
+
+
+_managers = weakref.WeakSet()  # le sessioni chiuse escono da sole insieme a st.session_state
+_managers_lock = threading.Lock()
+
+
+def register(manager: CredentialManager) -> CredentialManager:
+    """Affida il manager al refresher del processo (avviato al primo uso)."""
+    with _managers_lock:
+        _managers.add(manager)
+    ensure_started()
+    return manager
+
+
+def unregister(manager: Optional[CredentialManager]) -> None:
+    """Al logout: niente più refresh e client GA4 in pool rilasciati."""
+    if manager is None:
+        return
+    with _managers_lock:
+        _managers.discard(manager)
+    import ga4_mcp_tools
+
+    ga4_mcp_tools.release_clients(manager.credentials)
+
+
+def refresh_due_credentials() -> int:
+    """Rinnova le credenziali registrate in scadenza. Ritorna quante sono state rinnovate."""
+    with _managers_lock:
+        due = [m for m in _managers if m.refresh_due()]
+    return sum(1 for m in due if m.refresh())
+
+
+class CredentialRefresher:
+    """Thread daemon che controlla le scadenze ogni CHECK_INTERVAL_SECONDS."""
+
+    def __init__(self):
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._loop, name="credential-refresher", daemon=True)
+
+    def start(self) -> "CredentialRefresher":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _loop(self) -> None:
+        while not self._stop.is_set():
+            try:
+                refresh_due_credentials()
+            except Exception:
+                logger.exception("Credential refresher: giro fallito")
+            self._stop.wait(CHECK_INTERVAL_SECONDS)
+
+
+_refresher: Optional[CredentialRefresher] = None
+_refresher_lock = threading.Lock()
+
+
+def ensure_started() -> CredentialRefresher:
+    """Avvia il refresher una sola volta per processo."""
+    global _refresher
+    with _refresher_lock:
+        if _refresher is None:
+            _refresher = CredentialRefresher().start()
+        return _refresher
@@ -1,4 +1,12 @@
 import os
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+import call_recorder
+import ga4_quota
+import ga4_scheduler
+import googleapi
 from google.analytics.admin import AnalyticsAdminServiceClient
 from google.analytics.data import BetaAnalyticsDataClient
 from google.analytics.data_v1beta.types import (
@@ -8,42 +16,188 @@ from google.analytics.data_v1beta.types import (
     Metric, 
     Dimension,
     FilterExpression,
-    Filter
+    Filter,
+    MetricAggregation,
+    OrderBy,
 )
 
+# --- CLIENT ---
+# GA4_API_ENDPOINT dirotta entrambe le API su un altro host via REST, es. lo stand-in
+# locale (python ga4_standin.py) usato per i benchmark end-to-end senza una property reale.
+GA4_API_ENDPOINT_ENV = "GA4_API_ENDPOINT"
+
+def _client_kwargs(creds):
+    endpoint = os.environ.get(GA4_API_ENDPOINT_ENV, "").strip()
+    if not endpoint:
+        return {"credentials": creds}
+    if creds is None:
+        from google.auth.credentials import AnonymousCredentials
+        creds = AnonymousCredentials()
+    return {"credentials": creds, "transport": "rest", "client_options": {"api_endpoint": endpoint}}
+
+# --- POOL DEI CLIENT ---
+# Un client per (API, oggetto credenziali, endpoint), riusato tra le chiamate: trasporto e
+# connessioni si costruiscono una volta per sessione. Ogni sessione tiene un solo oggetto
+# Credentials aggiornato sul posto (credential_manager), quindi i client nel pool inviano
+# sempre il token corrente. LRU limitata; credential_manager li rilascia al logout.
+MAX_POOLED_CLIENTS = 64
+
+_client_pool = OrderedDict()  # (api, id(creds), endpoint) -> (creds, client)
+_client_pool_lock = threading.Lock()
+
+def _pooled_client(api, client_class, creds):
+    key = (api, id(creds), os.environ.get(GA4_API_ENDPOINT_ENV, "").strip())
+    with _client_pool_lock:
+        pooled = _client_pool.get(key)
+        # Il controllo di identità evita il riuso di id() dopo che un oggetto credenziali è stato raccolto
+        if pooled and pooled[0] is creds:
+            _client_pool.move_to_end(key)
+            return pooled[1]
+    client = client_class(**_client_kwargs(creds))
+    with _client_pool_lock:
+        _client_pool[key] = (creds, client)
+        _client_pool.move_to_end(key)
+        while len(_client_pool) > MAX_POOLED_CLIENTS:
+            _client_pool.popitem(last=False)
+    return client
+
+def release_clients(creds=None):
+    """Elimina i client nel pool di un oggetto credenziali (o tutti se creds è None)."""
+    with _client_pool_lock:
+        for key in [k for k, (c, _) in _client_pool.items() if creds is None or c is creds]:
+            del _client_pool[key]
+
+def _data_client(creds):
+    return _pooled_client("data", BetaAnalyticsDataClient, creds)
+
+def _admin_client(creds):
+    return _pooled_client("admin", AnalyticsAdminServiceClient, creds)
+
+# --- CACHE DEGLI ACCOUNT SUMMARIES ---
+# L'albero degli account cambia di rado ma lo chiedono il builder, la diagnostica
+# nelle impostazioni e i tool del chatbot: se ne tiene una copia per utente per un po'.
+ACCOUNT_SUMMARIES_TTL_SECONDS = 15 * 60
+ACCOUNT_SUMMARIES_PAGE_SIZE = 200  # massimo dell'Admin API
+
+_account_summaries_cache = {}
+_account_summaries_lock = threading.Lock()
+
+def creds_cache_key(creds):
+    """
+    Chiave di cache stabile per utente (client_id + utente dell'ID token o refresh token),
+    senza conservare i token in chiaro. None se l'utente non è identificabile: il token di
+    accesso cambia a ogni rinnovo e non può fare da chiave, quindi in quel caso non si usa cache.
+    """
+    user = googleapi.get_user_identity(creds) or getattr(creds, "refresh_token", None)
+    if not user:
+        return None
+    client_id = getattr(creds, "client_id", None) or ""
+    return hashlib.sha256(f"{client_id}:{user}".encode("utf-8")).hexdigest()
+
+def invalidate_account_summaries(creds=None):
+    """Elimina l'albero degli account in cache per un utente (o per tutti se creds è None)."""
+    with _account_summaries_lock:
+        if creds is None:
+            _account_summaries_cache.clear()
+        else:
+            _account_summaries_cache.pop(creds_cache_key(creds), None)
+
+# --- CONTATORE RICHIESTE ---
+# Chiamate alle API GA4 fatte dal thread corrente (es. un turno chatbot nel suo worker):
+# le conta ga4_scheduler.call a ogni tentativo, retry compresi.
+
+def reset_ga4_request_count():
+    ga4_scheduler.reset_attempt_count()
+
+def get_ga4_request_count():
+    return ga4_scheduler.get_attempt_count()
+
+def _error_result(e):
+    """Errore restituito dai tool; quelli transitori sono marcati per non essere letti come 'nessun dato'."""
+    result = {"error": str(e), "error_type": type(e).__name__}
+    if isinstance(e, ga4_scheduler.GA4TransientError):
+        result["retryable"] = True
+    return result
+
+# --- ESECUZIONE DEI REPORT ---
+# Ogni report chiede a GA4 la quota della property, così il consumo viene contato in ga4_quota,
+# e passa da ga4_scheduler (rate limit per property + retry degli errori transitori).
+# Le funzioni che vanno in rete sono @recordable (vedi call_recorder: CALL_RECORDER_MODE).
+
+@call_recorder.recordable("ga4_run_report", ignore=("creds", "background"))
+def run_report_request(request, creds, background=False):
+    """Esegue una RunReportRequest già preparata e registra la quota della property. Solleva gli errori delle API."""
+    client = _data_client(creds)
+    request.return_property_quota = True
+    response = ga4_scheduler.call(request.property, client.run_report, request, background=background)
+    ga4_quota.record_property_quota(request.property, response.property_quota)
+    return response
+
+@call_recorder.recordable("ga4_run_realtime_report", ignore=("creds", "background"))
+def run_realtime_report_request(request, creds, background=False):
+    """Esegue una RunRealtimeReportRequest già preparata e registra la quota realtime della property. Solleva gli errori delle API."""
+    client = _data_client(creds)
+    request.return_property_quota = True
+    response = ga4_scheduler.call(
+        request.property, client.run_realtime_report, request, background=background, quota_kind="realtime"
+    )
+    ga4_quota.record_property_quota(request.property, response.property_quota, kind="realtime")
+    return response
+
 # --- TOOLS IMPLEMENTATION ---
 
-def get_account_summaries(creds):
-    """Retrieves accessable accounts and properties."""
+@call_recorder.recordable("ga4_account_summaries")
+def _fetch_account_summaries(creds):
+    client = _admin_client(creds)
+    summaries = []
+    pager = client.list_account_summaries(request={"page_size": ACCOUNT_SUMMARIES_PAGE_SIZE})
+    for account in pager:
+        acc_data = {
+            "account_name": account.account, # format: accounts/xxx
+            "display_name": account.display_name,
+            "properties": []
+        }
+        for prop in account.property_summaries:
+            acc_data["properties"].append({
+                "property_id": prop.property, # format: properties/123
+                "display_name": prop.display_name
+            })
+        summaries.append(acc_data)
+    return summaries
+
+def get_account_summaries(creds, force_refresh=False):
+    """Retrieves accessable accounts and properties (cached per user, see ACCOUNT_SUMMARIES_TTL_SECONDS)."""
+    key = creds_cache_key(creds)
+    now = time.monotonic()
+    if key and not force_refresh:
+        with _account_summaries_lock:
+            cached = _account_summaries_cache.get(key)
+        if cached and now - cached[0] < ACCOUNT_SUMMARIES_TTL_SECONDS:
+            return cached[1]
     try:
-        client = AnalyticsAdminServiceClient(credentials=creds)
-        summaries = []
-        for account in client.list_account_summaries():
-            acc_data = {
-                "account_name": account.account, # properties/xxx/accountSummaries/yyy ? No, format is accountSummaries/xxx
-                "display_name": account.display_name,
-                "properties": []
-            }
-            for prop in account.property_summaries:
-                acc_data["properties"].append({
-                    "property_id": prop.property, # format: properties/123
-                    "display_name": prop.display_name
-                })
-            summaries.append(acc_data)
-        return summaries
+        summaries = ga4_scheduler.call("admin", _fetch_account_summaries, creds)
     except Exception as e:
-        return {"error": str(e), "error_type": type(e).__name__}
+        return _error_result(e)
+    with _account_summaries_lock:
+        # Elimina le voci scadute: la cache resta limitata agli utenti attivi
+        expired = [k for k, (ts, _) in _account_summaries_cache.items() if now - ts >= ACCOUNT_SUMMARIES_TTL_SECONDS]
+        for k in expired:
+            del _account_summaries_cache[k]
+        if key:
+            _account_summaries_cache[key] = (now, summaries)
+    return summaries
 
+@call_recorder.recordable("ga4_property_details")
 def get_property_details(property_id, creds):
     """Returns details about a property."""
     try:
-        client = AnalyticsAdminServiceClient(credentials=creds)
+        client = _admin_client(creds)
         # Note: property_id should be 'properties/123456'
         # Check format
         if not property_id.startswith("properties/"):
             property_id = f"properties/{property_id}"
             
-        repo = client.get_property(name=property_id)
+        repo = ga4_scheduler.call("admin", client.get_property, name=property_id)
         return {
             "name": repo.name,
             "display_name": repo.display_name,
@@ -53,17 +207,19 @@ def get_property_details(property_id, creds):
             "time_zone": repo.time_zone
         }
     except Exception as e:
-        return {"error": str(e), "error_type": type(e).__name__}
+        return _error_result(e)
 
+@call_recorder.recordable("ga4_google_ads_links")
 def list_google_ads_links(property_id, creds):
     """Lists Google Ads links for a property."""
     try:
-        client = AnalyticsAdminServiceClient(credentials=creds)
+        client = _admin_client(creds)
         if not property_id.startswith("properties/"):
             property_id = f"properties/{property_id}"
             
         links = []
-        for link in client.list_google_ads_links(parent=property_id):
+        ads_links = ga4_scheduler.call("admin", lambda: list(client.list_google_ads_links(parent=property_id)))
+        for link in ads_links:
             links.append({
                 "name": link.name,
                 "customer_id": link.customer_id,
@@ -71,12 +227,96 @@ def list_google_ads_links(property_id, creds):
             })
         return links
     except Exception as e:
-        return {"error": str(e), "error_type": type(e).__name__}
+        return _error_result(e)
+
+@call_recorder.recordable("ga4_web_data_streams")
+def list_web_data_streams(property_id, creds):
+    """Elenca i data stream web di una property con i loro measurement ID (G-...)."""
+    try:
+        client = _admin_client(creds)
+        if not property_id.startswith("properties/"):
+            property_id = f"properties/{property_id}"
+
+        data_streams = ga4_scheduler.call("admin", lambda: list(client.list_data_streams(parent=property_id)))
+        return [
+            {
+                "name": stream.name,
+                "display_name": stream.display_name,
+                "measurement_id": stream.web_stream_data.measurement_id,
+                "default_uri": stream.web_stream_data.default_uri,
+            }
+            for stream in data_streams
+            if stream.web_stream_data.measurement_id
+        ]
+    except Exception as e:
+        return _error_result(e)
+
+@call_recorder.recordable("ga4_metadata")
+def get_metadata(property_id, creds):
+    """Elenca dimensioni e metriche disponibili per una property, definizioni custom comprese. Solleva gli errori delle API."""
+    client = _data_client(creds)
+    if not property_id.startswith("properties/"):
+        property_id = f"properties/{property_id}"
+
+    metadata = ga4_scheduler.call(property_id, client.get_metadata, name=f"{property_id}/metadata")
+    return {
+        "dimensions": [
+            {
+                "api_name": d.api_name,
+                "ui_name": d.ui_name,
+                "category": d.category,
+                "custom": d.custom_definition,
+                "deprecated_api_names": list(d.deprecated_api_names),
+            }
+            for d in metadata.dimensions
+        ],
+        "metrics": [
+            {
+                "api_name": m.api_name,
+                "ui_name": m.ui_name,
+                "category": m.category,
+                "custom": m.custom_definition,
+                "deprecated_api_names": list(m.deprecated_api_names),
+                "type": m.type_.name,
+            }
+            for m in metadata.metrics
+        ],
+    }
+
+# --- RISULTATI COMPATTI DEI REPORT ---
+# I tool di report restituiscono una tabella a colonne invece di un dict per riga: i nomi
+# delle colonne si inviano una volta, le metriche sono numeri, le righe sono le prime N per
+# la prima metrica e row_count/totals descrivono l'intero risultato, così il modello sa
+# cosa è rimasto fuori.
+
+def _metric_number(value):
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return value
+    return int(number) if number.is_integer() else round(number, 4)
+
+def _report_table(response, dimensions, metrics):
+    rows = [
+        [d.value for d in row.dimension_values] + [_metric_number(m.value) for m in row.metric_values]
+        for row in response.rows
+    ]
+    table = {
+        "columns": list(dimensions) + list(metrics),
+        "rows": rows,
+        "row_count": response.row_count,
+        "more_available": response.row_count > len(rows),
+    }
+    if response.totals:
+        table["totals"] = {m: _metric_number(v.value) for m, v in zip(metrics, response.totals[0].metric_values)}
+    return table
+
+def _top_rows_order(metrics):
+    return [OrderBy(metric=OrderBy.MetricOrderBy(metric_name=metrics[0]), desc=True)] if metrics else []
 
 def run_report(property_id, dimensions, metrics, date_ranges, creds, limit=10):
-    """Runs a standard GA4 report."""
+    """Runs a standard GA4 report. Returns a compact table (see _report_table) or an error payload."""
     try:
-        client = BetaAnalyticsDataClient(credentials=creds)
         if not property_id.startswith("properties/"):
             property_id = f"properties/{property_id}"
 
@@ -90,29 +330,19 @@ def run_report(property_id, dimensions, metrics, date_ranges, creds, limit=10):
             dimensions=dim_objs,
             metrics=met_objs,
             date_ranges=date_objs,
+            order_bys=_top_rows_order(metrics),
+            metric_aggregations=[MetricAggregation.TOTAL] if metrics else [],
             limit=limit
         )
         
-        response = client.run_report(request)
-        
-        # Format output as list of dicts
-        result = []
-        for row in response.rows:
-            item = {}
-            for i, d_val in enumerate(row.dimension_values):
-                item[dimensions[i]] = d_val.value
-            for i, m_val in enumerate(row.metric_values):
-                item[metrics[i]] = m_val.value
-            result.append(item)
-            
-        return result
+        response = run_report_request(request, creds)
+        return _report_table(response, dimensions, metrics)
     except Exception as e:
-        return {"error": str(e), "error_type": type(e).__name__}
+        return _error_result(e)
 
 def run_realtime_report(property_id, dimensions, metrics, creds, limit=10):
-    """Runs a realtime GA4 report."""
+    """Runs a realtime GA4 report. Returns a compact table (see _report_table) or an error payload."""
     try:
-        client = BetaAnalyticsDataClient(credentials=creds)
         if not property_id.startswith("properties/"):
             property_id = f"properties/{property_id}"
 
@@ -123,20 +353,12 @@ def run_realtime_report(property_id, dimensions, metrics, creds, limit=10):
             property=property_id,
             dimensions=dim_objs,
             metrics=met_objs,
+            order_bys=_top_rows_order(metrics),
+            metric_aggregations=[MetricAggregation.TOTAL] if metrics else [],
             limit=limit
         )
         
-        response = client.run_realtime_report(request)
-        
-        result = []
-        for row in response.rows:
-            item = {}
-            for i, d_val in enumerate(row.dimension_values):
-                item[dimensions[i]] = d_val.value
-            for i, m_val in enumerate(row.metric_values):
-                item[metrics[i]] = m_val.value
-            result.append(item)
-            
-        return result
+        response = run_realtime_report_request(request, creds)
+        return _report_table(response, dimensions, metrics)
     except Exception as e:
-        return {"error": str(e), "error_type": type(e).__name__}
+        return _error_result(e)
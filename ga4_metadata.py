@@ -0,0 +1,234 @@
+"""
+Metadata di dimensioni/metriche per property e pre-validazione locale dei report.
+
+Il chatbot costruisce le chiamate run_report con nomi liberi ("source", "ga:sessions",
+"Sessions", una metrica passata come dimensione...). Inviarli così costa un round trip
+GA4 più un altro passo del modello per leggere l'errore e riprovare. Qui i nomi vengono
+controllati sui metadata della property (getMetadata della Data API, in cache per
+property per METADATA_TTL_SECONDS, definizioni custom comprese) prima che la richiesta
+parta: gli errori non ambigui vengono corretti, il resto viene rifiutato con dei
+suggerimenti. La cache dei metadata è per utente (ga4_mcp_tools.creds_cache_key): le
+definizioni custom di una property non vengono servite a chi non vi ha accesso. Anche le
+risposte di compatibilità ricavate dai report reali restano in
+cache, così una combinazione già rifiutata da GA4 non viene reinviata.
+
+Se i metadata non si possono caricare la richiesta passa invariata.
+"""
+import difflib
+import logging
+import re
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+METADATA_TTL_SECONDS = 6 * 60 * 60
+COMPATIBILITY_TTL_SECONDS = 24 * 60 * 60
+MAX_COMPATIBILITY_ENTRIES = 5000
+# Limiti della Data API per un singolo report
+MAX_DIMENSIONS = 9
+MAX_METRICS = 10
+FUZZY_CUTOFF = 0.85
+SUGGESTION_CUTOFF = 0.6
+
+# Nomi Universal Analytics e abbreviati, per nome normalizzato (vedi _normalize)
+ALIASES = {
+    "source": "sessionSource",
+    "medium": "sessionMedium",
+    "campaign": "sessionCampaignName",
+    "campaignname": "sessionCampaignName",
+    "sourcemedium": "sessionSourceMedium",
+    "channel": "sessionDefaultChannelGroup",
+    "channelgroup": "sessionDefaultChannelGroup",
+    "channelgrouping": "sessionDefaultChannelGroup",
+    "defaultchannelgroup": "sessionDefaultChannelGroup",
+    "defaultchannelgrouping": "sessionDefaultChannelGroup",
+    "primarychannelgroup": "sessionPrimaryChannelGroup",
+    "landingpage": "landingPagePlusQueryString",
+    "pagepath": "pagePath",
+    "users": "totalUsers",
+    "pageviews": "screenPageViews",
+    "views": "screenPageViews",
+    "revenue": "totalRevenue",
+    "goalcompletionsall": "keyEvents",
+    "conversions": "keyEvents",
+}
+
+_metadata_cache = {}  # (utente, property) -> (caricato alle, catalogo)
+_metadata_lock = threading.Lock()
+_compatibility_cache = {}  # (property, dimensioni, metriche) -> (verificato alle, compatibile, messaggio)
+_compatibility_lock = threading.Lock()
+
+
+def _property_key(property_id):
+    return str(property_id or "").replace("properties/", "")
+
+
+def _normalize(name):
+    name = str(name or "").strip()
+    if name.lower().startswith("ga:"):
+        name = name[3:]
+    return re.sub(r"[^a-z0-9:]", "", name.lower())
+
+
+def _build_catalog(metadata):
+    catalog = {}
+    for kind in ("dimensions", "metrics"):
+        names, normalized, deprecated = set(), {}, {}
+        for field in metadata.get(kind, []):
+            api_name = field["api_name"]
+            names.add(api_name)
+            normalized.setdefault(_normalize(api_name), api_name)
+            for old in field.get("deprecated_api_names", []):
+                deprecated[old] = api_name
+        catalog[kind] = {"names": names, "normalized": normalized, "deprecated": deprecated}
+    return catalog
+
+
+def get_catalog(property_id, creds, force_refresh=False):
+    """
+    Nomi di dimensioni/metriche della property, in cache per utente; None se i metadata non
+    si possono caricare. Senza un utente identificabile si rilegge ogni volta.
+    """
+    import ga4_mcp_tools
+
+    prop = _property_key(property_id)
+    if not prop:
+        return None
+    user = ga4_mcp_tools.creds_cache_key(creds)
+    key = (user, prop)
+    now = time.monotonic()
+    if user and not force_refresh:
+        with _metadata_lock:
+            cached = _metadata_cache.get(key)
+        if cached and now - cached[0] < METADATA_TTL_SECONDS:
+            return cached[1]
+    try:
+        catalog = _build_catalog(ga4_mcp_tools.get_metadata(prop, creds))
+    except Exception as e:
+        # Non in cache: il prossimo report riprova a caricarli
+        logger.info("Metadata GA4 non disponibili per la property %s: %s", prop, e)
+        return None
+    if user:
+        with _metadata_lock:
+            # Una copia per utente: le voci scadute si eliminano per non crescere con gli utenti passati
+            for k in [k for k, v in _metadata_cache.items() if now - v[0] >= METADATA_TTL_SECONDS]:
+                del _metadata_cache[k]
+            _metadata_cache[key] = (now, catalog)
+    return catalog
+
+
+def invalidate_metadata(property_id=None):
+    with _metadata_lock:
+        if property_id is None:
+            _metadata_cache.clear()
+        else:
+            prop = _property_key(property_id)
+            for key in [k for k in _metadata_cache if k[1] == prop]:
+                del _metadata_cache[key]
+
+
+def _resolve(name, entry):
+    """Nome API attuale di `name` in una sezione del catalogo, oppure None."""
+    if name in entry["names"]:
+        return name
+    if name in entry["deprecated"]:
+        return entry["deprecated"][name]
+    key = _normalize(name)
+    if key in entry["normalized"]:
+        return entry["normalized"][key]
+    alias = ALIASES.get(key)
+    if alias in entry["names"]:
+        return alias
+    close = difflib.get_close_matches(key, list(entry["normalized"]), n=1, cutoff=FUZZY_CUTOFF)
+    return entry["normalized"][close[0]] if close else None
+
+
+def _suggestions(name, entry, n=3):
+    close = difflib.get_close_matches(_normalize(name), list(entry["normalized"]), n=n, cutoff=SUGGESTION_CUTOFF)
+    return [entry["normalized"][k] for k in close]
+
+
+def _compatibility_key(property_id, dimensions, metrics):
+    return _property_key(property_id), tuple(sorted(dimensions)), tuple(sorted(metrics))
+
+
+def known_incompatibility(property_id, dimensions, metrics):
+    """Messaggio d'errore restituito da GA4 per questa combinazione, se è già stata rifiutata."""
+    key = _compatibility_key(property_id, dimensions, metrics)
+    with _compatibility_lock:
+        cached = _compatibility_cache.get(key)
+    if cached and time.monotonic() - cached[0] < COMPATIBILITY_TTL_SECONDS and not cached[1]:
+        return cached[2]
+    return None
+
+
+def record_compatibility(property_id, dimensions, metrics, compatible, message=""):
+    now = time.monotonic()
+    with _compatibility_lock:
+        if len(_compatibility_cache) >= MAX_COMPATIBILITY_ENTRIES:
+            for k in [k for k, v in _compatibility_cache.items() if now - v[0] >= COMPATIBILITY_TTL_SECONDS]:
+                del _compatibility_cache[k]
+            while len(_compatibility_cache) >= MAX_COMPATIBILITY_ENTRIES:
+                del _compatibility_cache[next(iter(_compatibility_cache))]
+        _compatibility_cache[_compatibility_key(property_id, dimensions, metrics)] = (now, compatible, message)
+
+
+def record_report_outcome(property_id, dimensions, metrics, result):
+    """Impara da un risultato di run_report: righe = compatibile, un errore di incompatibilità viene ricordato."""
+    if isinstance(result, dict) and "error" in result:
+        if result.get("error_type") in ("InvalidArgument", "BadRequest") and "incompatib" in result["error"].lower():
+            record_compatibility(property_id, dimensions, metrics, False, result["error"])
+        return
+    record_compatibility(property_id, dimensions, metrics, True)
+
+
+def prepare_report(property_id, dimensions, metrics, creds):
+    """
+    Controlla localmente una richiesta di report. Ritorna un dict con "dimensions" e
+    "metrics" (eventualmente corretti), le "corrections" applicate ({"from", "to", "reason"}),
+    gli "errors" (la richiesta non va inviata) e i "suggestions" per ogni nome sconosciuto.
+    """
+    dimensions = [str(d).strip() for d in (dimensions or []) if str(d).strip()]
+    metrics = [str(m).strip() for m in (metrics or []) if str(m).strip()]
+    checked = {"dimensions": dimensions, "metrics": metrics, "corrections": [], "errors": [], "suggestions": {}, "validated": False}
+
+    catalog = get_catalog(property_id, creds)
+    if catalog is not None:
+        resolved = {"dimensions": [], "metrics": []}
+        for kind, other in (("dimensions", "metrics"), ("metrics", "dimensions")):
+            for name in checked[kind]:
+                target_kind, api_name = kind, _resolve(name, catalog[kind])
+                if api_name is None:
+                    # Una metrica chiesta come dimensione (o viceversa) passa nella lista giusta
+                    api_name = _resolve(name, catalog[other])
+                    target_kind = other if api_name else kind
+                if api_name is None:
+                    checked["errors"].append(f"Unknown {kind[:-1]} '{name}'")
+                    suggestions = _suggestions(name, catalog[kind]) or _suggestions(name, catalog[other])
+                    if suggestions:
+                        checked["suggestions"][name] = suggestions
+                    continue
+                if api_name in resolved[target_kind]:
+                    if api_name != name:
+                        checked["corrections"].append({"from": name, "to": api_name, "reason": "duplicate removed"})
+                    continue
+                if api_name != name or target_kind != kind:
+                    reason = f"moved to {target_kind}" if target_kind != kind else "renamed"
+                    checked["corrections"].append({"from": name, "to": api_name, "reason": reason})
+                resolved[target_kind].append(api_name)
+        checked["dimensions"], checked["metrics"] = resolved["dimensions"], resolved["metrics"]
+        checked["validated"] = True
+
+    if not checked["errors"]:
+        if not checked["metrics"] and not checked["dimensions"]:
+            checked["errors"].append("At least one dimension or metric is required")
+        if len(checked["dimensions"]) > MAX_DIMENSIONS:
+            checked["errors"].append(f"At most {MAX_DIMENSIONS} dimensions per report")
+        if len(checked["metrics"]) > MAX_METRICS:
+            checked["errors"].append(f"At most {MAX_METRICS} metrics per report")
+    if not checked["errors"]:
+        incompatible = known_incompatibility(property_id, checked["dimensions"], checked["metrics"])
+        if incompatible:
+            checked["errors"].append(f"Already rejected by GA4: {incompatible}")
+    return checked
@@ -0,0 +1,169 @@
+"""
+Contabilità della quota delle property GA4.
+
+Ogni report chiede a GA4 la quota della property (`return_property_quota`): i token
+consumati da ogni richiesta vengono sommati per property in bucket orari e giornalieri,
+e si conserva il budget residuo indicato dall'ultima risposta, così la UI può mostrarlo
+e i job in background possono rallentare prima che GA4 inizi a rifiutare le richieste.
+"""
+import threading
+import time
+from datetime import datetime, timezone
+
+# Limiti delle property standard (le property GA4 360 hanno valori 10 volte maggiori)
+STANDARD_TOKENS_PER_HOUR = 40_000
+STANDARD_TOKENS_PER_DAY = 200_000
+STANDARD_TOKENS_PER_PROJECT_PER_HOUR = 14_000
+PREMIUM_FACTOR = 10
+
+# I job in background vanno a piena velocità sopra questa quota residua...
+BACKGROUND_FULL_SPEED_RATIO = 0.5
+# ...sotto rallentano linearmente, fino a questa attesa per richiesta...
+BACKGROUND_MAX_DELAY_SECONDS = 30.0
+# ...e sotto questa soglia vengono rimandati.
+BACKGROUND_STOP_RATIO = 0.05
+
+_quota_state = {}
+# Property viste con più token residui di quanti ne consenta un limite standard (GA4 360)
+_premium_properties = set()
+_quota_lock = threading.Lock()
+
+
+def _property_key(property_id):
+    return str(property_id or "").replace("properties/", "")
+
+
+def _limit(standard, premium):
+    return standard * PREMIUM_FACTOR if premium else standard
+
+
+def _current_state(key):
+    """Stato di una (property, kind), con i bucket di ora e giorno correnti. Da chiamare con _quota_lock."""
+    now = datetime.now(timezone.utc)
+    hour_key = now.strftime("%Y-%m-%d %H")
+    day_key = now.strftime("%Y-%m-%d")
+    state = _quota_state.setdefault(key, {
+        "hour": hour_key, "hour_consumed": 0, "hour_attempts": 0,
+        "day": day_key, "day_consumed": 0, "day_attempts": 0,
+    })
+    if state["hour"] != hour_key:
+        state["hour"], state["hour_consumed"], state["hour_attempts"] = hour_key, 0, 0
+    if state["day"] != day_key:
+        state["day"], state["day_consumed"], state["day_attempts"] = day_key, 0, 0
+    return state
+
+
+def record_attempt(property_id, kind="core", exhausted=False):
+    """
+    Conta un tentativo verso GA4, retry compresi (chiamato da ga4_scheduler.call).
+    Un errore di quota esaurita azzera il residuo orario finché la prossima risposta non
+    riporta il valore reale, così i job in background si fermano subito.
+    """
+    key = (_property_key(property_id), kind)
+    with _quota_lock:
+        state = _current_state(key)
+        state["hour_attempts"] += 1
+        state["day_attempts"] += 1
+        if exhausted:
+            state["hourly_remaining"] = 0
+            state["updated_at"] = time.time()
+
+
+def record_property_quota(property_id, property_quota, kind="core"):
+    """
+    Registra la PropertyQuota restituita con un report.
+    `kind` separa i report core da quelli realtime, che hanno una quota propria.
+    """
+    if not property_quota:
+        return
+    hour_status = property_quota.tokens_per_hour
+    day_status = property_quota.tokens_per_day
+    project_hour_status = property_quota.tokens_per_project_per_hour
+    consumed = int(hour_status.consumed or 0)
+
+    key = (_property_key(property_id), kind)
+    # Il tipo di property si ricorda una volta osservato: una 360 vicina al limite riporta meno
+    # del budget standard e, ricavandolo ogni volta, verrebbe valutata su quello.
+    premium = (
+        int(hour_status.remaining or 0) > STANDARD_TOKENS_PER_HOUR
+        or int(day_status.remaining or 0) > STANDARD_TOKENS_PER_DAY
+        or int(project_hour_status.remaining or 0) > STANDARD_TOKENS_PER_PROJECT_PER_HOUR
+    )
+    with _quota_lock:
+        if premium:
+            _premium_properties.add(key[0])
+        state = _current_state(key)
+        state["hour_consumed"] += consumed
+        state["day_consumed"] += consumed
+        state["hourly_remaining"] = int(hour_status.remaining or 0)
+        state["daily_remaining"] = int(day_status.remaining or 0)
+        state["project_hourly_remaining"] = int(project_hour_status.remaining or 0)
+        state["concurrent_remaining"] = int(property_quota.concurrent_requests.remaining or 0)
+        state["updated_at"] = time.time()
+
+
+def get_quota_status(property_id, kind="core"):
+    """
+    Token consumati e tentativi (retry compresi) nell'ora/giorno corrente e budget residuo
+    di una property, oppure None se in questo processo non è ancora stata fatta alcuna
+    richiesta su di essa. I residui mancano finché GA4 non ha restituito una quota.
+    """
+    with _quota_lock:
+        key = (_property_key(property_id), kind)
+        state = _quota_state.get(key)
+        if not state:
+            return None
+        status = dict(state)
+        status["premium"] = key[0] in _premium_properties
+    now = datetime.now(timezone.utc)
+    if status["hour"] != now.strftime("%Y-%m-%d %H"):
+        status["hour_consumed"] = status["hour_attempts"] = 0
+    if status["day"] != now.strftime("%Y-%m-%d"):
+        status["day_consumed"] = status["day_attempts"] = 0
+    status["remaining_ratio"] = _remaining_ratio(status)
+    return status
+
+
+def _remaining_ratio(status):
+    premium = status.get("premium", False)
+    ratios = []
+    for field, standard in (
+        ("hourly_remaining", STANDARD_TOKENS_PER_HOUR),
+        ("daily_remaining", STANDARD_TOKENS_PER_DAY),
+        ("project_hourly_remaining", STANDARD_TOKENS_PER_PROJECT_PER_HOUR),
+    ):
+        remaining = status.get(field)
+        if remaining is None:
+            continue
+        ratios.append(min(1.0, remaining / _limit(standard, premium)))
+    return min(ratios) if ratios else 1.0
+
+
+def remaining_ratio(property_id, kind="core"):
+    """Frazione (0..1) ancora disponibile della quota più stretta; 1.0 se non nota."""
+    status = get_quota_status(property_id, kind)
+    return status["remaining_ratio"] if status else 1.0
+
+
+def background_delay(property_id, kind="core"):
+    """
+    Secondi che un job in background deve attendere prima della prossima richiesta sulla
+    property, oppure None quando il budget è troppo basso e il job va rimandato.
+    """
+    ratio = remaining_ratio(property_id, kind)
+    if ratio >= BACKGROUND_FULL_SPEED_RATIO:
+        return 0.0
+    if ratio < BACKGROUND_STOP_RATIO:
+        return None
+    span = BACKGROUND_FULL_SPEED_RATIO - BACKGROUND_STOP_RATIO
+    return round(BACKGROUND_MAX_DELAY_SECONDS * (BACKGROUND_FULL_SPEED_RATIO - ratio) / span, 2)
+
+
+def throttle_background(property_id, kind="core"):
+    """Attende quanto serve prima di una richiesta in background. False se la richiesta va rimandata."""
+    delay = background_delay(property_id, kind)
+    if delay is None:
+        return False
+    if delay:
+        time.sleep(delay)
+    return True
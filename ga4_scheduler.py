@@ -0,0 +1,136 @@
+"""
+Scheduler condiviso delle chiamate alle API GA4.
+
+Ogni chiamata è associata a una property (le chiamate Admin API condividono la chiave
+"admin") e passa da un token bucket e da un limite di concorrenza per quella chiave.
+Gli errori gRPC transitori (RESOURCE_EXHAUSTED, UNAVAILABLE, DEADLINE_EXCEEDED, ...)
+vengono ritentati con backoff esponenziale e jitter completo; se persistono il chiamante
+riceve una GA4TransientError, così "riprova più tardi" non si confonde mai con "nessun dato".
+"""
+import random
+import threading
+import time
+
+from google.api_core import exceptions as api_exceptions
+
+import ga4_quota
+
+REQUESTS_PER_SECOND = 5.0
+BURST = 10
+MAX_CONCURRENT_PER_PROPERTY = 4
+
+FOREGROUND_MAX_ATTEMPTS = 4
+FOREGROUND_MAX_BACKOFF_SECONDS = 8.0
+BACKGROUND_MAX_ATTEMPTS = 6
+BACKGROUND_MAX_BACKOFF_SECONDS = 60.0
+BASE_BACKOFF_SECONDS = 0.5
+
+RETRYABLE_EXCEPTIONS = (
+    api_exceptions.TooManyRequests,  # comprende ResourceExhausted
+    api_exceptions.ServiceUnavailable,
+    api_exceptions.DeadlineExceeded,
+    api_exceptions.GatewayTimeout,
+    api_exceptions.InternalServerError,
+    api_exceptions.Aborted,
+)
+
+
+class GA4TransientError(Exception):
+    """GA4 è momentaneamente non disponibile o senza quota: la richiesta va ripetuta più tardi."""
+
+
+class _TokenBucket:
+    def __init__(self, rate, capacity):
+        self._rate = rate
+        self._capacity = capacity
+        self._tokens = float(capacity)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self._capacity, self._tokens + (now - self._last) * self._rate)
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self._rate
+            time.sleep(wait)
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+# Tentativi verso GA4 del thread corrente (es. un turno chatbot nel suo worker), retry compresi
+_attempt_counter = threading.local()
+
+
+def reset_attempt_count():
+    _attempt_counter.count = 0
+
+
+def get_attempt_count():
+    return getattr(_attempt_counter, "count", 0)
+
+
+def _property_key(property_id):
+    return str(property_id or "").replace("properties/", "") or "admin"
+
+
+def _get_limiter(key):
+    with _limiters_lock:
+        limiter = _limiters.get(key)
+        if limiter is None:
+            limiter = {
+                "bucket": _TokenBucket(REQUESTS_PER_SECOND, BURST),
+                "semaphore": threading.BoundedSemaphore(MAX_CONCURRENT_PER_PROPERTY),
+            }
+            _limiters[key] = limiter
+        return limiter
+
+
+def is_retryable(exc):
+    return isinstance(exc, RETRYABLE_EXCEPTIONS)
+
+
+def backoff_delay(attempt, max_backoff=FOREGROUND_MAX_BACKOFF_SECONDS):
+    """Backoff esponenziale con jitter completo per il tentativo indicato (da 0)."""
+    return random.uniform(0, min(max_backoff, BASE_BACKOFF_SECONDS * (2 ** attempt)))
+
+
+def call(property_id, fn, *args, background=False, quota_kind="core", **kwargs):
+    """
+    Esegue `fn(*args, **kwargs)` col rate limit della property, ritentando gli errori transitori.
+    Le chiamate in background attendono di più tra un tentativo e l'altro e vengono rimandate
+    (GA4TransientError) quando ga4_quota segnala che il budget `quota_kind` della property sta finendo.
+    Ogni tentativo viene contato (get_attempt_count e, per le property, ga4_quota.record_attempt).
+    """
+    key = _property_key(property_id)
+    limiter = _get_limiter(key)
+    max_attempts = BACKGROUND_MAX_ATTEMPTS if background else FOREGROUND_MAX_ATTEMPTS
+    max_backoff = BACKGROUND_MAX_BACKOFF_SECONDS if background else FOREGROUND_MAX_BACKOFF_SECONDS
+
+    for attempt in range(max_attempts):
+        if background and key != "admin" and not ga4_quota.throttle_background(key, quota_kind):
+            raise GA4TransientError(f"Quota GA4 quasi esaurita per la property {key}: richiesta rimandata")
+        limiter["bucket"].acquire()
+        with limiter["semaphore"]:
+            _attempt_counter.count = get_attempt_count() + 1
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                if key != "admin":
+                    ga4_quota.record_attempt(key, quota_kind, exhausted=isinstance(e, api_exceptions.TooManyRequests))
+                if not is_retryable(e):
+                    raise
+                last_error = e
+            else:
+                if key != "admin":
+                    ga4_quota.record_attempt(key, quota_kind)
+                return result
+        if attempt < max_attempts - 1:
+            time.sleep(backoff_delay(attempt, max_backoff))
+
+    raise GA4TransientError(f"{type(last_error).__name__}: {last_error}") from last_error
@@ -0,0 +1,551 @@
+"""
+Stand-in locale delle API GA4 Data (v1beta) e Admin (v1alpha), in versione REST.
+
+Serve un dataset sintetico (o caricato da JSON) così i percorsi di codice GA4 si possono
+esercitare e misurare senza una property reale né un token OAuth. Latenza, errori di
+quota e indisponibilità si possono iniettare; i report rispettano limit/offset e gli
+account summaries sono paginati come nell'API reale.
+
+Per puntarci ga4_mcp_tools:
+    python ga4_standin.py --port 8765 --latency-ms 80 --quota-error-rate 0.02
+    export GA4_API_ENDPOINT=http://127.0.0.1:8765
+
+Metodi supportati:
+    Data API:  runReport, batchRunReports, runRealtimeReport, getMetadata
+    Admin API: ListAccountSummaries, GetProperty, ListDataStreams, ListGoogleAdsLinks
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from datetime import date, datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# --- DATASET SINTETICO ---
+
+_SOURCES_BY_MEDIUM = {
+    "cpc": ["google", "bing"],
+    "social_paid": ["facebook", "instagram", "tiktok", "linkedin", "Facebook", "facebok", "fb"],
+    "social_org": ["facebook", "instagram", "linkedin", "pinterest"],
+    "email": ["newsletter", "crm", "sfmc", "Newsletter", "news-letter"],
+    "mailing_campaign": ["newsletter", "mailchimp"],
+    "cpm": ["dv360", "display", "rcs", "mediamond"],
+    "organic": ["google", "bing", "yahoo"],
+    "referral": ["blog.example.com", "partner.example.it", "forum.example.org"],
+    "affiliate": ["awin", "tradetracker"],
+    "(none)": ["(direct)"],
+    "Social-Paid": ["facebook", "instagram"],
+    "e-mail": ["newsletter"],
+}
+
+_CHANNEL_BY_MEDIUM = {
+    "cpc": "Paid Search",
+    "social_paid": "Paid Social",
+    "social_org": "Organic Social",
+    "email": "Email",
+    "mailing_campaign": "Email",
+    "e-mail": "Email",
+    "cpm": "Display",
+    "organic": "Organic Search",
+    "referral": "Referral",
+    "affiliate": "Affiliates",
+    "(none)": "Direct",
+    "Social-Paid": "Unassigned",
+}
+
+_CAMPAIGN_NAMES = ["saldi-invernali", "black-friday", "back-to-school", "lancio-prodotto", "natale", "summer-sale", "newsletter-mensile"]
+_CAMPAIGN_TYPES = ["promo", "ed", "tr", "awr"]
+_COUNTRIES = ["it", "ch-de", "es", "fr", "de"]
+
+REPORT_DIMENSIONS = [
+    "date", "sessionSource", "sessionMedium", "sessionCampaignName",
+    "sessionPrimaryChannelGroup", "sessionDefaultChannelGroup", "sessionSourceMedium",
+]
+REPORT_METRICS = ["sessions", "totalUsers", "activeUsers", "engagedSessions", "conversions"]
+REALTIME_DIMENSIONS = [
+    "minutesAgo", "country", "deviceCategory", "unifiedScreenName", "eventName",
+    "firstUserSource", "firstUserMedium", "firstUserCampaignName",
+]
+REALTIME_METRICS = ["activeUsers", "eventCount"]
+
+
+def build_synthetic_dataset(seed=42, accounts=3, properties_per_account=4, rows_per_property=3000, days=60):
+    """Dataset deterministico: albero degli account, property, data stream, righe giornaliere dei report e righe realtime."""
+    rng = random.Random(seed)
+    today = date.today()
+    mediums = list(_SOURCES_BY_MEDIUM.keys())
+    dataset = {"accounts": [], "properties": {}}
+    prop_num = 100000
+    for a in range(accounts):
+        account = {"account": f"accounts/{1000 + a}", "display_name": f"Account {a + 1}", "properties": []}
+        for p in range(properties_per_account):
+            prop_num += 1
+            prop_id = str(prop_num)
+            domain = f"brand{a}{p}.example.it"
+            account["properties"].append(prop_id)
+            campaigns = [
+                f"{rng.choice(_COUNTRIES)}_{rng.choice(_CAMPAIGN_TYPES)}_{name}_{(today - timedelta(days=rng.randint(0, days))).strftime('%d%m%Y')}"
+                for name in _CAMPAIGN_NAMES
+            ] + ["(not set)", "(organic)"]
+            rows = []
+            for _ in range(rows_per_property):
+                medium = rng.choice(mediums)
+                source = rng.choice(_SOURCES_BY_MEDIUM[medium])
+                channel = _CHANNEL_BY_MEDIUM.get(medium, "Unassigned")
+                campaign = rng.choice(campaigns) if medium not in ("organic", "(none)", "referral") else "(organic)"
+                rows.append({
+                    "date": (today - timedelta(days=rng.randint(0, days - 1))).strftime("%Y%m%d"),
+                    "sessionSource": source,
+                    "sessionMedium": medium,
+                    "sessionCampaignName": campaign,
+                    "sessionPrimaryChannelGroup": channel,
+                    "sessionDefaultChannelGroup": channel,
+                    "sessions": rng.randint(1, 400),
+                })
+            realtime = []
+            for _ in range(200):
+                medium = rng.choice(mediums)
+                realtime.append({
+                    "minutesAgo": f"{rng.randint(0, 29):02d}",
+                    "country": rng.choice(["Italy", "Switzerland", "Spain", "France"]),
+                    "deviceCategory": rng.choice(["mobile", "desktop", "tablet"]),
+                    "unifiedScreenName": rng.choice(["Home", "Promo", "Checkout", "Product"]),
+                    "eventName": rng.choice(["page_view", "session_start", "purchase"]),
+                    "firstUserSource": rng.choice(_SOURCES_BY_MEDIUM[medium]),
+                    "firstUserMedium": medium,
+                    "firstUserCampaignName": rng.choice(campaigns),
+                    "activeUsers": rng.randint(1, 20),
+                    "eventCount": rng.randint(1, 60),
+                })
+            dataset["properties"][prop_id] = {
+                "display_name": f"{domain} - GA4",
+                "account": account["account"],
+                "time_zone": "Europe/Rome",
+                "streams": [{"stream_id": f"{prop_id}01", "measurement_id": f"G-{prop_id}X", "default_uri": f"https://www.{domain}"}],
+                "rows": rows,
+                "realtime_rows": realtime,
+            }
+        dataset["accounts"].append(account)
+    return dataset
+
+
+# --- VALUTAZIONE DEI REPORT ---
+
+class StandinError(Exception):
+    def __init__(self, http_status, status, message):
+        super().__init__(message)
+        self.http_status = http_status
+        self.status = status
+
+
+def _resolve_date(value, today):
+    value = (value or "").strip()
+    if value == "today":
+        return today
+    if value == "yesterday":
+        return today - timedelta(days=1)
+    m = re.fullmatch(r"(\d+)daysAgo", value)
+    if m:
+        return today - timedelta(days=int(m.group(1)))
+    try:
+        return datetime.strptime(value, "%Y-%m-%d").date()
+    except ValueError:
+        raise StandinError(400, "INVALID_ARGUMENT", f"Invalid date: {value}")
+
+
+def _row_value(row, name):
+    if name == "sessionSourceMedium":
+        return f"{row['sessionSource']} / {row['sessionMedium']}"
+    return row.get(name)
+
+
+def _metric_value(row, name):
+    sessions = row.get("sessions", row.get("activeUsers", 0))
+    if name in ("sessions", "activeUsers"):
+        return row.get(name, sessions)
+    if name == "totalUsers":
+        return int(sessions * 0.8)
+    if name == "engagedSessions":
+        return int(sessions * 0.6)
+    if name == "conversions":
+        return int(sessions * 0.03)
+    if name == "eventCount":
+        return row.get("eventCount", row.get("activeUsers", 0) * 3)
+    return 0
+
+
+def _matches_filter(row, expr):
+    if not expr:
+        return True
+    if "andGroup" in expr:
+        return all(_matches_filter(row, e) for e in expr["andGroup"].get("expressions", []))
+    if "orGroup" in expr:
+        return any(_matches_filter(row, e) for e in expr["orGroup"].get("expressions", []))
+    if "notExpression" in expr:
+        return not _matches_filter(row, expr["notExpression"])
+    flt = expr.get("filter") or {}
+    value = str(_row_value(row, flt.get("fieldName", "")) or "")
+    if "stringFilter" in flt:
+        sf = flt["stringFilter"]
+        target = sf.get("value", "")
+        if not sf.get("caseSensitive"):
+            value, target = value.lower(), target.lower()
+        match_type = sf.get("matchType", "EXACT")
+        if match_type in ("EXACT", 1):
+            return value == target
+        if match_type in ("BEGINS_WITH", 2):
+            return value.startswith(target)
+        if match_type in ("ENDS_WITH", 3):
+            return value.endswith(target)
+        if match_type in ("CONTAINS", 4):
+            return target in value
+        if match_type in ("FULL_REGEXP", 5):
+            return re.fullmatch(target, value) is not None
+        if match_type in ("PARTIAL_REGEXP", 6):
+            return re.search(target, value) is not None
+    if "inListFilter" in flt:
+        lf = flt["inListFilter"]
+        if lf.get("caseSensitive"):
+            return value in lf.get("values", [])
+        return value.lower() in {v.lower() for v in lf.get("values", [])}
+    return True
+
+
+def evaluate_report(rows, body, allowed_dimensions, allowed_metrics, today=None, realtime=False):
+    """Aggrega le righe per le dimensioni richieste applicando intervalli di date, filtri, ordinamento, limit/offset e aggregazione TOTAL."""
+    today = today or date.today()
+    dimensions = [d["name"] for d in body.get("dimensions", [])]
+    metrics = [m["name"] for m in body.get("metrics", [])]
+    if not metrics:
+        raise StandinError(400, "INVALID_ARGUMENT", "At least one metric is required")
+    for name in dimensions:
+        if name not in allowed_dimensions:
+            raise StandinError(400, "INVALID_ARGUMENT", f"Field {name} is not a valid dimension.")
+    for name in metrics:
+        if name not in allowed_metrics:
+            raise StandinError(400, "INVALID_ARGUMENT", f"Field {name} is not a valid metric.")
+
+    ranges = []
+    if not realtime:
+        for dr in body.get("dateRanges", []) or [{"startDate": "28daysAgo", "endDate": "yesterday"}]:
+            start = _resolve_date(dr.get("startDate"), today).strftime("%Y%m%d")
+            end = _resolve_date(dr.get("endDate"), today).strftime("%Y%m%d")
+            ranges.append((start, end))
+
+    aggregated = {}
+    for row in rows:
+        if ranges and not any(start <= row["date"] <= end for start, end in ranges):
+            continue
+        if not _matches_filter(row, body.get("dimensionFilter")):
+            continue
+        key = tuple(str(_row_value(row, d)) for d in dimensions)
+        totals = aggregated.setdefault(key, [0] * len(metrics))
+        for i, m in enumerate(metrics):
+            totals[i] += _metric_value(row, m)
+
+    ordered = sorted(aggregated.items(), key=lambda kv: (-kv[1][0], kv[0]))
+    offset = int(body.get("offset", 0) or 0)
+    limit = int(body.get("limit", 0) or 10000)
+    page = ordered[offset:offset + limit]
+    result = {
+        "dimensionHeaders": [{"name": d} for d in dimensions],
+        "metricHeaders": [{"name": m, "type": "TYPE_INTEGER"} for m in metrics],
+        "rows": [
+            {
+                "dimensionValues": [{"value": v} for v in key],
+                "metricValues": [{"value": str(v)} for v in totals],
+            }
+            for key, totals in page
+        ],
+        "rowCount": len(ordered),
+        "metadata": {"currencyCode": "EUR", "timeZone": "Europe/Rome"},
+    }
+    if any(a in ("TOTAL", 1) for a in body.get("metricAggregations", [])):
+        result["totals"] = [{
+            "dimensionValues": [{"value": "RESERVED_TOTAL"} for _ in dimensions],
+            "metricValues": [{"value": str(sum(t[i] for t in aggregated.values()))} for i in range(len(metrics))],
+        }]
+    return result
+
+
+# --- SERVER ---
+
+class StandinState:
+    """Dataset, impostazioni di iniezione dei guasti e quota simulata per property."""
+
+    def __init__(self, dataset, latency_ms=0.0, latency_jitter_ms=0.0, quota_error_rate=0.0,
+                 unavailable_rate=0.0, tokens_per_hour=40_000, tokens_per_day=200_000, seed=0):
+        self.dataset = dataset
+        self.latency_ms = latency_ms
+        self.latency_jitter_ms = latency_jitter_ms
+        self.quota_error_rate = quota_error_rate
+        self.unavailable_rate = unavailable_rate
+        self.tokens_per_hour = tokens_per_hour
+        self.tokens_per_day = tokens_per_day
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.consumed = {}
+        self.request_count = 0
+
+    def inject_faults(self):
+        with self.lock:
+            self.request_count += 1
+            delay = max(0.0, self.latency_ms + self.rng.uniform(-1, 1) * self.latency_jitter_ms) / 1000
+            roll = self.rng.random()
+        if delay:
+            time.sleep(delay)
+        if roll < self.quota_error_rate:
+            raise StandinError(429, "RESOURCE_EXHAUSTED", "Exhausted property tokens per hour (stand-in injected error).")
+        if roll < self.quota_error_rate + self.unavailable_rate:
+            raise StandinError(503, "UNAVAILABLE", "The service is currently unavailable (stand-in injected error).")
+
+    def charge(self, prop_id, row_count):
+        """Consuma token simulati e restituisce il JSON della PropertyQuota."""
+        cost = 1 + row_count // 1000
+        hour_key = datetime.now().strftime("%Y%m%d%H")
+        day_key = hour_key[:8]
+        with self.lock:
+            state = self.consumed.setdefault(prop_id, {"hour": hour_key, "h": 0, "day": day_key, "d": 0})
+            if state["hour"] != hour_key:
+                state["hour"], state["h"] = hour_key, 0
+            if state["day"] != day_key:
+                state["day"], state["d"] = day_key, 0
+            if state["h"] + cost > self.tokens_per_hour or state["d"] + cost > self.tokens_per_day:
+                raise StandinError(429, "RESOURCE_EXHAUSTED", "Exhausted property tokens per hour.")
+            state["h"] += cost
+            state["d"] += cost
+            hour_remaining = self.tokens_per_hour - state["h"]
+            day_remaining = self.tokens_per_day - state["d"]
+        return {
+            "tokensPerDay": {"consumed": cost, "remaining": day_remaining},
+            "tokensPerHour": {"consumed": cost, "remaining": hour_remaining},
+            "concurrentRequests": {"consumed": 0, "remaining": 10},
+            "serverErrorsPerProjectPerHour": {"consumed": 0, "remaining": 10},
+            "potentiallyThresholdedRequestsPerHour": {"consumed": 0, "remaining": 120},
+            "tokensPerProjectPerHour": {"consumed": cost, "remaining": max(0, int(self.tokens_per_hour * 0.35) - state["h"])},
+        }
+
+    def property(self, prop_id):
+        prop = self.dataset["properties"].get(prop_id)
+        if prop is None:
+            raise StandinError(403, "PERMISSION_DENIED", f"User does not have sufficient permissions for this property (properties/{prop_id}).")
+        return prop
+
+
+def _run_report(state, prop_id, body):
+    prop = state.property(prop_id)
+    result = evaluate_report(prop["rows"], body, REPORT_DIMENSIONS, REPORT_METRICS)
+    if body.get("returnPropertyQuota"):
+        result["propertyQuota"] = state.charge(prop_id, result["rowCount"])
+    result["kind"] = "analyticsData#runReport"
+    return result
+
+
+def _run_realtime_report(state, prop_id, body):
+    prop = state.property(prop_id)
+    result = evaluate_report(prop["realtime_rows"], body, REALTIME_DIMENSIONS, REALTIME_METRICS, realtime=True)
+    if body.get("returnPropertyQuota"):
+        result["propertyQuota"] = state.charge(f"realtime:{prop_id}", result["rowCount"])
+    result["kind"] = "analyticsData#runRealtimeReport"
+    return result
+
+
+def _account_summaries(state, query):
+    page_size = min(int((query.get("pageSize") or ["50"])[0] or 50), 200)
+    offset = int((query.get("pageToken") or ["0"])[0] or 0)
+    accounts = state.dataset["accounts"]
+    page = accounts[offset:offset + page_size]
+    result = {
+        "accountSummaries": [
+            {
+                "name": f"accountSummaries/{acc['account'].split('/')[-1]}",
+                "account": acc["account"],
+                "displayName": acc["display_name"],
+                "propertySummaries": [
+                    {
+                        "property": f"properties/{pid}",
+                        "displayName": state.dataset["properties"][pid]["display_name"],
+                        "propertyType": "PROPERTY_TYPE_ORDINARY",
+                        "parent": acc["account"],
+                    }
+                    for pid in acc["properties"]
+                ],
+            }
+            for acc in page
+        ]
+    }
+    if offset + page_size < len(accounts):
+        result["nextPageToken"] = str(offset + page_size)
+    return result
+
+
+def _get_property(state, prop_id):
+    prop = state.property(prop_id)
+    return {
+        "name": f"properties/{prop_id}",
+        "parent": prop["account"],
+        "displayName": prop["display_name"],
+        "industryCategory": "SHOPPING",
+        "timeZone": prop["time_zone"],
+        "currencyCode": "EUR",
+        "createTime": "2023-01-01T00:00:00Z",
+        "updateTime": "2025-01-01T00:00:00Z",
+        "propertyType": "PROPERTY_TYPE_ORDINARY",
+    }
+
+
+def _list_data_streams(state, prop_id):
+    prop = state.property(prop_id)
+    return {
+        "dataStreams": [
+            {
+                "name": f"properties/{prop_id}/dataStreams/{s['stream_id']}",
+                "type": "WEB_DATA_STREAM",
+                "displayName": s["default_uri"],
+                "webStreamData": {"measurementId": s["measurement_id"], "defaultUri": s["default_uri"]},
+            }
+            for s in prop["streams"]
+        ]
+    }
+
+
+def _metadata(prop_id):
+    return {
+        "name": f"properties/{prop_id}/metadata",
+        "dimensions": [{"apiName": d, "uiName": d, "category": "Traffic source"} for d in REPORT_DIMENSIONS],
+        "metrics": [{"apiName": m, "uiName": m, "type": "TYPE_INTEGER", "category": "Session"} for m in REPORT_METRICS],
+    }
+
+
+_ROUTES = [
+    ("POST", re.compile(r"^/v1beta/properties/(\d+):runReport$"), "run_report"),
+    ("POST", re.compile(r"^/v1beta/properties/(\d+):batchRunReports$"), "batch_run_reports"),
+    ("POST", re.compile(r"^/v1beta/properties/(\d+):runRealtimeReport$"), "run_realtime_report"),
+    ("GET", re.compile(r"^/v1beta/properties/(\d+)/metadata$"), "metadata"),
+    ("GET", re.compile(r"^/v1alpha/accountSummaries$"), "account_summaries"),
+    ("GET", re.compile(r"^/v1alpha/properties/(\d+)$"), "get_property"),
+    ("GET", re.compile(r"^/v1alpha/properties/(\d+)/dataStreams$"), "data_streams"),
+    ("GET", re.compile(r"^/v1alpha/properties/(\d+)/googleAdsLinks$"), "ads_links"),
+]
+
+
+def _make_handler(state):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send(self, status, payload):
+            data = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=UTF-8")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _dispatch(self, method):
+            parsed = urlparse(self.path)
+            query = parse_qs(parsed.query)
+            length = int(self.headers.get("Content-Length") or 0)
+            body = json.loads(self.rfile.read(length) or b"{}") if length else {}
+            try:
+                for route_method, pattern, name in _ROUTES:
+                    m = pattern.match(parsed.path)
+                    if route_method != method or not m:
+                        continue
+                    state.inject_faults()
+                    prop_id = m.group(1) if m.groups() else None
+                    if name == "run_report":
+                        return self._send(200, _run_report(state, prop_id, body))
+                    if name == "batch_run_reports":
+                        reports = [_run_report(state, prop_id, {**r, "returnPropertyQuota": body.get("returnPropertyQuota", False)}) for r in body.get("requests", [])]
+                        return self._send(200, {"reports": reports, "kind": "analyticsData#batchRunReports"})
+                    if name == "run_realtime_report":
+                        return self._send(200, _run_realtime_report(state, prop_id, body))
+                    if name == "metadata":
+                        state.property(prop_id)
+                        return self._send(200, _metadata(prop_id))
+                    if name == "account_summaries":
+                        return self._send(200, _account_summaries(state, query))
+                    if name == "get_property":
+                        return self._send(200, _get_property(state, prop_id))
+                    if name == "data_streams":
+                        return self._send(200, _list_data_streams(state, prop_id))
+                    if name == "ads_links":
+                        state.property(prop_id)
+                        return self._send(200, {"googleAdsLinks": []})
+                raise StandinError(404, "NOT_FOUND", f"Method not found: {method} {parsed.path}")
+            except StandinError as e:
+                return self._send(e.http_status, {"error": {"code": e.http_status, "message": str(e), "status": e.status}})
+
+        def do_GET(self):
+            self._dispatch("GET")
+
+        def do_POST(self):
+            self._dispatch("POST")
+
+    return Handler
+
+
+def start_server(host="127.0.0.1", port=0, dataset=None, **settings):
+    """Avvia lo stand-in in un thread daemon. Ritorna (server, base_url); si ferma con server.shutdown()."""
+    state = StandinState(dataset or build_synthetic_dataset(), **settings)
+    server = ThreadingHTTPServer((host, port), _make_handler(state))
+    server.daemon_threads = True
+    server.state = state
+    thread = threading.Thread(target=server.serve_forever, name="ga4-standin", daemon=True)
+    thread.start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Stand-in locale delle API GA4 Data/Admin")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--dataset", help="dataset JSON (vedi --dump-dataset per il formato)")
+    parser.add_argument("--dump-dataset", metavar="PATH", help="scrive il dataset sintetico in PATH ed esce")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--accounts", type=int, default=3)
+    parser.add_argument("--properties-per-account", type=int, default=4)
+    parser.add_argument("--rows-per-property", type=int, default=3000)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--latency-jitter-ms", type=float, default=0.0)
+    parser.add_argument("--quota-error-rate", type=float, default=0.0, help="frazione di richieste che falliscono con 429 RESOURCE_EXHAUSTED")
+    parser.add_argument("--unavailable-rate", type=float, default=0.0, help="frazione di richieste che falliscono con 503 UNAVAILABLE")
+    parser.add_argument("--tokens-per-hour", type=int, default=40_000)
+    parser.add_argument("--tokens-per-day", type=int, default=200_000)
+    args = parser.parse_args(argv)
+
+    if args.dataset:
+        with open(args.dataset, "r", encoding="utf-8") as f:
+            dataset = json.load(f)
+    else:
+        dataset = build_synthetic_dataset(args.seed, args.accounts, args.properties_per_account, args.rows_per_property)
+    if args.dump_dataset:
+        with open(args.dump_dataset, "w", encoding="utf-8") as f:
+            json.dump(dataset, f, indent=1)
+        print(f"Dataset scritto in {args.dump_dataset}")
+        return 0
+
+    server, base_url = start_server(
+        args.host, args.port, dataset,
+        latency_ms=args.latency_ms, latency_jitter_ms=args.latency_jitter_ms,
+        quota_error_rate=args.quota_error_rate, unavailable_rate=args.unavailable_rate,
+        tokens_per_hour=args.tokens_per_hour, tokens_per_day=args.tokens_per_day, seed=args.seed,
+    )
+    print(f"Stand-in GA4 in ascolto su {base_url}")
+    print(f"export GA4_API_ENDPOINT={base_url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,15 +1,91 @@
 import os
 import json
+import hashlib
+import threading
+import time
+
+USERINFO_URL = "https://openidconnect.googleapis.com/v1/userinfo"
+USERINFO_TIMEOUT = 10
+USERINFO_TTL_SECONDS = 60 * 60
+_ID_TOKEN_ISSUERS = ("accounts.google.com", "https://accounts.google.com")
+
+_userinfo_cache = {}  # hash del refresh token -> (letto alle, email)
+_userinfo_lock = threading.Lock()
+
+def _id_token_claims(creds):
+    """
+    Claim dell'ID token restituito dallo scambio del codice OAuth (scope openid + email).
+    Il token arriva direttamente dal token endpoint di Google su TLS, quindi la firma
+    non viene riverificata (OpenID Connect Core 3.1.3.7); si controllano issuer e audience.
+    """
+    id_token = getattr(creds, "id_token", None)
+    if not id_token:
+        return None
+    try:
+        from google.auth import jwt
+        claims = jwt.decode(id_token, verify=False)
+    except Exception:
+        return None
+    if claims.get("iss") not in _ID_TOKEN_ISSUERS:
+        return None
+    client_id = getattr(creds, "client_id", None)
+    if client_id and claims.get("aud") != client_id:
+        return None
+    return claims
+
+def get_email_from_id_token(creds):
+    """Email dall'ID token, solo se verificata."""
+    claims = _id_token_claims(creds)
+    if not claims or claims.get("email_verified") is False:
+        return None
+    return claims.get("email")
+
+def get_user_identity(creds):
+    """
+    Identificativo stabile dell'utente, che non cambia al rinnovo del token: il `sub`
+    dell'ID token, altrimenti l'email (userinfo, in cache). None se non ricavabile.
+    """
+    claims = _id_token_claims(creds)
+    if claims and claims.get("sub"):
+        return claims["sub"]
+    return get_user_email(creds)
+
+def _userinfo_cache_key(creds):
+    raw = getattr(creds, "refresh_token", None) or getattr(creds, "token", None) or ""
+    return hashlib.sha256(f"{getattr(creds, 'client_id', '')}:{raw}".encode("utf-8")).hexdigest()
+
+def _fetch_userinfo_email(creds):
+    """Chiamata diretta all'endpoint userinfo, senza costruire un client discovery."""
+    import requests
+    response = requests.get(
+        USERINFO_URL, headers={"Authorization": f"Bearer {creds.token}"}, timeout=USERINFO_TIMEOUT
+    )
+    response.raise_for_status()
+    return response.json().get("email")
 
 def get_user_email(creds):
-    """Estrae l'email dall'utente autenticato"""
+    """Estrae l'email dall'utente autenticato: dall'ID token, altrimenti da userinfo (in cache)"""
+    email = get_email_from_id_token(creds)
+    if email:
+        return email
+    if creds is None or not getattr(creds, "token", None):
+        return None
+    key = _userinfo_cache_key(creds)
+    now = time.monotonic()
+    with _userinfo_lock:
+        cached = _userinfo_cache.get(key)
+    if cached and now - cached[0] < USERINFO_TTL_SECONDS:
+        return cached[1]
     try:
-        from googleapiclient.discovery import build
-        service = build('oauth2', 'v2', credentials=creds)
-        user_info = service.userinfo().get().execute()
-        return user_info.get('email')
-    except Exception as e:
+        email = _fetch_userinfo_email(creds)
+    except Exception:
         return None
+    if email:
+        with _userinfo_lock:
+            for k in [k for k, (ts, _) in _userinfo_cache.items() if now - ts >= USERINFO_TTL_SECONDS]:
+                del _userinfo_cache[k]
+            _userinfo_cache[key] = (now, email)
+    return email
 
 def get_persistent_api_key(email):
     """Recupera la chiave API salvata per l'utente dalla session_state"""
@@ -0,0 +1,145 @@
+"""
+Stand-in locale delle landing page, per esercitare landing_verifier senza siti reali.
+
+Percorsi (la query string passa nei redirect, salvo i percorsi che la eliminano):
+    /page/<name>              200 HTML con lo snippet gtag del measurement ID configurato
+    /gtm/<name>               200 HTML che carica solo un container GTM (nessun ID G- nella pagina)
+    /notag/<name>             200 HTML senza alcun tag Google
+    /redirect/<n>/<path>      n redirect 301 in catena che mantengono la query string, poi /<path>
+    /redirect-drop/<path>     301 verso /<path> senza query string
+    /redirect-strip/<path>    301 verso /<path> mantenendo solo i parametri non utm_*
+    /loop                     302 verso sé stesso
+    /status/<code>            lo status code indicato
+
+Uso:
+    python landing_standin.py --port 8766 --measurement-id G-TEST123 --latency-ms 50
+"""
+import argparse
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+DEFAULT_MEASUREMENT_ID = "G-STANDIN01"
+
+_GTAG_PAGE = """<!doctype html><html><head><title>{name}</title>
+<script async src="https://www.googletagmanager.com/gtag/js?id={mid}"></script>
+<script>window.dataLayer=window.dataLayer||[];function gtag(){{dataLayer.push(arguments);}}
+gtag('js',new Date());gtag('config','{mid}');</script></head><body><h1>{name}</h1></body></html>"""
+_GTM_PAGE = """<!doctype html><html><head><title>{name}</title>
+<script>(function(w,d,s,l,i){{w[l]=w[l]||[];}})(window,document,'script','dataLayer','GTM-STANDIN');</script>
+</head><body><h1>{name}</h1></body></html>"""
+_PLAIN_PAGE = "<!doctype html><html><head><title>{name}</title></head><body><h1>{name}</h1></body></html>"
+
+
+class LandingState:
+    """Measurement ID servito da /page, numero di richieste e picco di richieste concorrenti."""
+
+    def __init__(self, measurement_id=DEFAULT_MEASUREMENT_ID, latency_ms=0.0):
+        self.measurement_id = measurement_id
+        self.latency_ms = latency_ms
+        self.lock = threading.Lock()
+        self.request_count = 0
+        self.active = 0
+        self.max_active = 0
+
+    def enter(self):
+        with self.lock:
+            self.request_count += 1
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+
+    def leave(self):
+        with self.lock:
+            self.active -= 1
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body=b"", headers=None):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    def _redirect(self, status, location):
+        self._send(status, headers={"Location": location})
+
+    def _html(self, template, name):
+        body = template.format(name=name, mid=self.server.state.measurement_id).encode("utf-8")
+        self._send(200, body, {"Content-Type": "text/html; charset=utf-8"})
+
+    def do_HEAD(self):
+        self.do_GET()
+
+    def do_GET(self):
+        state = self.server.state
+        state.enter()
+        try:
+            if state.latency_ms:
+                time.sleep(state.latency_ms / 1000)
+            parts = urlsplit(self.path)
+            query = f"?{parts.query}" if parts.query else ""
+            path = parts.path
+            if m := re.match(r"^/page/(.+)$", path):
+                return self._html(_GTAG_PAGE, m.group(1))
+            if m := re.match(r"^/gtm/(.+)$", path):
+                return self._html(_GTM_PAGE, m.group(1))
+            if m := re.match(r"^/notag/(.+)$", path):
+                return self._html(_PLAIN_PAGE, m.group(1))
+            if m := re.match(r"^/redirect/(\d+)/(.+)$", path):
+                hops, target = int(m.group(1)), m.group(2)
+                location = f"/redirect/{hops - 1}/{target}" if hops > 1 else f"/{target}"
+                return self._redirect(301, location + query)
+            if m := re.match(r"^/redirect-drop/(.+)$", path):
+                return self._redirect(301, f"/{m.group(1)}")
+            if m := re.match(r"^/redirect-strip/(.+)$", path):
+                kept = [(k, v) for k, v in parse_qsl(parts.query) if not k.startswith("utm_")]
+                return self._redirect(301, f"/{m.group(1)}" + (f"?{urlencode(kept)}" if kept else ""))
+            if path == "/loop":
+                return self._redirect(302, "/loop" + query)
+            if m := re.match(r"^/status/(\d{3})$", path):
+                return self._send(int(m.group(1)), b"stand-in", {"Content-Type": "text/plain"})
+            return self._send(404, b"not found", {"Content-Type": "text/plain"})
+        finally:
+            state.leave()
+
+
+def start_server(host="127.0.0.1", port=0, **settings):
+    """Avvia lo stand-in in un thread daemon. Ritorna (server, base_url); si ferma con server.shutdown()."""
+    server = ThreadingHTTPServer((host, port), _Handler)
+    server.daemon_threads = True
+    server.state = LandingState(**settings)
+    thread = threading.Thread(target=server.serve_forever, name="landing-standin", daemon=True)
+    thread.start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Stand-in locale delle landing page")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--measurement-id", default=DEFAULT_MEASUREMENT_ID)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    args = parser.parse_args(argv)
+
+    server, base_url = start_server(args.host, args.port, measurement_id=args.measurement_id, latency_ms=args.latency_ms)
+    print(f"Stand-in landing in ascolto su {base_url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,275 @@
+"""
+Verifica delle landing page dei link UTM.
+
+Scarica la destinazione seguendo i redirect uno alla volta, controlla che i
+parametri utm_* arrivino intatti all'URL finale (un 301 che perde la query
+string azzera l'attribuzione) e cerca nell'HTML il measurement ID (G-...) dello
+stream web della property GA4.
+
+Le verifiche in blocco girano su un pool di thread, come iter_tracking_checks
+in utm_tracking, con una requests.Session condivisa (connessioni riusate) e al
+massimo PER_HOST_LIMIT richieste contemporanee per host. Il download di ogni
+URL resta in cache per RESULT_TTL_SECONDS; il confronto con i measurement ID
+attesi viene rifatto a ogni lettura. Si prova in locale con landing_standin.py.
+
+Gli URL arrivano dagli utenti: prima di ogni richiesta, redirect compresi, l'host
+viene risolto e si rifiutano indirizzi di loopback, privati, link-local e in genere
+non pubblici, così la verifica non può raggiungere servizi interni. Per provare con
+landing_standin.py in locale si imposta LANDING_VERIFIER_ALLOW_PRIVATE=1.
+"""
+import ipaddress
+import os
+import re
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional
+from urllib.parse import parse_qsl, urljoin, urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+MAX_WORKERS = 16
+PER_HOST_LIMIT = 4
+MAX_REDIRECTS = 10
+REQUEST_TIMEOUT = (5, 15)  # connessione, lettura (secondi)
+MAX_HTML_BYTES = 2 * 1024 * 1024
+RESULT_TTL_SECONDS = 15 * 60
+CACHE_MAX_ENTRIES = 5000
+STREAMS_TTL_SECONDS = 60 * 60
+USER_AGENT = "Mozilla/5.0 (compatible; UTMGovernanceLandingCheck/1.0)"
+# Solo per prove in locale (landing_standin.py): ammette indirizzi locali e privati
+ALLOW_PRIVATE_ENV = "LANDING_VERIFIER_ALLOW_PRIVATE"
+
+_GA4_ID_RE = re.compile(r"\bG-[A-Z0-9]{4,}\b")
+_GTM_ID_RE = re.compile(r"\bGTM-[A-Z0-9]{4,}\b")
+
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+_host_slots: Dict[str, threading.Semaphore] = {}
+_host_slots_lock = threading.Lock()
+_cache: Dict[str, Any] = {}  # url -> (scaricato alle, esito del download)
+_cache_lock = threading.Lock()
+_streams_cache: Dict[str, Any] = {}  # property -> (letto alle, measurement ID)
+
+
+def _get_session() -> requests.Session:
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=MAX_WORKERS, pool_maxsize=MAX_WORKERS, max_retries=0)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            session.headers["User-Agent"] = USER_AGENT
+            _session = session
+        return _session
+
+
+def _host_slot(url: str) -> threading.Semaphore:
+    host = urlsplit(url).netloc.lower()
+    with _host_slots_lock:
+        if host not in _host_slots:
+            _host_slots[host] = threading.BoundedSemaphore(PER_HOST_LIMIT)
+        return _host_slots[host]
+
+
+class BlockedAddress(Exception):
+    """URL non verificabile: schema diverso da http(s) o host con un indirizzo non pubblico."""
+
+
+def _is_public_address(address: str) -> bool:
+    ip = ipaddress.ip_address(address.split("%", 1)[0])
+    if ip.version == 6 and ip.ipv4_mapped:
+        ip = ip.ipv4_mapped
+    return ip.is_global and not ip.is_multicast
+
+
+def check_public_url(url: str) -> None:
+    """
+    Risolve l'host di `url` e solleva BlockedAddress se uno degli indirizzi è di loopback,
+    privato, link-local o comunque non pubblico. socket.gaierror se l'host non esiste.
+    """
+    parts = urlsplit(url)
+    if parts.scheme not in ("http", "https") or not parts.hostname:
+        raise BlockedAddress("sono ammessi solo URL http(s)")
+    if os.environ.get(ALLOW_PRIVATE_ENV, "").strip().lower() in ("1", "true", "yes"):
+        return
+    try:
+        port = parts.port or (443 if parts.scheme == "https" else 80)
+    except ValueError:
+        raise BlockedAddress("porta non valida")
+    for info in socket.getaddrinfo(parts.hostname, port, proto=socket.IPPROTO_TCP):
+        address = info[4][0]
+        if not _is_public_address(address):
+            raise BlockedAddress(f"{parts.hostname} risolve su un indirizzo locale o privato ({address})")
+
+
+def utm_params(url: str) -> Dict[str, str]:
+    return {k: v for k, v in parse_qsl(urlsplit(url or "").query, keep_blank_values=True) if k.startswith("utm_")}
+
+
+def _read_html(response) -> str:
+    if "html" not in response.headers.get("Content-Type", "text/html").lower():
+        return ""
+    body = b""
+    for chunk in response.iter_content(64 * 1024):
+        body += chunk
+        if len(body) >= MAX_HTML_BYTES:
+            break
+    return body.decode(response.encoding or "utf-8", errors="replace")
+
+
+def fetch_landing(url: str) -> Dict[str, Any]:
+    """
+    Segue la catena di redirect di `url` e legge l'HTML finale. Non usa la cache.
+    Ogni destinazione, redirect compresi, passa da check_public_url prima della richiesta.
+    """
+    started = time.perf_counter()
+    session = _get_session()
+    redirects: List[Dict[str, Any]] = []
+    seen = {url}
+    current = url
+    fetched = {"final_url": url, "status_code": None, "redirects": redirects, "ga4_ids": [], "gtm_ids": [], "error": None}
+    try:
+        while True:
+            check_public_url(current)
+            with _host_slot(current):
+                response = session.get(current, allow_redirects=False, timeout=REQUEST_TIMEOUT, stream=True)
+                try:
+                    location = response.headers.get("Location") if response.is_redirect else None
+                    html = "" if location else _read_html(response)
+                finally:
+                    response.close()
+            if not location:
+                fetched["status_code"] = response.status_code
+                fetched["ga4_ids"] = sorted(set(_GA4_ID_RE.findall(html)))
+                fetched["gtm_ids"] = sorted(set(_GTM_ID_RE.findall(html)))
+                break
+            redirects.append({"status": response.status_code, "url": current})
+            current = urljoin(current, location)
+            fetched["final_url"] = current
+            if current in seen:
+                fetched["error"] = "Redirect in loop"
+                break
+            if len(redirects) >= MAX_REDIRECTS:
+                fetched["error"] = f"Più di {MAX_REDIRECTS} redirect"
+                break
+            seen.add(current)
+    except BlockedAddress as e:
+        fetched["error"] = f"Indirizzo non consentito: {e}"
+    except socket.gaierror:
+        fetched["error"] = f"Pagina non raggiungibile: host {urlsplit(current).hostname} non trovato"
+    except requests.RequestException as e:
+        fetched["error"] = f"Pagina non raggiungibile: {type(e).__name__}"
+    fetched["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    fetched["checked_at"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    return fetched
+
+
+def _cached_fetch(url: str, use_cache: bool = True) -> Dict[str, Any]:
+    now = time.monotonic()
+    if use_cache:
+        with _cache_lock:
+            cached = _cache.get(url)
+            if cached and now - cached[0] < RESULT_TTL_SECONDS:
+                return cached[1]
+    fetched = fetch_landing(url)
+    with _cache_lock:
+        if len(_cache) >= CACHE_MAX_ENTRIES:
+            for key in [k for k, (ts, _) in _cache.items() if now - ts >= RESULT_TTL_SECONDS]:
+                del _cache[key]
+            while len(_cache) >= CACHE_MAX_ENTRIES:
+                del _cache[next(iter(_cache))]
+        _cache[url] = (now, fetched)
+    return fetched
+
+
+def evaluate_landing(url: str, fetched: Dict[str, Any], measurement_ids: Iterable[str] = ()) -> Dict[str, Any]:
+    """Esito OK / WARNING / ERROR della landing a partire dal download e dai measurement ID attesi."""
+    expected = sorted({m.upper() for m in measurement_ids if m})
+    sent = utm_params(url)
+    received = utm_params(fetched["final_url"])
+    lost = [k for k in sent if k not in received]
+    changed = [k for k in sent if k in received and received[k] != sent[k]]
+    tag_found = sorted(set(expected) & set(fetched["ga4_ids"]))
+
+    errors, warnings = [], []
+    if fetched["error"]:
+        errors.append(fetched["error"])
+    elif fetched["status_code"] and fetched["status_code"] >= 400:
+        errors.append(f"La pagina risponde {fetched['status_code']}")
+    if lost:
+        errors.append(f"Il redirect perde i parametri: {', '.join(lost)}")
+    if changed:
+        warnings.append(f"Il redirect modifica i parametri: {', '.join(changed)}")
+    if not fetched["error"] and fetched["status_code"] and fetched["status_code"] < 400:
+        if expected and not tag_found:
+            if fetched["gtm_ids"]:
+                warnings.append(
+                    f"{', '.join(expected)} non è nell'HTML; tag probabilmente caricato da GTM ({', '.join(fetched['gtm_ids'])})"
+                )
+            elif fetched["ga4_ids"]:
+                errors.append(f"La pagina ha {', '.join(fetched['ga4_ids'])} invece di {', '.join(expected)}")
+            else:
+                errors.append("Nessun tag GA4 nella pagina")
+        elif not expected and not fetched["ga4_ids"] and not fetched["gtm_ids"]:
+            warnings.append("Nessun tag GA4 o GTM nella pagina")
+
+    status = "ERROR" if errors else "WARNING" if warnings else "OK"
+    messages = errors + warnings
+    if not messages:
+        messages = [f"Pagina raggiungibile, UTM preservati, tag {', '.join(tag_found or fetched['ga4_ids'] or fetched['gtm_ids'])}"]
+    return {
+        "url": url,
+        "status": status,
+        "message": "; ".join(messages),
+        "status_code": fetched["status_code"],
+        "final_url": fetched["final_url"],
+        "redirects": fetched["redirects"],
+        "utm_preserved": not lost and not changed,
+        "ga4_ids": fetched["ga4_ids"],
+        "gtm_ids": fetched["gtm_ids"],
+        "tag_match": bool(tag_found) if expected else None,
+        "elapsed_ms": fetched["elapsed_ms"],
+        "checked_at": fetched["checked_at"],
+    }
+
+
+def verify_landing_page(url: str, measurement_ids: Iterable[str] = (), use_cache: bool = True) -> Dict[str, Any]:
+    return evaluate_landing(url, _cached_fetch(url, use_cache=use_cache), measurement_ids)
+
+
+def iter_landing_checks(urls: Iterable[str], measurement_ids_by_url: Optional[Dict[str, Iterable[str]]] = None,
+                        max_workers: int = MAX_WORKERS, use_cache: bool = True):
+    """
+    Verifica gli URL in parallelo (ogni URL una sola volta) e produce (url, esito)
+    man mano che arrivano. `measurement_ids_by_url` indica i G- attesi per URL.
+    """
+    measurement_ids_by_url = measurement_ids_by_url or {}
+    unique = list(dict.fromkeys(u for u in urls if u))
+    with ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="landing-check") as pool:
+        futures = {pool.submit(_cached_fetch, url, use_cache): url for url in unique}
+        for future in as_completed(futures):
+            url = futures[future]
+            yield url, evaluate_landing(url, future.result(), measurement_ids_by_url.get(url, ()))
+
+
+def get_measurement_ids(property_id, creds) -> List[str]:
+    """Measurement ID degli stream web della property (Admin API), in cache per STREAMS_TTL_SECONDS."""
+    import ga4_mcp_tools
+
+    prop = str(property_id or "").replace("properties/", "")
+    if not prop:
+        return []
+    cached = _streams_cache.get(prop)
+    if cached and time.monotonic() - cached[0] < STREAMS_TTL_SECONDS:
+        return cached[1]
+    streams = ga4_mcp_tools.list_web_data_streams(prop, creds)
+    if isinstance(streams, dict):  # errore: non in cache, si riprova alla prossima verifica
+        return []
+    ids = [s["measurement_id"] for s in streams]
+    _streams_cache[prop] = (time.monotonic(), ids)
+    return ids
@@ -0,0 +1,267 @@
+"""
+Monitor realtime del lancio delle campagne.
+
+Il report standard di GA4 conferma il tracking solo dopo il grace period
+(utm_tracking): un link rotto il giorno del lancio resterebbe invisibile per
+giorni. Questo monitor interroga la Realtime API per le campagne dello storico
+con data live oggi e conta gli hit (eventCount) della prima ora dal primo hit
+osservato, mostrati accanto alle righe del tab storico.
+
+La Realtime API copre solo gli ultimi 30 minuti ed espone solo le dimensioni di
+acquisizione del primo utente (firstUserSource/Medium/CampaignName): ogni poll
+sostituisce i minuti della finestra corrente, quelli più vecchi restano salvati.
+Tutte le campagne osservate di una property condividono una sola query; l'intervallo
+di polling si accorcia quando arriva traffico, si allunga quando non ne arriva e
+cresce quando la quota realtime della property scarseggia (ga4_quota, kind="realtime").
+Gli esiti restano in memoria nel processo, come il registro credenziali di tracking_monitor.
+"""
+import logging
+import threading
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from google.analytics.data_v1beta.types import (
+    Dimension,
+    Filter,
+    FilterExpression,
+    Metric,
+    RunRealtimeReportRequest,
+)
+
+import ga4_mcp_tools
+import ga4_quota
+import ga4_scheduler
+import tracking_monitor
+import utm_history_store
+from utm_core import normalize_medium_token, normalize_token
+from utm_tracking import campaign_key
+
+logger = logging.getLogger(__name__)
+
+FIRST_HOUR_MINUTES = 60
+REALTIME_WINDOW_MINUTES = 30
+# Sotto il minuto la Realtime API non aggiunge informazione; sopra i 30 minuti si perderebbero minuti
+POLL_MIN_SECONDS = 60
+POLL_MAX_SECONDS = 10 * 60
+IDLE_SECONDS = 5 * 60
+MAX_WATCHED_ENTRIES = 500
+REALTIME_PAGE_SIZE = 10000
+
+_stats = {}  # (property, campaign_key) -> {"minutes": {minuto: hit}, "first_hit_at", "last_poll_at", "complete"}
+_schedule = {}  # property -> {"next_poll_at", "interval"}
+_state_lock = threading.Lock()
+
+
+def _property_key(property_id) -> str:
+    return str(property_id or "").replace("properties/", "")
+
+
+def _minute(value: datetime) -> datetime:
+    return value.replace(second=0, microsecond=0)
+
+
+def watched_entries(today: Optional[date] = None) -> List[Dict[str, Any]]:
+    """Righe dello storico con data live oggi, degli utenti con una sessione attiva."""
+    today = today or date.today()
+    creds_by_user = tracking_monitor.active_credentials()
+    if not creds_by_user:
+        return []
+    entries = [
+        e
+        for user_email in creds_by_user
+        for e in utm_history_store.query_entries(
+            user_email, date_from=today.isoformat(), date_to=today.isoformat(), limit=MAX_WATCHED_ENTRIES
+        )
+        if _property_key(e.get("property_id"))
+    ]
+    return entries[:MAX_WATCHED_ENTRIES]
+
+
+def _fetch_realtime_hits(property_id, campaigns, creds, now):
+    """Hit per (campagna, minuto) negli ultimi 30 minuti, con una sola query per la property."""
+    request = RunRealtimeReportRequest(
+        property=f"properties/{property_id}",
+        dimensions=[
+            Dimension(name="minutesAgo"),
+            Dimension(name="firstUserSource"),
+            Dimension(name="firstUserMedium"),
+            Dimension(name="firstUserCampaignName"),
+        ],
+        metrics=[Metric(name="eventCount")],
+        dimension_filter=FilterExpression(
+            filter=Filter(
+                field_name="firstUserCampaignName",
+                in_list_filter=Filter.InListFilter(values=sorted(campaigns), case_sensitive=False),
+            )
+        ),
+        limit=REALTIME_PAGE_SIZE,
+    )
+    report = ga4_mcp_tools.run_realtime_report_request(request, creds, background=True)
+    hits = {}
+    for row in report.rows:
+        values = [v.value for v in row.dimension_values]
+        key = "|".join((normalize_token(values[1]), normalize_medium_token(values[2]), normalize_token(values[3])))
+        minute = _minute(now - timedelta(minutes=int(values[0] or 0)))
+        cell = (key, minute)
+        hits[cell] = hits.get(cell, 0) + int(float(row.metric_values[0].value or 0))
+    return hits
+
+
+def _first_hour_hits(stats) -> int:
+    first = stats["first_hit_at"]
+    if not first:
+        return 0
+    end = first + timedelta(minutes=FIRST_HOUR_MINUTES)
+    return sum(n for minute, n in stats["minutes"].items() if first <= minute < end)
+
+
+def poll_property(property_id, entries, creds, now: Optional[datetime] = None) -> int:
+    """
+    Aggiorna gli hit realtime delle campagne di `entries` (stessa property) non ancora
+    complete. Ritorna i nuovi hit rispetto al poll precedente.
+    """
+    now = now or datetime.now()
+    prop = _property_key(property_id)
+    campaigns = {}
+    with _state_lock:
+        for entry in entries:
+            key = campaign_key(entry)
+            stats = _stats.get((prop, key))
+            if stats and stats["complete"]:
+                continue
+            campaigns.setdefault(key, set()).add(entry.get("utm_campaign", ""))
+    if not campaigns:
+        return 0
+
+    hits = _fetch_realtime_hits(prop, set().union(*campaigns.values()), creds, now)
+    window_start = _minute(now - timedelta(minutes=REALTIME_WINDOW_MINUTES - 1))
+    new_hits = 0
+    with _state_lock:
+        for key in campaigns:
+            stats = _stats.setdefault(
+                (prop, key), {"minutes": {}, "first_hit_at": None, "last_poll_at": None, "complete": False}
+            )
+            before = sum(stats["minutes"].values())
+            # I minuti nella finestra realtime vengono sostituiti: GA4 li aggiorna fino a 30 minuti dopo
+            stats["minutes"] = {m: n for m, n in stats["minutes"].items() if m < window_start}
+            for (hit_key, minute), n in hits.items():
+                if hit_key == key and n:
+                    stats["minutes"][minute] = n
+            new_hits += max(0, sum(stats["minutes"].values()) - before)
+            if stats["minutes"]:
+                stats["first_hit_at"] = min(stats["minutes"])
+            stats["last_poll_at"] = now
+            # La prima ora è completa quando anche il suo ultimo minuto è uscito dalla finestra realtime
+            first = stats["first_hit_at"]
+            stats["complete"] = bool(first and first + timedelta(minutes=FIRST_HOUR_MINUTES) <= window_start)
+    return new_hits
+
+
+def next_interval(property_id, previous: Optional[float], new_hits: int) -> float:
+    """Intervallo fino al prossimo poll della property: breve con traffico, raddoppia senza, più lungo con poca quota."""
+    if new_hits or previous is None:
+        interval = POLL_MIN_SECONDS
+    else:
+        interval = min(previous * 2, POLL_MAX_SECONDS)
+    ratio = ga4_quota.remaining_ratio(property_id, kind="realtime")
+    if ratio < ga4_quota.BACKGROUND_STOP_RATIO:
+        return POLL_MAX_SECONDS
+    if ratio < ga4_quota.BACKGROUND_FULL_SPEED_RATIO:
+        interval *= ga4_quota.BACKGROUND_FULL_SPEED_RATIO / ratio
+    return min(interval, POLL_MAX_SECONDS)
+
+
+def run_cycle(now: Optional[datetime] = None) -> float:
+    """Esegue i poll delle property scadute. Ritorna i secondi fino al prossimo poll."""
+    now = now or datetime.now()
+    entries = watched_entries(now.date())
+    creds_by_user = tracking_monitor.active_credentials()
+    by_property = {}
+    for entry in entries:
+        by_property.setdefault(_property_key(entry["property_id"]), []).append(entry)
+
+    for prop, prop_entries in by_property.items():
+        with _state_lock:
+            schedule = _schedule.get(prop)
+        if schedule and schedule["next_poll_at"] > now:
+            continue
+        # Chiunque abbia salvato un link della property può leggerne il realtime
+        creds = creds_by_user[prop_entries[0]["user_email"]]
+        previous = schedule["interval"] if schedule else None
+        try:
+            interval = next_interval(prop, previous, poll_property(prop, prop_entries, creds, now=now))
+        except ga4_scheduler.GA4TransientError as e:
+            logger.info("Launch monitor: poll rimandato per la property %s: %s", prop, e)
+            interval = POLL_MAX_SECONDS
+        except Exception:
+            logger.exception("Launch monitor: poll fallito per la property %s", prop)
+            interval = POLL_MAX_SECONDS
+        with _state_lock:
+            _schedule[prop] = {"next_poll_at": now + timedelta(seconds=interval), "interval": interval}
+
+    with _state_lock:
+        # Le campagne di ieri non sono più osservate: il tracking passa al report standard
+        for key in [k for k, s in _stats.items() if s["last_poll_at"] and s["last_poll_at"].date() < now.date() - timedelta(days=1)]:
+            del _stats[key]
+        for prop in [p for p in _schedule if p not in by_property]:
+            del _schedule[prop]
+        waits = [(s["next_poll_at"] - now).total_seconds() for s in _schedule.values()]
+    return max(1.0, min(waits)) if waits else IDLE_SECONDS
+
+
+def get_launch_stats(entry: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Hit realtime della riga dello storico, o None se la campagna non è (stata) osservata."""
+    with _state_lock:
+        stats = _stats.get((_property_key(entry.get("property_id")), campaign_key(entry)))
+        if not stats:
+            return None
+        return {
+            "first_hour_hits": _first_hour_hits(stats),
+            "first_hit_at": stats["first_hit_at"],
+            "last_poll_at": stats["last_poll_at"],
+            "complete": stats["complete"],
+        }
+
+
+class LaunchMonitor:
+    """Thread daemon che esegue run_cycle quando scade il prossimo poll."""
+
+    def __init__(self):
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread = threading.Thread(target=self._loop, name="launch-monitor", daemon=True)
+
+    def start(self) -> "LaunchMonitor":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._wake.set()
+
+    def wake(self) -> None:
+        """Anticipa il prossimo giro (es. dopo il salvataggio di un link che va live oggi)."""
+        self._wake.set()
+
+    def _loop(self) -> None:
+        while not self._stop.is_set():
+            wait = IDLE_SECONDS
+            try:
+                wait = run_cycle()
+            except Exception:
+                logger.exception("Launch monitor: giro di poll fallito")
+            self._wake.wait(wait)
+            self._wake.clear()
+
+
+_monitor: Optional[LaunchMonitor] = None
+_monitor_lock = threading.Lock()
+
+
+def ensure_started() -> LaunchMonitor:
+    """Avvia il monitor una sola volta per processo."""
+    global _monitor
+    with _monitor_lock:
+        if _monitor is None:
+            _monitor = LaunchMonitor().start()
+        return _monitor
@@ -0,0 +1,175 @@
+"""
+Store lato server degli state OAuth in attesa di callback (PKCE).
+
+Il login genera uno state e un code_verifier; il callback di Google torna con lo
+state e serve il code_verifier per scambiare il codice. Streamlit perde
+st.session_state se il callback arriva in un nuovo tab, quindi la coppia vive
+lato server con una scadenza (STATE_TTL_SECONDS) e viene consumata alla lettura:
+ogni state vale per un solo scambio e quelli mai usati scadono.
+
+Due backend, scelti con OAUTH_STATE_BACKEND:
+  - "sqlite" (default): file condiviso tra i worker e le repliche che montano lo
+    stesso volume (OAUTH_STATE_DB, default oauth_state.db accanto all'app), così
+    il callback funziona anche se il load balancer lo manda a un altro processo;
+  - "memory": dizionario nel processo, per un singolo worker o per le prove.
+"""
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Optional
+
+BACKEND_ENV = "OAUTH_STATE_BACKEND"
+DB_PATH_ENV = "OAUTH_STATE_DB"
+DEFAULT_DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "oauth_state.db")
+
+# Tempo concesso per completare il consenso su Google
+STATE_TTL_SECONDS = 10 * 60
+# Limite di sicurezza agli state in attesa (es. bot che caricano la pagina di login)
+MAX_PENDING_STATES = 10000
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS oauth_states (
+    state TEXT PRIMARY KEY,
+    code_verifier TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_oauth_states_expires ON oauth_states (expires_at);
+"""
+
+
+class MemoryStateStore:
+    """State in attesa nel processo corrente, in ordine di inserimento (= di scadenza)."""
+
+    def __init__(self, max_entries: int = MAX_PENDING_STATES):
+        self.max_entries = max_entries
+        self._states = OrderedDict()  # state -> (code_verifier, expires_at)
+        self._lock = threading.Lock()
+
+    def put(self, state: str, code_verifier: str, ttl: float = STATE_TTL_SECONDS) -> None:
+        now = time.time()
+        with self._lock:
+            self._purge(now)
+            self._states.pop(state, None)
+            while len(self._states) >= self.max_entries:
+                self._states.popitem(last=False)
+            self._states[state] = (code_verifier, now + ttl)
+
+    def pop(self, state: str) -> Optional[str]:
+        with self._lock:
+            item = self._states.pop(state, None)
+        if item and item[1] > time.time():
+            return item[0]
+        return None
+
+    def purge_expired(self) -> int:
+        with self._lock:
+            return self._purge(time.time())
+
+    def _purge(self, now: float) -> int:
+        removed = 0
+        while self._states and next(iter(self._states.values()))[1] <= now:
+            self._states.popitem(last=False)
+            removed += 1
+        return removed
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._states)
+
+
+class SQLiteStateStore:
+    """State in attesa su un file SQLite condiviso tra processi (WAL, una connessione breve per operazione)."""
+
+    def __init__(self, db_path: Optional[str] = None, max_entries: int = MAX_PENDING_STATES):
+        self.db_path = db_path or os.environ.get(DB_PATH_ENV, "").strip() or DEFAULT_DB_PATH
+        self.max_entries = max_entries
+        self._initialized = False
+        self._init_lock = threading.Lock()
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        try:
+            with self._init_lock:
+                if not self._initialized:
+                    conn.execute("PRAGMA journal_mode=WAL")
+                    conn.executescript(_SCHEMA)
+                    self._initialized = True
+            # BEGIN IMMEDIATE: la lettura e la cancellazione di pop sono atomiche anche tra processi
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        finally:
+            conn.close()
+
+    def put(self, state: str, code_verifier: str, ttl: float = STATE_TTL_SECONDS) -> None:
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("DELETE FROM oauth_states WHERE expires_at <= ?", (now,))
+            (count,) = conn.execute("SELECT COUNT(*) FROM oauth_states").fetchone()
+            if count >= self.max_entries:
+                conn.execute(
+                    "DELETE FROM oauth_states WHERE state IN "
+                    "(SELECT state FROM oauth_states ORDER BY expires_at LIMIT ?)",
+                    (count - self.max_entries + 1,),
+                )
+            conn.execute(
+                "INSERT OR REPLACE INTO oauth_states (state, code_verifier, expires_at) VALUES (?, ?, ?)",
+                (state, code_verifier, now + ttl),
+            )
+
+    def pop(self, state: str) -> Optional[str]:
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT code_verifier, expires_at FROM oauth_states WHERE state = ?", (state,)
+            ).fetchone()
+            if row:
+                conn.execute("DELETE FROM oauth_states WHERE state = ?", (state,))
+        if row and row[1] > time.time():
+            return row[0]
+        return None
+
+    def purge_expired(self) -> int:
+        with self._connect() as conn:
+            return conn.execute("DELETE FROM oauth_states WHERE expires_at <= ?", (time.time(),)).rowcount
+
+    def __len__(self) -> int:
+        with self._connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM oauth_states").fetchone()[0]
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    """Store del processo, creato al primo uso secondo OAUTH_STATE_BACKEND."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            backend = os.environ.get(BACKEND_ENV, "").strip().lower() or "sqlite"
+            if backend == "memory":
+                _store = MemoryStateStore()
+            elif backend == "sqlite":
+                _store = SQLiteStateStore()
+            else:
+                raise ValueError(f"{BACKEND_ENV} non valido: {backend!r} (usa 'sqlite' o 'memory')")
+        return _store
+
+
+def save_pending_state(state: str, code_verifier: str, ttl: float = STATE_TTL_SECONDS) -> None:
+    get_store().put(state, code_verifier, ttl)
+
+
+def consume_pending_state(state: str) -> Optional[str]:
+    """code_verifier dello state, rimosso dallo store; None se sconosciuto, già usato o scaduto."""
+    if not state:
+        return None
+    return get_store().pop(state)
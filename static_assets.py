@@ -0,0 +1,72 @@
+"""
+Asset statici dell'app (CSS e immagini in static/).
+
+Con server.enableStaticServing (vedi .streamlit/config.toml) Streamlit serve la
+cartella static/ su app/static/: a ogni rerun l'app invia solo un tag <link>
+verso un URL con l'hash del contenuto (?v=...), che il browser tiene in cache
+finché il file non cambia. Se il serving statico è disattivato (es. app avviata
+da un'altra cartella, senza il config.toml) il CSS viene inserito inline come
+prima, con le immagini referenziate via url(...) convertite in data URI.
+"""
+import base64
+import hashlib
+import mimetypes
+import os
+import re
+from functools import lru_cache
+
+import streamlit as st
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+STATIC_URL_PREFIX = "app/static"
+
+_CSS_URL_RE = re.compile(r"""url\(["']?([^"')]+?)["']?\)""")
+
+
+@lru_cache(maxsize=None)
+def _load(name: str, mtime: float):
+    """Contenuto e hash di un asset; la chiave include mtime, quindi un file modificato viene riletto."""
+    with open(os.path.join(STATIC_DIR, name), "rb") as f:
+        data = f.read()
+    return data, hashlib.sha256(data).hexdigest()[:12]
+
+
+def _asset(name: str):
+    return _load(name, os.path.getmtime(os.path.join(STATIC_DIR, name)))
+
+
+def static_serving_enabled() -> bool:
+    return bool(st.get_option("server.enableStaticServing"))
+
+
+def asset_url(name: str) -> str:
+    """URL dell'asset servito da Streamlit, con l'hash del contenuto per la cache del browser."""
+    return f"{STATIC_URL_PREFIX}/{name}?v={_asset(name)[1]}"
+
+
+def asset_src(name: str) -> str:
+    """Sorgente da usare in src/url(): URL statico, o data URI se il serving statico è disattivato."""
+    if static_serving_enabled():
+        return asset_url(name)
+    data, _ = _asset(name)
+    mime = mimetypes.guess_type(name)[0] or "application/octet-stream"
+    return f"data:{mime};base64,{base64.b64encode(data).decode()}"
+
+
+def _inline_css(name: str) -> str:
+    css = _asset(name)[0].decode("utf-8")
+
+    def _replace(match):
+        ref = match.group(1)
+        if ref.startswith(("data:", "http:", "https:", "/")) or not os.path.exists(os.path.join(STATIC_DIR, ref)):
+            return match.group(0)
+        return f'url("{asset_src(ref)}")'
+
+    return _CSS_URL_RE.sub(_replace, css)
+
+
+def stylesheet_tags(*names: str) -> str:
+    """HTML per st.markdown(..., unsafe_allow_html=True): <link> ai fogli di stile, o <style> inline come fallback."""
+    if static_serving_enabled():
+        return "".join(f'<link rel="stylesheet" href="{asset_url(name)}">' for name in names)
+    return "".join(f"<style>{_inline_css(name)}</style>" for name in names)
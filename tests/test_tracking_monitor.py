@@ -0,0 +1,60 @@
+from datetime import date, datetime, timedelta
+
+from tracking_monitor import JUST_ENDED_GRACE_DAYS, MONITOR_WINDOW_DAYS, RECHECK_AFTER_SECONDS, select_due_entries
+
+TODAY = date(2026, 3, 10)
+NOW = datetime(2026, 3, 10, 1, 0, 0)
+GRACE_DAYS = 2
+
+
+def _entry(name, live, checked_at=None, property_id="123456"):
+    return {
+        "name": name,
+        "live_date": live.strftime("%d/%m/%Y"),
+        "property_id": property_id,
+        "tracking_checked_at": checked_at.strftime("%Y-%m-%d %H:%M:%S") if checked_at else None,
+    }
+
+
+def _due(entries):
+    return [e["name"] for e in select_due_entries(entries, today=TODAY, now=NOW, grace_days=GRACE_DAYS)]
+
+
+def test_only_entries_inside_the_monitoring_window():
+    entries = [
+        _entry("in_window", TODAY - timedelta(days=10)),
+        _entry("live_today", TODAY),
+        _entry("last_day", TODAY - timedelta(days=MONITOR_WINDOW_DAYS)),
+        _entry("future", TODAY + timedelta(days=1)),
+        _entry("expired", TODAY - timedelta(days=MONITOR_WINDOW_DAYS + 1)),
+        _entry("no_property", TODAY - timedelta(days=10), property_id=""),
+        {"name": "no_date", "live_date": "", "property_id": "123456"},
+    ]
+    assert set(_due(entries)) == {"in_window", "live_today", "last_day"}
+
+
+def test_recent_checks_wait_for_recheck_interval():
+    live = TODAY - timedelta(days=10)
+    recent = NOW - timedelta(seconds=RECHECK_AFTER_SECONDS - 60)
+    stale = NOW - timedelta(seconds=RECHECK_AFTER_SECONDS)
+    assert _due([_entry("recent", live, recent), _entry("stale", live, stale)]) == ["stale"]
+
+
+def test_grace_end_triggers_an_immediate_recheck():
+    # Grace period finito ieri: il controllo delle 23 di ieri era ancora dentro il grace period
+    live = TODAY - timedelta(days=GRACE_DAYS + 1)
+    before_grace_end = NOW - timedelta(hours=2)
+    after_grace_end = NOW - timedelta(minutes=30)
+    assert _due([_entry("before", live, before_grace_end), _entry("after", live, after_grace_end)]) == ["before"]
+
+
+def test_priority_just_ended_then_never_checked_then_oldest():
+    old_live = TODAY - timedelta(days=20)
+    just_ended_live = TODAY - timedelta(days=GRACE_DAYS + JUST_ENDED_GRACE_DAYS)
+    entries = [
+        _entry("checked_recently", old_live, NOW - timedelta(days=1)),
+        _entry("never_checked", old_live),
+        _entry("checked_long_ago", old_live, NOW - timedelta(days=3)),
+        _entry("just_ended", just_ended_live, NOW - timedelta(days=5)),
+    ]
+    assert _due(entries) == ["just_ended", "never_checked", "checked_long_ago", "checked_recently"]
@@ -0,0 +1,131 @@
+from datetime import date
+
+import pytest
+
+import utm_core
+from utm_core import build_utm_link, check_field
+
+
+def _link(**overrides):
+    args = dict(
+        destination_url="https://example.com/landing",
+        utm_source="facebook",
+        utm_medium="social_paid",
+        campaign_name="saldi-invernali",
+        campaign_type="promo",
+        country_language="it-it",
+        start_date="15/01/2026",
+    )
+    args.update(overrides)
+    return build_utm_link(**args)
+
+
+def test_build_utm_link_composes_campaign_and_channel():
+    link = _link(utm_content="banner-1")
+    assert link["errors"] == []
+    assert link["utm_campaign"] == "it-it_promo_saldi-invernali_15012026"
+    assert link["final_url"] == (
+        "https://example.com/landing?utm_source=facebook&utm_medium=social_paid"
+        "&utm_campaign=it-it_promo_saldi-invernali_15012026&utm_content=banner-1"
+    )
+    assert link["live_date"] == "15/01/2026"
+    assert link["expected_channel_group"] == utm_core.infer_expected_channel_group("social_paid")
+
+
+def test_build_utm_link_appends_to_existing_query():
+    link = _link(destination_url="https://example.com/?ref=nav")
+    assert link["final_url"].startswith("https://example.com/?ref=nav&utm_source=facebook&")
+
+
+@pytest.mark.parametrize("value", [date(2026, 1, 15), "2026-01-15", "15012026", "15-01-2026"])
+def test_build_utm_link_accepts_date_formats(value):
+    assert _link(start_date=value)["utm_campaign"].endswith("_15012026")
+
+
+def test_build_utm_link_reports_missing_fields():
+    link = _link(destination_url="not a url", utm_source="", start_date="31/02/2026")
+    assert link["final_url"] == ""
+    assert {"URL", "data_inizio", "utm_source"} <= set(link["errors"])
+
+
+def test_build_utm_link_naming_issue_blocks_unless_lenient():
+    strict = _link(utm_source="Face Book")
+    assert strict["final_url"] == ""
+    assert "source_naming" in strict["errors"]
+    issues, suggestion = strict["issues"]["utm_source"]
+    assert "usa solo minuscole" in issues and "evita spazi" in issues
+    assert suggestion == "face-book"
+
+    lenient = _link(utm_source="Face Book", lenient=True)
+    assert lenient["errors"] == []
+    assert "utm_source=face-book&" in lenient["final_url"]
+    assert "utm_source" in lenient["issues"]
+
+
+def test_check_field_normalizes_and_validates():
+    assert check_field("utm_source", "facebook") == ("facebook", [], None)
+    normalized, errors, issue = check_field("utm_medium", "Social Paid")
+    assert normalized == "social_paid"
+    assert errors == ["medium_naming"]
+    assert {"usa solo minuscole", "evita spazi"} <= set(issue[0])
+
+
+def test_check_field_medium_keeps_underscores():
+    # Il medium segue GA4 (social_paid): niente avviso sui trattini, a differenza della source
+    assert check_field("utm_medium", "social_paid") == ("social_paid", [], None)
+    assert check_field("utm_source", "my_source")[1] == ["source_naming"]
+
+
+def test_check_field_optional_and_required():
+    assert check_field("utm_content", "") == ("", [], None)
+    assert check_field("campaign_name", "") == ("", ["nome_campagna"], None)
+    assert check_field("campaign_name", "Saldi!", lenient=True)[1] == []
+
+
+def _matrix(**overrides):
+    args = dict(
+        destination_url="https://example.com",
+        utm_medium="cpc",
+        campaign_name="lancio",
+        campaign_type="promo",
+        start_date="01/03/2026",
+        sources=["google", "bing"],
+        countries=["it-it", "en-gb"],
+    )
+    args.update(overrides)
+    return utm_core.build_variant_matrix(**args)
+
+
+def test_build_variant_matrix_matches_build_utm_link():
+    matrix = _matrix(contents=["a", "b"])
+    assert len(matrix) == 2 * 2 * 2
+    for cell in matrix:
+        single = build_utm_link(
+            "https://example.com", cell["source_raw"], "cpc", "lancio", "promo", cell["country_raw"],
+            "01/03/2026", utm_content=cell["content_raw"],
+        )
+        assert {k: cell[k] for k in single} == single
+    assert [(c["source_raw"], c["country_raw"], c["content_raw"]) for c in matrix[:3]] == [
+        ("google", "it-it", "a"), ("google", "it-it", "b"), ("google", "en-gb", "a"),
+    ]
+
+
+def test_build_variant_matrix_errors_stay_on_their_cells():
+    matrix = _matrix(sources=["google", "Bing Ads"])
+    by_source = {c["source_raw"]: c for c in matrix if c["country_raw"] == "it-it"}
+    assert by_source["google"]["errors"] == [] and by_source["google"]["final_url"]
+    assert by_source["Bing Ads"]["errors"] == ["source_naming"]
+    assert by_source["Bing Ads"]["final_url"] == ""
+
+
+def test_build_variant_matrix_empty_axes_mean_absent_parameter():
+    matrix = _matrix(sources=["google"], countries=["it-it"], contents=[], terms=None)
+    assert len(matrix) == 1
+    assert "utm_content" not in matrix[0]["final_url"] and "utm_term" not in matrix[0]["final_url"]
+
+
+def test_build_variant_matrix_cell_limit(monkeypatch):
+    monkeypatch.setattr(utm_core, "MATRIX_MAX_CELLS", 12)
+    assert len(_matrix(sources=["a", "b", "c"], countries=["x", "y"], contents=["1", "2"])) == 12
+    with pytest.raises(ValueError, match=r"Troppe combinazioni \(18\): massimo 12"):
+        _matrix(sources=["a", "b", "c"], countries=["x", "y"], contents=["1", "2", "3"])
@@ -0,0 +1,116 @@
+import random
+
+import utm_fragmentation
+from utm_fragmentation import (
+    DOMINANT_RATIO,
+    LONG_KEY_LENGTH,
+    REASON_ALIAS,
+    REASON_CANONICAL,
+    REASON_DOMINANT,
+    REASON_TYPO,
+    REASON_VARIANT,
+    cluster_values,
+)
+from utm_vocabulary import edit_distance, fold
+
+
+def _groups(field, weights):
+    return {frozenset(v["value"] for v in c["values"]) for c in cluster_values(field, weights)}
+
+
+def test_case_separator_alias_and_typo_in_one_group():
+    weights = {"facebook": 5000, "Facebook": 300, "face-book": 20, "fb": 40, "facebok": 15, "google": 9000}
+    [cluster] = cluster_values("source", weights)
+    assert cluster["canonical"] == "facebook"
+    assert cluster["dominant"] == "facebook"
+    assert cluster["sessions"] == 5375
+    assert cluster["fragmented_sessions"] == 375
+    reasons = {v["value"]: v["reason"] for v in cluster["values"]}
+    assert reasons == {
+        "facebook": REASON_CANONICAL,
+        "Facebook": REASON_VARIANT,
+        "face-book": REASON_VARIANT,
+        "fb": REASON_ALIAS,
+        "facebok": REASON_TYPO,
+    }
+
+
+def test_canonical_can_differ_from_the_dominant_value():
+    [cluster] = cluster_values("source", {"Brand.it": 100, "brand.it": 10})
+    assert cluster["dominant"] == "Brand.it"
+    assert cluster["canonical"] == "brand-it"
+    assert {v["value"]: v["reason"] for v in cluster["values"]}["Brand.it"] == REASON_DOMINANT
+    assert cluster["fragmented_sessions"] == 10
+
+
+def test_short_values_and_system_values_are_not_merged():
+    assert cluster_values("medium", {"cpc": 500, "cpm": 10, "(not set)": 50, "(none)": 40}) == []
+
+
+def test_typos_need_dominance_below_long_key_length():
+    short = "newsle"  # sotto LONG_KEY_LENGTH
+    assert len(short) < LONG_KEY_LENGTH
+    assert _groups("campaign", {short: 100, "newsla": 100 // DOMINANT_RATIO + 1}) == set()
+    assert _groups("campaign", {short: 100, "newsla": 100 // DOMINANT_RATIO}) == {frozenset({short, "newsla"})}
+    # Dalla lunghezza LONG_KEY_LENGTH basta una sessione in più
+    assert _groups("campaign", {"instagram": 100, "instagramm": 99}) == {frozenset({"instagram", "instagramm"})}
+
+
+def test_campaigns_with_different_digits_stay_apart():
+    weights = {"it_promo_saldi_01032026": 900, "it_promo_saldi_02032026": 800, "it_promo_sladi_01032026": 5}
+    assert _groups("campaign", weights) == {frozenset({"it_promo_saldi_01032026", "it_promo_sladi_01032026"})}
+
+
+def test_typo_between_two_values_joins_only_the_stronger():
+    weights = {"fr_awr_lancio": 1000, "fr_tr_lancio": 900, "fr_ar_lancio": 3}
+    assert _groups("campaign", weights) == {frozenset({"fr_awr_lancio", "fr_ar_lancio"})}
+
+
+def test_two_guide_values_are_never_merged_as_typos(monkeypatch):
+    monkeypatch.setattr(utm_fragmentation, "guide_weights", lambda field: {"display": 0, "displai": 0})
+    assert _groups("medium", {"display": 1000, "displai": 1}) == set()
+    assert _groups("medium", {"display": 1000, "dislay": 1}) == {frozenset({"display", "dislay"})}
+
+
+def _brute_force_typo_groups(weights):
+    """Stessa regola di cluster_values per i soli refusi, con un confronto a coppie."""
+    keys = {fold(raw): sessions for raw, sessions in weights.items()}
+    parent = {k: k for k in keys}
+
+    def find(k):
+        while parent[k] != k:
+            k = parent[k]
+        return k
+
+    best = {}
+    for a in keys:
+        for b in keys:
+            if (keys[b], b) <= (keys[a], a) or len(a) < 5 or len(b) < 5 or edit_distance(a, b, 1) != 1:
+                continue
+            if len(a) >= LONG_KEY_LENGTH or keys[b] >= DOMINANT_RATIO * keys[a]:
+                if a not in best or (keys[b], b) > (keys[best[a]], best[a]):
+                    best[a] = b
+    for a, b in best.items():
+        parent[find(a)] = find(b)
+    members = {}
+    for k in keys:
+        members.setdefault(find(k), set()).add(k)
+    return {frozenset(m) for m in members.values() if len(m) > 1}
+
+
+def test_typo_blocking_matches_pairwise_comparison():
+    rng = random.Random(50)
+    for _ in range(100):
+        weights = {}
+        for _ in range(25):
+            word = "".join(rng.choices("abc", k=rng.randint(5, 9)))
+            i = rng.randrange(len(word) - 1)
+            typo = rng.choice([
+                word[:i] + rng.choice("abcd") + word[i + 1:],
+                word[:i] + word[i + 1:],
+                word[:i] + rng.choice("abcd") + word[i:],
+                word[:i] + word[i + 1] + word[i] + word[i + 2:],
+            ])
+            weights[word] = rng.randint(1, 100)
+            weights[typo] = rng.randint(1, 100)
+        assert _groups("campaign", weights) == _brute_force_typo_groups(weights)
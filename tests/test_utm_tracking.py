@@ -0,0 +1,66 @@
+from datetime import date, timedelta
+
+import pytest
+
+import utm_history_store
+import utm_tracking
+
+PROPERTY = "123456"
+
+
+def _entry(campaign, source="google", medium="cpc"):
+    return {"utm_source": source, "utm_medium": medium, "utm_campaign": campaign, "property_id": PROPERTY}
+
+
+@pytest.fixture
+def ga4(tmp_path, monkeypatch):
+    """Storico su un database temporaneo e GA4 finto: registra le finestre chieste e risponde da `data`."""
+    monkeypatch.setenv(utm_history_store.DB_PATH_ENV, str(tmp_path / "history.db"))
+    fake = {"calls": [], "data": {}}
+
+    def fetch(property_id, campaigns, start_day, end_day, creds, background=False):
+        fake["calls"].append((start_day, end_day, set(campaigns)))
+        return {
+            (key, day, channel): sessions
+            for (key, day, channel), sessions in fake["data"].items()
+            if start_day.isoformat() <= day <= end_day.isoformat()
+        }
+
+    monkeypatch.setattr(utm_tracking, "_fetch_daily_sessions", fetch)
+    return fake
+
+
+def test_first_sync_reads_the_whole_window(ga4):
+    today = date(2026, 3, 10)
+    utm_tracking.sync_property_partitions(PROPERTY, [_entry("a"), _entry("b")], None, today=today)
+    assert ga4["calls"] == [(today - timedelta(days=utm_tracking.TRACKING_WINDOW_DAYS), today, {"a", "b"})]
+
+
+def test_next_sync_rereads_only_the_restatement_days(ga4):
+    key = utm_tracking.campaign_key(_entry("a"))
+    ga4["data"] = {(key, "2026-03-09", "Paid Search"): 10}
+    utm_tracking.sync_property_partitions(PROPERTY, [_entry("a")], None, today=date(2026, 3, 10))
+
+    # GA4 ha rielaborato il 9 marzo: il nuovo valore sostituisce quello salvato, non si somma
+    ga4["data"] = {(key, "2026-03-09", "Paid Search"): 12, (key, "2026-03-11", "Paid Search"): 5}
+    today = date(2026, 3, 12)
+    utm_tracking.sync_property_partitions(PROPERTY, [_entry("a")], None, today=today)
+    assert ga4["calls"][-1][0] == date(2026, 3, 10) - timedelta(days=utm_tracking.RESTATEMENT_DAYS)
+    assert utm_history_store.get_channel_totals(PROPERTY, key, "2026-02-01") == {"Paid Search": 17}
+
+
+def test_campaigns_with_different_start_days_get_separate_queries(ga4):
+    utm_tracking.sync_property_partitions(PROPERTY, [_entry("a")], None, today=date(2026, 3, 10))
+    today = date(2026, 3, 12)
+    utm_tracking.sync_property_partitions(PROPERTY, [_entry("a"), _entry("b"), _entry("c")], None, today=today)
+    assert ga4["calls"][1:] == [
+        (today - timedelta(days=utm_tracking.TRACKING_WINDOW_DAYS), today, {"b", "c"}),
+        (date(2026, 3, 10) - timedelta(days=utm_tracking.RESTATEMENT_DAYS), today, {"a"}),
+    ]
+
+
+def test_restatement_window_never_starts_before_the_tracking_window(ga4):
+    utm_tracking.sync_property_partitions(PROPERTY, [_entry("a")], None, today=date(2026, 1, 1))
+    today = date(2026, 3, 10)
+    utm_tracking.sync_property_partitions(PROPERTY, [_entry("a")], None, today=today)
+    assert ga4["calls"][-1][0] == today - timedelta(days=utm_tracking.TRACKING_WINDOW_DAYS)
@@ -0,0 +1,81 @@
+import pytest
+
+from utm_vocabulary import DOMINANT_RATIO, build_index, edit_distance
+
+SOURCES = {"facebook": 58000, "Facebook": 2000, "instagram": 30000, "google": 90000, "newsletter": 4000}
+
+
+@pytest.fixture
+def sources():
+    return build_index("source", SOURCES)
+
+
+def test_known_value_has_no_suggestions(sources):
+    result = sources.check("google")
+    assert result == {"value": "google", "known": True, "observed_sessions": 90000, "suggestions": []}
+
+
+def test_case_and_separator_variants_share_a_group(sources):
+    result = sources.check("Face-Book")
+    assert not result["known"]
+    best = result["suggestions"][0]
+    assert (best["value"], best["distance"], best["sessions"]) == ("facebook", 0, 60000)
+    assert best["variants"] == ["facebook", "Facebook"]
+
+
+@pytest.mark.parametrize("typo", ["facebok", "facebookk", "faecbook", "instagramm"])
+def test_typo_suggests_the_nearest_known_value(sources, typo):
+    result = sources.check(typo)
+    assert not result["known"]
+    assert result["suggestions"][0]["reason"] == "simile"
+    assert result["suggestions"][0]["value"] in ("facebook", "instagram")
+    assert 1 <= result["suggestions"][0]["distance"] <= 2
+
+
+def test_short_values_allow_a_single_edit():
+    index = build_index("medium", {"cpc": 100, "cpm": 100})
+    assert [s["value"] for s in index.check("cpx")["suggestions"]] == ["cpc", "cpm"]
+    assert index.check("xyz")["suggestions"] == []
+
+
+def test_alias_only_when_the_target_is_known(sources):
+    result = sources.check("fb")
+    assert result["suggestions"][0]["value"] == "facebook"
+    assert result["suggestions"][0]["reason"] == "abbreviazione"
+    assert build_index("source", {"google": 10}).check("fb")["suggestions"] == []
+
+
+def test_medium_alias_and_normalizer():
+    index = build_index("medium", {"cpc": 500, "social_paid": 200})
+    assert index.check("ppc")["suggestions"][0]["value"] == "cpc"
+    assert index.check("Social-Paid")["value"] == "social_paid"
+    assert index.check("Social-Paid")["known"]
+
+
+def test_known_value_dominated_by_a_neighbour_is_suspicious():
+    weak = 58000 // DOMINANT_RATIO + 1
+    index = build_index("source", {"facebook": 58000, "facebok": weak})
+    assert index.check("facebok")["known"]
+
+    index = build_index("source", {"facebook": 58000, "facebok": 58000 // DOMINANT_RATIO})
+    result = index.check("facebok")
+    assert not result["known"]
+    assert result["observed_sessions"] == 58000 // DOMINANT_RATIO
+    assert [s["value"] for s in result["suggestions"]] == ["facebook"]
+
+
+def test_unknown_value_without_neighbours(sources):
+    result = sources.check("tiktok")
+    assert result == {"value": "tiktok", "known": False, "observed_sessions": 0, "suggestions": []}
+
+
+def test_prefix_fallback(sources):
+    result = sources.check("news")
+    assert result["suggestions"][0]["value"] == "newsletter"
+    assert result["suggestions"][0]["reason"] == "inizia con"
+
+
+def test_edit_distance_counts_transpositions():
+    assert edit_distance("facebook", "faecbook") == 1
+    assert edit_distance("facebook", "facebok") == 1
+    assert edit_distance("facebook", "google", 2) == 3
@@ -0,0 +1,84 @@
+"""
+Risultati dei tool GA4 compatti e con un tetto di token per Gemini.
+
+Tutto ciò che un tool restituisce diventa prompt del passo successivo del
+modello. I report arrivano già in forma tabellare da ga4_mcp_tools (colonne una
+volta sola, righe come liste, totali e row_count); qui l'albero degli account
+diventa una tabella di property e ogni risultato viene tagliato a
+TOOL_RESULT_MAX_TOKENS (stima: 1 token ogni ~4 caratteri di JSON compatto)
+togliendo righe in fondo, con more_available a segnalare il taglio.
+Il tetto si configura con CHAT_TOOL_RESULT_MAX_TOKENS.
+"""
+import functools
+import json
+import os
+from typing import Any, Callable, Dict, List, Optional
+
+MAX_TOKENS_ENV = "CHAT_TOOL_RESULT_MAX_TOKENS"
+DEFAULT_MAX_TOKENS = 1500
+CHARS_PER_TOKEN = 4
+
+
+def max_tokens() -> int:
+    try:
+        return max(100, int(os.environ.get(MAX_TOKENS_ENV, "") or DEFAULT_MAX_TOKENS))
+    except ValueError:
+        return DEFAULT_MAX_TOKENS
+
+
+def estimate_tokens(value: Any) -> int:
+    return len(json.dumps(value, ensure_ascii=False, separators=(",", ":"), default=str)) // CHARS_PER_TOKEN + 1
+
+
+def compact_account_summaries(summaries: Any) -> Any:
+    """Albero account -> property come tabella (property_id senza prefisso, property, account)."""
+    if not isinstance(summaries, list):
+        return summaries
+    rows = [
+        [prop["property_id"].replace("properties/", ""), prop["display_name"], account["display_name"]]
+        for account in summaries
+        for prop in account.get("properties", [])
+    ]
+    return {"columns": ["property_id", "property", "account"], "rows": rows, "row_count": len(rows), "more_available": False}
+
+
+def _fit_rows(result: Dict[str, Any], key: str, limit: int) -> Dict[str, Any]:
+    """Tiene il massimo numero di righe iniziali (le più rilevanti) che sta nel tetto."""
+    items: List[Any] = result[key]
+
+    def _capped(n: int) -> Dict[str, Any]:
+        capped = {**result, key: items[:n], "more_available": True, "truncated": f"{len(items) - n} righe omesse per il limite di token"}
+        capped.setdefault("row_count", len(items))
+        return capped
+
+    low, high = 0, len(items)
+    while low < high:
+        mid = (low + high + 1) // 2
+        if estimate_tokens(_capped(mid)) <= limit:
+            low = mid
+        else:
+            high = mid - 1
+    return _capped(low)
+
+
+def cap_result(result: Any, limit: Optional[int] = None) -> Any:
+    """Riduce `result` entro `limit` token (default max_tokens()); invariato se ci sta già."""
+    limit = limit or max_tokens()
+    if estimate_tokens(result) <= limit:
+        return result
+    if isinstance(result, list):
+        return _fit_rows({"items": result}, "items", limit)
+    if isinstance(result, dict):
+        for key in ("rows", "candidates", "items"):
+            if isinstance(result.get(key), list):
+                return _fit_rows(result, key, limit)
+    text = result if isinstance(result, str) else json.dumps(result, ensure_ascii=False, default=str)
+    return {"text": text[: limit * CHARS_PER_TOKEN], "more_available": True, "truncated": "testo tagliato per il limite di token"}
+
+
+def capped(fn: Callable) -> Callable:
+    """Avvolge un tool applicando cap_result; functools.wraps preserva la firma letta da Gemini."""
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        return cap_result(fn(*args, **kwargs))
+    return wrapper
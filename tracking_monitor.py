@@ -0,0 +1,162 @@
+"""
+Monitor in background del tracking dei link dello storico.
+
+Un thread per processo ricontrolla periodicamente le righe ancora nella finestra
+di monitoraggio (dalla data live a MONITOR_WINDOW_DAYS dopo) e salva l'esito in
+utm_history_store, così il tab storico mostra subito lo stato aggiornato.
+
+Le verifiche girano con le credenziali degli utenti che hanno una sessione
+attiva (register_credentials dal dashboard): le righe degli altri utenti
+restano in attesa del loro prossimo accesso. Prima le campagne a cui è appena
+finito il grace period, poi quelle mai verificate, poi le verifiche più vecchie.
+Le richieste GA4 sono in modalità background (ga4_quota rallenta o rimanda quando
+la quota della property scarseggia); gli esiti DEFERRED non sovrascrivono lo stato salvato.
+"""
+import logging
+import threading
+import time
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+import utm_history_store
+from utm_core import parse_ddmmyyyy_to_date
+from utm_tracking import DEFAULT_GRACE_DAYS, check_tracking_status_for_entries
+
+logger = logging.getLogger(__name__)
+
+MONITOR_INTERVAL_SECONDS = 15 * 60
+MONITOR_WINDOW_DAYS = 30
+RECHECK_AFTER_SECONDS = 6 * 60 * 60
+MAX_CHECKS_PER_CYCLE = 200
+# Campagne il cui grace period è finito da non più di questi giorni: verificate per prime
+JUST_ENDED_GRACE_DAYS = 2
+CREDENTIALS_TTL_SECONDS = 12 * 60 * 60
+
+_credentials = {}  # user_email -> (registrata alle, creds)
+_credentials_lock = threading.Lock()
+
+
+def register_credentials(user_email: str, creds: Any) -> None:
+    """Rende disponibili al monitor le credenziali di una sessione attiva."""
+    if not user_email or creds is None:
+        return
+    with _credentials_lock:
+        _credentials[user_email] = (time.monotonic(), creds)
+
+
+def unregister_credentials(user_email: str) -> None:
+    with _credentials_lock:
+        _credentials.pop(user_email, None)
+
+
+def active_credentials() -> Dict[str, Any]:
+    """Credenziali registrate e non scadute, per utente."""
+    now = time.monotonic()
+    with _credentials_lock:
+        for email in [e for e, (ts, _) in _credentials.items() if now - ts > CREDENTIALS_TTL_SECONDS]:
+            del _credentials[email]
+        return {email: creds for email, (_, creds) in _credentials.items()}
+
+
+def _parse_checked_at(value: Optional[str]) -> Optional[datetime]:
+    try:
+        return datetime.strptime(value, "%Y-%m-%d %H:%M:%S") if value else None
+    except ValueError:
+        return None
+
+
+def select_due_entries(entries: List[Dict[str, Any]], today: Optional[date] = None,
+                       now: Optional[datetime] = None, grace_days: int = DEFAULT_GRACE_DAYS) -> List[Dict[str, Any]]:
+    """Righe nella finestra di monitoraggio da (ri)verificare, in ordine di priorità."""
+    today = today or date.today()
+    now = now or datetime.now()
+    due = []
+    for entry in entries:
+        live = parse_ddmmyyyy_to_date(entry.get("live_date", ""))
+        if not live or not entry.get("property_id") or live > today or today > live + timedelta(days=MONITOR_WINDOW_DAYS):
+            continue
+        checked_at = _parse_checked_at(entry.get("tracking_checked_at"))
+        grace_end = live + timedelta(days=grace_days)
+        just_ended = 0 < (today - grace_end).days <= JUST_ENDED_GRACE_DAYS
+        if checked_at:
+            stale = (now - checked_at).total_seconds() >= RECHECK_AFTER_SECONDS
+            # Il primo controllo dopo la fine del grace period non aspetta RECHECK_AFTER_SECONDS
+            checked_before_grace_end = checked_at.date() <= grace_end
+            if not stale and not (just_ended and checked_before_grace_end):
+                continue
+        priority = (
+            0 if just_ended else 1,
+            0 if checked_at is None else 1,
+            checked_at or datetime.min,
+        )
+        due.append((priority, entry))
+    due.sort(key=lambda x: x[0])
+    return [entry for _, entry in due]
+
+
+def run_cycle(max_checks: int = MAX_CHECKS_PER_CYCLE) -> Dict[str, int]:
+    """Un giro di verifiche. Ritorna i conteggi per stato."""
+    creds_by_user = active_credentials()
+    counts: Dict[str, int] = {}
+    if not creds_by_user:
+        return counts
+    entries = [e for user_email in creds_by_user for e in utm_history_store.list_entries(user_email)]
+    by_user = {}
+    for entry in select_due_entries(entries)[:max_checks]:
+        by_user.setdefault(entry["user_email"], []).append(entry)
+    for user_email, user_entries in by_user.items():
+        # Una sincronizzazione incrementale per property (vedi utm_tracking)
+        results = check_tracking_status_for_entries(user_entries, creds_by_user[user_email], background=True)
+        for entry, result in zip(user_entries, results):
+            counts[result["status"]] = counts.get(result["status"], 0) + 1
+            if result["status"] == "DEFERRED":
+                continue
+            utm_history_store.save_tracking_result(entry["id"], result)
+    return counts
+
+
+class TrackingMonitor:
+    """Thread daemon che esegue run_cycle ogni MONITOR_INTERVAL_SECONDS."""
+
+    def __init__(self, interval: float = MONITOR_INTERVAL_SECONDS):
+        self.interval = interval
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self.last_run_at: Optional[datetime] = None
+        self.last_counts: Dict[str, int] = {}
+        self._thread = threading.Thread(target=self._loop, name="tracking-monitor", daemon=True)
+
+    def start(self) -> "TrackingMonitor":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._wake.set()
+
+    def wake(self) -> None:
+        """Anticipa il prossimo giro (es. subito dopo il login di un utente)."""
+        self._wake.set()
+
+    def _loop(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self.last_counts = run_cycle()
+            except Exception:
+                logger.exception("Tracking monitor: giro di verifiche fallito")
+            self.last_run_at = datetime.now()
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+
+_monitor: Optional[TrackingMonitor] = None
+_monitor_lock = threading.Lock()
+
+
+def ensure_started() -> TrackingMonitor:
+    """Avvia il monitor una sola volta per processo."""
+    global _monitor
+    with _monitor_lock:
+        if _monitor is None:
+            _monitor = TrackingMonitor().start()
+        return _monitor
@@ -0,0 +1,270 @@
+"""
+Generazione massiva di link UTM da un media plan CSV, senza browser.
+
+Legge il CSV in streaming, costruisce i link con le stesse regole del builder
+(utm_core.build_utm_link) e scrive il risultato a blocchi, quindi la memoria
+resta costante anche su piani da decine di migliaia di righe.
+
+Uso:
+    python utm_bulk.py piano.csv -o link.csv
+    cat piano.csv | python utm_bulk.py - --lenient > link.csv
+    python utm_bulk.py piano.csv -o link.csv --upsert --user-email me@example.com --property-id 123456
+    python utm_bulk.py piano.csv -o link.csv --verify-landing --measurement-id G-ABC123XYZ
+    python utm_bulk.py piano.csv -o link.csv --suggest-values --vocabulary sorgenti_ga4.csv
+
+Colonne riconosciute (intestazioni case-insensitive, alias tra parentesi):
+    destination_url (url), utm_source (source), utm_medium (medium),
+    campaign_name (campagna), campaign_type (tipo), country_language (lingua, country),
+    start_date (live_date, data), utm_content (content), utm_term (term),
+    property_id, property_name (opzionali, per lo storico)
+Le colonne del file di input vengono mantenute; si aggiungono final_url, utm_campaign,
+expected_channel_group, valid, errors e naming_issues; con --verify-landing anche
+landing_status e landing_message (landing_verifier: redirect, UTM all'arrivo, tag GA4);
+con --suggest-values anche source_suggestion e medium_suggestion, il valore noto più
+vicino a una source/medium mai vista (utm_vocabulary: storico di --user-email, tabella guida ed
+eventuale export GA4 passato con --vocabulary, colonne source, medium, sessions).
+"""
+import argparse
+import csv
+import sys
+import time
+from itertools import islice
+
+import utm_core
+
+COLUMN_ALIASES = {
+    "destination_url": ("destination_url", "url"),
+    "utm_source": ("utm_source", "source"),
+    "utm_medium": ("utm_medium", "medium"),
+    "campaign_name": ("campaign_name", "campagna"),
+    "campaign_type": ("campaign_type", "tipo"),
+    "country_language": ("country_language", "lingua", "country"),
+    "start_date": ("start_date", "live_date", "data"),
+    "utm_content": ("utm_content", "content"),
+    "utm_term": ("utm_term", "term"),
+    "property_id": ("property_id",),
+    "property_name": ("property_name",),
+}
+OUTPUT_FIELDS = ["final_url", "utm_campaign", "expected_channel_group", "valid", "errors", "naming_issues"]
+LANDING_FIELDS = ["landing_status", "landing_message"]
+SUGGESTION_FIELDS = ["source_suggestion", "medium_suggestion"]
+DEFAULT_CHUNK_SIZE = 1000
+
+
+def resolve_columns(header):
+    """Mappa i campi logici sulle colonne effettive del CSV."""
+    by_lower = {h.strip().lower(): h for h in header or []}
+    mapping = {}
+    for field, aliases in COLUMN_ALIASES.items():
+        for alias in aliases:
+            if alias in by_lower:
+                mapping[field] = by_lower[alias]
+                break
+    return mapping
+
+
+def process_row(row, columns, lenient=False):
+    """Costruisce il link per una riga del piano. Ritorna (riga di output, link)."""
+    def get(field):
+        col = columns.get(field)
+        return (row.get(col) or "").strip() if col else ""
+
+    link = utm_core.build_utm_link(
+        get("destination_url"),
+        get("utm_source"),
+        get("utm_medium"),
+        get("campaign_name"),
+        get("campaign_type"),
+        get("country_language"),
+        get("start_date"),
+        utm_content=get("utm_content"),
+        utm_term=get("utm_term"),
+        lenient=lenient,
+    )
+    out = dict(row)
+    out.update({
+        "final_url": link["final_url"],
+        "utm_campaign": link["utm_campaign"],
+        "expected_channel_group": link["expected_channel_group"],
+        "valid": "1" if link["final_url"] else "0",
+        "errors": ", ".join(link["errors"]),
+        "naming_issues": "; ".join(
+            f"{field}: {', '.join(problems)} (suggerito: {suggestion})"
+            for field, (problems, suggestion) in link["issues"].items()
+        ),
+    })
+    return out, link
+
+
+def generate_links(rows, columns, lenient=False):
+    """Generatore di (riga di output, link) per ogni riga del piano."""
+    for row in rows:
+        yield process_row(row, columns, lenient=lenient)
+
+
+def load_vocabulary(path):
+    """Pesi per campo da un CSV source, medium, sessions (es. export GA4 sessionSource × sessionMedium)."""
+    weights = {"source": {}, "medium": {}}
+    with open(path, "r", encoding="utf-8-sig", newline="") as f:
+        for row in csv.DictReader(f):
+            row = {(k or "").strip().lower(): (v or "").strip() for k, v in row.items()}
+            try:
+                sessions = int(float(row.get("sessions") or 0))
+            except ValueError:
+                sessions = 0
+            for field in weights:
+                value = row.get(field) or row.get(f"session{field}") or row.get(f"utm_{field}")
+                if value:
+                    weights[field][value] = weights[field].get(value, 0) + sessions
+    return weights
+
+
+class ValueSuggester:
+    """Suggerimenti per source/medium non noti, con un indice per property e risultati memorizzati per valore."""
+
+    def __init__(self, vocabulary=None, user_email=""):
+        self.vocabulary = vocabulary or {}
+        self.user_email = user_email
+        self._indexes = {}
+        self._results = {}
+
+    def suggest(self, field, value, property_id=""):
+        import utm_vocabulary
+
+        if not value:
+            return ""
+        cache_key = (field, property_id, value)
+        if cache_key not in self._results:
+            index_key = (field, property_id)
+            if index_key not in self._indexes:
+                self._indexes[index_key] = utm_vocabulary.get_offline_index(
+                    field, property_id or None, self.vocabulary.get(field), user_email=self.user_email
+                )
+            result = self._indexes[index_key].check(value)
+            best = result["suggestions"][0] if not result["known"] and result["suggestions"] else None
+            self._results[cache_key] = f"{best['value']} ({best['reason']}, distanza {best['distance']})" if best else ""
+        return self._results[cache_key]
+
+
+def _chunks(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def run(in_stream, out_stream, lenient=False, chunk_size=DEFAULT_CHUNK_SIZE, upsert=False,
+        user_email="", property_id="", property_name="", verify_landing=False, measurement_ids=(),
+        suggest_values=False, vocabulary=None, log=sys.stderr):
+    """Elabora il CSV a blocchi di `chunk_size` righe. Ritorna le statistiche dell'esecuzione."""
+    reader = csv.DictReader(in_stream)
+    columns = resolve_columns(reader.fieldnames)
+    missing = [f for f in ("destination_url", "utm_source", "utm_medium", "campaign_name") if f not in columns]
+    if missing:
+        raise ValueError(f"Colonne obbligatorie mancanti nel CSV: {', '.join(missing)}")
+
+    if upsert:
+        import utm_history_store
+    if verify_landing:
+        import landing_verifier
+    suggester = ValueSuggester(vocabulary, user_email) if suggest_values else None
+
+    output_fields = OUTPUT_FIELDS + (LANDING_FIELDS if verify_landing else []) + (SUGGESTION_FIELDS if suggester else [])
+    writer = csv.DictWriter(out_stream, fieldnames=list(reader.fieldnames) + output_fields, extrasaction="ignore")
+    writer.writeheader()
+    stats = {"rows": 0, "valid": 0, "invalid": 0, "upserted": 0, "landing_errors": 0}
+    started = time.perf_counter()
+    for chunk in _chunks(generate_links(reader, columns, lenient=lenient), chunk_size):
+        valid = [(out, link) for out, link in chunk if link["final_url"]]
+        if verify_landing and valid:
+            # Un blocco alla volta: le landing dello stesso blocco sono verificate in parallelo
+            results = dict(landing_verifier.iter_landing_checks(
+                [link["final_url"] for _, link in valid],
+                {link["final_url"]: measurement_ids for _, link in valid},
+            ))
+            for out, link in valid:
+                result = results[link["final_url"]]
+                out["landing_status"] = result["status"]
+                out["landing_message"] = result["message"]
+                stats["landing_errors"] += result["status"] == "ERROR"
+        if suggester:
+            for out, _ in chunk:
+                row_property = (out.get(columns.get("property_id", "")) or property_id or "").strip()
+                out["source_suggestion"] = suggester.suggest("source", (out.get(columns["utm_source"]) or "").strip(), row_property)
+                out["medium_suggestion"] = suggester.suggest("medium", (out.get(columns["utm_medium"]) or "").strip(), row_property)
+        writer.writerows(out for out, _ in chunk)
+        out_stream.flush()
+        stats["rows"] += len(chunk)
+        stats["valid"] += len(valid)
+        stats["invalid"] += len(chunk) - len(valid)
+        if upsert and valid:
+            entries = [
+                utm_core.make_history_entry(
+                    link,
+                    (out.get(columns["campaign_name"]) or "").strip(),
+                    user_email=user_email,
+                    property_id=(out.get(columns.get("property_id", "")) or property_id or "").strip(),
+                    property_name=(out.get(columns.get("property_name", "")) or property_name or "").strip(),
+                )
+                for out, link in valid
+            ]
+            stats["upserted"] += utm_history_store.upsert_entries(entries)
+        if log:
+            print(f"... {stats['rows']} righe elaborate", file=log)
+    stats["seconds"] = round(time.perf_counter() - started, 3)
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Genera link UTM in blocco da un media plan CSV")
+    parser.add_argument("input", help="file CSV di input ('-' per stdin)")
+    parser.add_argument("-o", "--output", default="-", help="file CSV di output (default stdout)")
+    parser.add_argument("--lenient", action="store_true", help="i problemi di naming non bloccano il link: usa i valori normalizzati")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--upsert", action="store_true", help="salva i link validi nello storico UTM (utm_history_store)")
+    parser.add_argument("--user-email", default="", help="utente a cui associare i link salvati (e il cui storico alimenta --suggest-values)")
+    parser.add_argument("--property-id", default="", help="property GA4 di default se il CSV non ha la colonna property_id")
+    parser.add_argument("--property-name", default="")
+    parser.add_argument("--verify-landing", action="store_true", help="scarica le landing dei link validi: redirect, UTM all'arrivo, tag GA4")
+    parser.add_argument("--measurement-id", action="append", default=[], help="measurement ID (G-...) atteso nelle landing; ripetibile")
+    parser.add_argument("--suggest-values", action="store_true", help="suggerisce il valore noto più vicino per source/medium mai visti (es. facebok -> facebook)")
+    parser.add_argument("--vocabulary", default="", help="CSV source, medium, sessions con i valori osservati in GA4 (con --suggest-values)")
+    parser.add_argument("--quiet", action="store_true")
+    args = parser.parse_args(argv)
+
+    in_stream = sys.stdin if args.input == "-" else open(args.input, "r", encoding="utf-8-sig", newline="")
+    out_stream = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8", newline="")
+    try:
+        stats = run(
+            in_stream, out_stream,
+            lenient=args.lenient, chunk_size=max(1, args.chunk_size), upsert=args.upsert,
+            user_email=args.user_email, property_id=args.property_id, property_name=args.property_name,
+            verify_landing=args.verify_landing, measurement_ids=args.measurement_id,
+            suggest_values=args.suggest_values or bool(args.vocabulary),
+            vocabulary=load_vocabulary(args.vocabulary) if args.vocabulary else None,
+            log=None if args.quiet else sys.stderr,
+        )
+    except ValueError as e:
+        print(f"Errore: {e}", file=sys.stderr)
+        return 2
+    finally:
+        if in_stream is not sys.stdin:
+            in_stream.close()
+        if out_stream is not sys.stdout:
+            out_stream.close()
+
+    rate = stats["rows"] / stats["seconds"] if stats["seconds"] else 0
+    print(
+        f"Righe: {stats['rows']}, valide: {stats['valid']}, con errori: {stats['invalid']}, "
+        f"salvate nello storico: {stats['upserted']} ({stats['seconds']}s, {rate:,.0f} righe/s)",
+        file=sys.stderr,
+    )
+    if args.verify_landing:
+        print(f"Landing page con errori: {stats['landing_errors']}", file=sys.stderr)
+    return 0 if stats["invalid"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
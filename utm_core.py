@@ -0,0 +1,393 @@
+"""
+Logica di costruzione dei link UTM, senza dipendenze da Streamlit.
+
+Normalizzazione dei valori, composizione del nome campagna (lang_type_name_date),
+controlli di naming e canale GA4 atteso: usata dal builder in app.py, dal chatbot
+e dalla CLI utm_bulk.py.
+"""
+import re
+from datetime import date, datetime
+
+from slugify import slugify
+
+# --- DATI GUIDA (Fallback e Mapping) ---
+GUIDE_TABLE_DATA = [
+    {"Traffic type": "Organic", "utm_medium": "organic", "utm_source": "google, bing, yahoo"},
+    {"Traffic type": "Referral", "utm_medium": "referral", "utm_source": "(domain)"},
+    {"Traffic type": "Direct", "utm_medium": "(none)", "utm_source": "(direct)"},
+    {"Traffic type": "Paid Search", "utm_medium": "cpc", "utm_source": "google, bing"},
+    {"Traffic type": "Affiliate", "utm_medium": "affiliate", "utm_source": "tradetracker, awin"},
+    {"Traffic type": "Display", "utm_medium": "cpm", "utm_source": "reservation, display, dv360, google"},
+    {"Traffic type": "Video", "utm_medium": "cpv", "utm_source": "youtube, vimeo, google"},
+    {"Traffic type": "Programmatic", "utm_medium": "cpm", "utm_source": "rcs, mediamond, rai, manzoni"},
+    {"Traffic type": "Email", "utm_medium": "email|mailing_campaign", "utm_source": "newsletter, email, crm, sfmc, mailchimp"},
+    {"Traffic type": "Organic Social", "utm_medium": "social_org", "utm_source": "facebook, instagram, tiktok, linkedin, pinterest"},
+    {"Traffic type": "Paid Social", "utm_medium": "social_paid", "utm_source": "facebook, instagram, tiktok, linkedin, pinterest"},
+    {"Traffic type": "App traffic", "utm_medium": "-", "utm_source": "app"},
+    {"Traffic type": "SMS", "utm_medium": "offline", "utm_source": "sms"},
+    {"Traffic type": "Altro", "utm_medium": "other", "utm_source": ""},
+]
+
+# --- UTILS ---
+def get_source_options():
+    sources = set()
+    for row in GUIDE_TABLE_DATA:
+        parts = row["utm_source"].split(",")
+        for p in parts:
+            clean = p.strip().replace("...", "")
+            if clean and "(" not in clean and "[" not in clean:
+                sources.add(clean)
+    return [""] + sorted(list(sources)) + ["Altro (Inserisci manuale)"]
+
+def get_compatible_channels(selected_source, all_client_channels):
+    if not selected_source or selected_source == "Altro (Inserisci manuale)":
+        return [""] + all_client_channels
+    norm_source = selected_source.strip().lower()
+    compatible_types = set()
+    for row in GUIDE_TABLE_DATA:
+        row_sources = [s.strip().lower() for s in row["utm_source"].split(",")]
+        if norm_source in row_sources:
+            compatible_types.add(row["Traffic type"])
+    if not compatible_types:
+        return [""] + all_client_channels
+    filtered_channels = [c for c in all_client_channels if c in compatible_types]
+    return [""] + sorted(filtered_channels) if filtered_channels else [""] + all_client_channels
+
+def normalize_token(text):
+    if not text: return ""
+    return slugify(text, separator="-", lowercase=True)
+
+def normalize_medium_token(text):
+    """Normalizza utm_medium preservando underscore GA4 (es. social_paid)."""
+    if not text:
+        return ""
+    value = str(text).strip().lower()
+    value = value.replace("-", "_")
+    value = re.sub(r"\s+", "_", value)
+    value = re.sub(r"[^a-z0-9_-]", "", value)
+    value = re.sub(r"_+", "_", value).strip("_")
+    return value
+
+def suggest_naming_value(text, prefer_hyphen=True):
+    """Produce a best-practice suggestion for campaign naming values."""
+    if not text:
+        return ""
+    value = str(text).strip().lower()
+    value = re.sub(r"\s+", "-", value)
+    value = re.sub(r"[^a-z0-9_-]", "", value)
+    if prefer_hyphen:
+        value = value.replace("_", "-")
+    value = re.sub(r"-{2,}", "-", value)
+    value = re.sub(r"_{2,}", "_", value)
+    return value.strip("-_")
+
+def validate_naming_rules(text, prefer_hyphen=True):
+    """Return (issues, suggestion) for naming best-practices validation."""
+    issues = []
+    if not text:
+        return issues, ""
+    raw = str(text).strip()
+    suggestion = suggest_naming_value(raw, prefer_hyphen=prefer_hyphen)
+
+    if raw != raw.lower():
+        issues.append("usa solo minuscole")
+    if re.search(r"\s", raw):
+        issues.append("evita spazi")
+    if re.search(r"[^A-Za-z0-9_-]", raw):
+        issues.append("evita caratteri speciali")
+    if prefer_hyphen and "_" in raw:
+        issues.append("preferisci trattini (-) agli underscore (_)")
+    if len(raw) > 50:
+        issues.append("mantieni il nome descrittivo ma conciso")
+    return issues, suggestion
+
+def filter_options_by_source_mode(options, mode, field):
+    """Filter source/medium options according to selected traffic source mode."""
+    if field == "medium":
+        tokens = [normalize_medium_token(o) for o in options if normalize_medium_token(o)]
+    else:
+        tokens = [normalize_token(o) for o in options if normalize_token(o)]
+    if mode == "Custom values":
+        return sorted(set(tokens))
+
+    if field == "source":
+        source_map = {
+            "Google Ads": ["google", "adwords", "googleads", "bing"],
+            "Social": ["facebook", "instagram", "tiktok", "linkedin", "pinterest", "social", "meta", "twitter", "x"],
+            "Email": ["email", "newsletter", "crm", "mailchimp", "sfmc"],
+        }
+        hints = source_map.get(mode, [])
+    else:
+        medium_map = {
+            "Google Ads": ["cpc", "ppc", "paid-search", "paid_search", "sem"],
+            "Social": ["social", "social_paid", "social_org", "paid-social", "organic-social", "organic_social", "paid_social"],
+            "Email": ["email", "mailing_campaign", "newsletter", "mail"],
+        }
+        hints = medium_map.get(mode, [])
+
+    filtered = [t for t in tokens if any(h in t for h in hints)]
+    return sorted(set(filtered))
+
+def is_valid_url(url):
+    regex = re.compile(r'^https?://(?:(?:[A-Z0-9](?:[A-Z0-9-]{0,61}[A-Z0-9])?\.)+[A-Z]{2,6}\.?|localhost|\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3})(?::\d+)?(?:/?|[/?]\S+)$', re.IGNORECASE)
+    return re.match(regex, url) is not None
+
+def infer_expected_channel_group(utm_medium: str) -> str:
+    m = normalize_medium_token(utm_medium)
+    if m in ("social_paid", "paid_social", "paid-social"):
+        return "Paid Social"
+    if m in ("social_org", "organic_social", "organic-social"):
+        return "Organic Social"
+    if m in ("email", "mailing_campaign", "newsletter"):
+        return "Email"
+    if m in ("cpc", "ppc", "sem", "paid_search", "paid-search"):
+        return "Paid Search"
+    if m in ("cpm", "display"):
+        return "Display"
+    if m == "referral":
+        return "Referral"
+    if m == "organic":
+        return "Organic Search"
+    return "Other"
+
+def parse_ddmmyyyy_to_date(date_str: str):
+    try:
+        return datetime.strptime(date_str, "%d/%m/%Y").date()
+    except Exception:
+        return None
+
+def _extract_live_date_from_utm_campaign(utm_campaign: str) -> str:
+    campaign = (utm_campaign or "").strip().lower()
+    for token in campaign.split("_"):
+        if re.fullmatch(r"\d{8}", token):
+            try:
+                dt = datetime.strptime(token, "%d%m%Y")
+                return dt.strftime("%d/%m/%Y")
+            except Exception:
+                continue
+    return datetime.today().strftime("%d/%m/%Y")
+
+def build_property_name_lookup(accounts_structure):
+    lookup = {}
+    if not isinstance(accounts_structure, list):
+        return lookup
+    for acc in accounts_structure:
+        for p in acc.get("properties", []) or []:
+            pid_raw = str(p.get("property_id", "")).strip()
+            if not pid_raw:
+                continue
+            pid_num = pid_raw.replace("properties/", "")
+            name = p.get("display_name", "")
+            if name:
+                lookup[pid_raw] = name
+                lookup[pid_num] = name
+    return lookup
+
+# --- COSTRUZIONE LINK ---
+# Regole per campo: (errore se mancante, errore di naming, preferenza trattini, normalizzatore).
+# I campi senza errore "mancante" sono opzionali.
+FIELD_RULES = {
+    "utm_source": ("utm_source", "source_naming", True, normalize_token),
+    "utm_medium": ("utm_medium", "medium_naming", False, normalize_medium_token),
+    "campaign_name": ("nome_campagna", "campaign_name_naming", True, normalize_token),
+    "campaign_type": ("campaign_type", "campaign_type_naming", True, normalize_token),
+    "country_language": ("country_lingua", "country_lingua_naming", True, normalize_token),
+    "utm_content": (None, "content_naming", True, normalize_token),
+    "utm_term": (None, "term_naming", True, normalize_token),
+}
+MATRIX_MAX_CELLS = 5000
+
+def parse_start_date(value):
+    """Accetta date/datetime o stringhe dd/mm/yyyy, yyyy-mm-dd, ddmmyyyy. None se non valida."""
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    text = str(value or "").strip()
+    for fmt in ("%d/%m/%Y", "%Y-%m-%d", "%d%m%Y", "%d-%m-%Y"):
+        try:
+            return datetime.strptime(text, fmt).date()
+        except ValueError:
+            continue
+    return None
+
+def compose_campaign(country_language, campaign_type, campaign_name, start_date):
+    """Nome campagna nel formato lang_type_name_ddmmyyyy (le parti vuote vengono saltate)."""
+    parts = [
+        normalize_token(country_language),
+        normalize_token(campaign_type),
+        normalize_token(campaign_name),
+        start_date.strftime("%d%m%Y") if start_date else "",
+    ]
+    return "_".join(p for p in parts if p)
+
+def check_field(field, value, lenient=False):
+    """Normalizza e valida un campo. Ritorna (valore normalizzato, errori, (problemi, suggerimento) o None)."""
+    missing_error, naming_error, prefer_hyphen, normalizer = FIELD_RULES[field]
+    raw = value or ""
+    normalized = normalizer(raw)
+    errors = []
+    if missing_error and not normalized:
+        errors.append(missing_error)
+    field_issues, suggestion = validate_naming_rules(raw, prefer_hyphen=prefer_hyphen)
+    issue = (field_issues, suggestion) if field_issues else None
+    if issue and not lenient:
+        errors.append(naming_error)
+    return normalized, errors, issue
+
+def _check_destination(destination_url, start_date):
+    destination_url = (destination_url or "").strip()
+    start = parse_start_date(start_date)
+    errors = []
+    if not destination_url or not is_valid_url(destination_url):
+        errors.append("URL")
+    if start is None:
+        errors.append("data_inizio")
+    return destination_url, start, errors
+
+def _assemble_link(destination_url, start, values, errors, issues):
+    """Compone il link da valori già normalizzati/validati (vedi check_field)."""
+    date_part = start.strftime("%d%m%Y") if start else ""
+    p_cmp = "_".join(p for p in (values["country_language"], values["campaign_type"], values["campaign_name"], date_part) if p)
+    final_url = ""
+    if not errors:
+        sep = "&" if "?" in destination_url else "?"
+        final_url = f"{destination_url}{sep}utm_source={values['utm_source']}&utm_medium={values['utm_medium']}&utm_campaign={p_cmp}"
+        if values["utm_content"]:
+            final_url += f"&utm_content={values['utm_content']}"
+        if values["utm_term"]:
+            final_url += f"&utm_term={values['utm_term']}"
+    return {
+        "final_url": final_url,
+        "utm_source": values["utm_source"],
+        "utm_medium": values["utm_medium"],
+        "utm_campaign": p_cmp,
+        "utm_content": values["utm_content"],
+        "utm_term": values["utm_term"],
+        "live_date": start.strftime("%d/%m/%Y") if start else "",
+        "expected_channel_group": infer_expected_channel_group(values["utm_medium"]),
+        "errors": errors,
+        "issues": issues,
+    }
+
+def build_utm_link(
+    destination_url,
+    utm_source,
+    utm_medium,
+    campaign_name,
+    campaign_type,
+    country_language,
+    start_date,
+    utm_content="",
+    utm_term="",
+    lenient=False,
+):
+    """
+    Costruisce il link finale con le stesse regole del builder.
+    Ritorna un dict con final_url ("" se ci sono errori), parametri normalizzati,
+    canale atteso, `errors` (campi mancanti o non conformi) e `issues`
+    ({campo: (problemi, suggerimento)}). Con `lenient` i problemi di naming non
+    bloccano il link: si usano i valori normalizzati.
+    """
+    raw = {
+        "utm_source": utm_source,
+        "utm_medium": utm_medium,
+        "campaign_name": campaign_name,
+        "campaign_type": campaign_type,
+        "country_language": country_language,
+        "utm_content": utm_content,
+        "utm_term": utm_term,
+    }
+    destination_url, start, errors = _check_destination(destination_url, start_date)
+    values, issues = {}, {}
+    for field, value in raw.items():
+        values[field], field_errors, issue = check_field(field, value, lenient=lenient)
+        errors.extend(field_errors)
+        if issue:
+            issues[field] = issue
+    return _assemble_link(destination_url, start, values, errors, issues)
+
+def split_values(text):
+    """Valori di una lista inserita a mano (separati da virgola o a capo), senza duplicati e nell'ordine dato."""
+    seen, values = set(), []
+    for part in re.split(r"[,\n]", str(text or "")):
+        part = part.strip()
+        if part and part not in seen:
+            seen.add(part)
+            values.append(part)
+    return values
+
+def build_variant_matrix(
+    destination_url,
+    utm_medium,
+    campaign_name,
+    campaign_type,
+    start_date,
+    sources,
+    countries,
+    contents=None,
+    terms=None,
+    lenient=False,
+):
+    """
+    Prodotto cartesiano sorgenti x country/lingua x content x term con le regole di build_utm_link.
+    Ogni valore distinto viene normalizzato e validato una volta sola; per ogni cella si
+    compongono solo le stringhe. Liste vuote di content/term = parametro assente.
+    Ritorna la lista dei link (stesso formato di build_utm_link, con `source_raw`, `country_raw`,
+    `content_raw`, `term_raw`). ValueError se le celle superano MATRIX_MAX_CELLS.
+    """
+    sources = list(sources) or [""]
+    countries = list(countries) or [""]
+    contents = list(contents or []) or [""]
+    terms = list(terms or []) or [""]
+    cells = len(sources) * len(countries) * len(contents) * len(terms)
+    if cells > MATRIX_MAX_CELLS:
+        raise ValueError(f"Troppe combinazioni ({cells}): massimo {MATRIX_MAX_CELLS}")
+
+    destination_url, start, base_errors = _check_destination(destination_url, start_date)
+    base_values, base_issues = {}, {}
+    for field, value in (("utm_medium", utm_medium), ("campaign_name", campaign_name), ("campaign_type", campaign_type)):
+        base_values[field], field_errors, issue = check_field(field, value, lenient=lenient)
+        base_errors.extend(field_errors)
+        if issue:
+            base_issues[field] = issue
+
+    def checked(field, values):
+        return [(value, check_field(field, value, lenient=lenient)) for value in values]
+
+    checked_sources = checked("utm_source", sources)
+    checked_countries = checked("country_language", countries)
+    checked_contents = checked("utm_content", contents)
+    checked_terms = checked("utm_term", terms)
+
+    matrix = []
+    for src_raw, (src, src_errors, src_issue) in checked_sources:
+        for cty_raw, (cty, cty_errors, cty_issue) in checked_countries:
+            for cnt_raw, (cnt, cnt_errors, cnt_issue) in checked_contents:
+                for trm_raw, (trm, trm_errors, trm_issue) in checked_terms:
+                    values = dict(base_values, utm_source=src, country_language=cty, utm_content=cnt, utm_term=trm)
+                    issues = dict(base_issues)
+                    for field, issue in (("utm_source", src_issue), ("country_language", cty_issue), ("utm_content", cnt_issue), ("utm_term", trm_issue)):
+                        if issue:
+                            issues[field] = issue
+                    errors = base_errors + src_errors + cty_errors + cnt_errors + trm_errors
+                    link = _assemble_link(destination_url, start, values, errors, issues)
+                    link.update(source_raw=src_raw, country_raw=cty_raw, content_raw=cnt_raw, term_raw=trm_raw)
+                    matrix.append(link)
+    return matrix
+
+def make_history_entry(link, campaign_name, user_email="", property_id="", property_name=""):
+    """Riga di storico per un link costruito con build_utm_link."""
+    return {
+        "created_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "user_email": user_email or "",
+        "property_id": str(property_id or "").replace("properties/", ""),
+        "property_name": property_name or "",
+        "campaign_name": campaign_name,
+        "live_date": link["live_date"],
+        "utm_source": link["utm_source"],
+        "utm_medium": link["utm_medium"],
+        "utm_campaign": link["utm_campaign"],
+        "final_url": link["final_url"],
+        "expected_channel_group": link["expected_channel_group"],
+    }
@@ -0,0 +1,396 @@
+"""
+Audit della frammentazione di source, medium e campaign in una property GA4.
+
+Lo stesso canale registrato come "Facebook", "facebook", "face-book", "FB" e
+"facebok" diventa cinque righe nei report GA4 e nessuna ha il totale giusto.
+Qui si scarica l'intero vocabolario sessionSource × sessionMedium ×
+sessionCampaignName della property (paginato, utm_vocabulary.fetch_vocabulary)
+e per ogni campo si raggruppano i valori quasi duplicati:
+  1. blocking per chiave ridotta (utm_vocabulary.fold): maiuscole e separatori;
+  2. abbreviazioni note (utm_vocabulary.SOURCE_ALIASES / MEDIUM_ALIASES);
+  3. refusi a distanza di edit 1, cercati solo tra chiavi con le stesse cifre
+     che condividono una cancellazione di un carattere nella stessa posizione
+     (sostituzione), la cui chiave è una cancellazione dell'altra (inserzione) o
+     che differiscono per due caratteri adiacenti scambiati (trasposizione),
+     quindi senza confronti a coppie su tutto il vocabolario.
+Ogni gruppo riporta le sessioni per valore e il valore canonico (normalize_token,
+normalize_medium_token per il medium). Su 100k combinazioni bastano pochi secondi.
+
+Uso da riga di comando:
+    python utm_fragmentation.py --property-id 123456 --credentials token.json
+    python utm_fragmentation.py --input vocabolario.csv --json
+"""
+import argparse
+import csv
+import json
+import re
+import sys
+import time
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from utm_core import normalize_medium_token, normalize_token
+from utm_vocabulary import DOMINANT_RATIO, FIELD_ALIASES, MAX_VOCABULARY_ROWS, VOCABULARY_DAYS, fold, guide_weights
+
+FIELDS = ("source", "medium", "campaign")
+DIMENSIONS = {"source": "sessionSource", "medium": "sessionMedium", "campaign": "sessionCampaignName"}
+
+# Sotto questa lunghezza (senza cifre) i valori non vengono confrontati per refusi: "cpc"/"cpm" sono canali diversi
+MIN_TYPO_LENGTH = 5
+# Da questa lunghezza un refuso si unisce anche senza sproporzione di sessioni ("instagramm")
+LONG_KEY_LENGTH = 8
+# Valori di sistema GA4 come "(direct)", "(not set)": esclusi dai gruppi
+SYSTEM_VALUE_RE = re.compile(r"^\(.*\)$")
+MAX_CLUSTERS = 500
+
+REASON_CANONICAL = "canonico"
+REASON_DOMINANT = "più usato"
+REASON_VARIANT = "maiuscole/separatori"
+REASON_ALIAS = "abbreviazione"
+REASON_TYPO = "refuso"
+
+
+def canonical_value(field: str, value: str) -> str:
+    """Valore canonico: normalize_token, normalize_medium_token per il medium; la campagna resta divisa da "_"."""
+    if field == "medium":
+        return normalize_medium_token(value)
+    if field == "campaign":
+        return "_".join(p for p in (normalize_token(part) for part in str(value or "").split("_")) if p)
+    return normalize_token(value)
+
+
+_DIGITS = str.maketrans("", "", "0123456789")
+_NON_DIGITS = re.compile(r"\D")
+
+
+def _deletions(text: str) -> List[str]:
+    """Le cancellazioni di un carattere di text, per posizione."""
+    return [text[:i] + text[i + 1:] for i in range(len(text))]
+
+
+def _swap(text: str, i: int) -> str:
+    return text[:i] + text[i + 1] + text[i] + text[i + 2:]
+
+
+def _shared_blocks(keys: List[str], letters: Dict[str, str]) -> Iterator[List[Tuple[str, int]]]:
+    """
+    Blocchi delle chiavi (stesse cifre) che condividono una stringa tra la chiave stessa
+    (posizione -1) e le sue cancellazioni di un carattere: [(chiave, posizione)], almeno due.
+    Una stringa lunga n viene solo da chiavi lunghe n o da cancellazioni di chiavi lunghe
+    n + 1, quindi i blocchi si generano una fascia di lunghezza alla volta e in memoria
+    restano solo le cancellazioni di due lunghezze. In ogni fascia un primo passaggio con
+    operazioni su insiemi trova le sole stringhe condivise, il secondo costruisce i blocchi
+    solo per quelle: ogni blocco contiene chiavi a distanza al più 2 tra loro, quindi resta
+    piccolo anche con prefissi comuni lunghi.
+    """
+    by_length: Dict[int, List[str]] = {}
+    for key in keys:
+        by_length.setdefault(len(letters[key]), []).append(key)
+    for length in sorted(set(by_length) | {n - 1 for n in by_length}):
+        whole, longer = by_length.get(length, ()), by_length.get(length + 1, ())
+        if len(whole) + len(longer) < 2:
+            continue
+        # Hash invece delle stringhe: memoria ridotta; una collisione crea solo un blocco con una chiave
+        seen, shared = set(), set()
+        for key in whole:
+            digest = hash(letters[key])
+            if digest in seen:
+                shared.add(digest)
+            seen.add(digest)
+        for key in longer:
+            hashes = set(map(hash, _deletions(letters[key])))
+            if not seen.isdisjoint(hashes):
+                shared.update(seen.intersection(hashes))
+            seen.update(hashes)
+        del seen
+        if not shared:
+            continue
+        blocks: Dict[str, List[Tuple[str, int]]] = {}
+        for key in whole:
+            if hash(letters[key]) in shared:
+                blocks.setdefault(letters[key], []).append((key, -1))
+        for key in longer:
+            deletions = _deletions(letters[key])
+            if shared.isdisjoint(map(hash, deletions)):
+                continue
+            for position, deleted in enumerate(deletions):
+                if hash(deleted) in shared:
+                    blocks.setdefault(deleted, []).append((key, position))
+        for entries in blocks.values():
+            if len(entries) > 1:
+                yield entries
+
+
+class _Clusters:
+    """Union-find sulle chiavi ridotte, con il motivo per cui ciascuna è stata unita."""
+
+    def __init__(self, keys: Iterable[str]):
+        self.parent = {k: k for k in keys}
+        self.reason: Dict[str, str] = {}
+
+    def find(self, key: str) -> str:
+        root = key
+        while self.parent[root] != root:
+            root = self.parent[root]
+        while self.parent[key] != root:
+            self.parent[key], key = root, self.parent[key]
+        return root
+
+    def union(self, minor: str, major: str, reason: str) -> None:
+        a, b = self.find(minor), self.find(major)
+        if a != b:
+            self.parent[a] = b
+            self.reason.setdefault(minor, reason)
+
+
+def cluster_values(field: str, weights: Dict[str, int]) -> List[Dict[str, Any]]:
+    """
+    Gruppi di valori quasi duplicati di un campo, dal più frammentato. Ogni gruppo:
+    {"field", "canonical" (valore suggerito), "dominant" (valore osservato più usato),
+    "sessions", "fragmented_sessions" (fuori dal più usato), "values": [{"value", "sessions", "reason"}]}.
+    """
+    groups: Dict[str, Dict[str, Any]] = {}
+    for raw, sessions in weights.items():
+        key = fold(raw)
+        if not key or SYSTEM_VALUE_RE.match(raw.strip()):
+            continue
+        group = groups.setdefault(key, {"sessions": 0, "variants": {}})
+        group["sessions"] += sessions
+        group["variants"][raw] = group["variants"].get(raw, 0) + sessions
+    clusters = _Clusters(groups)
+
+    aliases = {fold(k): fold(v) for k, v in FIELD_ALIASES.get(field, {}).items()}
+    for key in groups:
+        target = aliases.get(key)
+        if target in groups and target != key:
+            clusters.union(key, target, REASON_ALIAS)
+
+    # Refusi: solo tra chiavi con le stesse cifre (date, numeri) e abbastanza lunghe
+    protected = {fold(v) for v in guide_weights(field)} if field in FIELD_ALIASES else set()
+    letters = {}
+    by_signature: Dict[str, List[str]] = {}
+    for key in groups:
+        text = key.translate(_DIGITS)
+        if len(text) >= MIN_TYPO_LENGTH:
+            letters[key] = text
+            by_signature.setdefault(_NON_DIGITS.sub("", key), []).append(key)
+
+    def rank(k):
+        return groups[k]["sessions"], k
+
+    # Ogni chiave si unisce solo al vicino con più sessioni: un refuso a metà strada tra
+    # due valori legittimi ("fr_ar" tra "fr_awr" e "fr_tr") non li fonde tra loro
+    best: Dict[str, str] = {}
+
+    def consider(minor, candidates):
+        """Primo candidato (ordinati per sessioni) più forte di minor; la regola sulle sessioni
+        vale per lui se vale per uno più debole, quindi gli altri non servono."""
+        for major in candidates:
+            if rank(major) <= rank(minor):
+                return
+            if letters[major] == letters[minor] or (minor in protected and major in protected):
+                continue
+            if len(letters[minor]) >= LONG_KEY_LENGTH or groups[major]["sessions"] >= DOMINANT_RATIO * groups[minor]["sessions"]:
+                current = best.get(minor)
+                if current is None or rank(major) > rank(current):
+                    best[minor] = major
+            return
+
+    for keys in by_signature.values():
+        if len(keys) < 2:
+            continue
+        by_text: Dict[str, List[str]] = {}
+        for key in keys:
+            by_text.setdefault(letters[key], []).append(key)
+        for same in by_text.values():
+            same.sort(key=rank, reverse=True)
+        for entries in _shared_blocks(keys, letters):
+            # Stessa posizione cancellata: sostituzione; chiave intera (-1) contro cancellazione: inserzione
+            by_position: Dict[int, List[str]] = {}
+            for key, position in entries:
+                by_position.setdefault(position, []).append(key)
+            for candidates in by_position.values():
+                candidates.sort(key=rank, reverse=True)
+            whole = by_position.get(-1, ())
+            for key, position in entries:
+                if position == -1:
+                    for other, candidates in by_position.items():
+                        if other != -1:
+                            consider(key, candidates)
+                    continue
+                consider(key, by_position[position])
+                consider(key, whole)
+                # Posizioni adiacenti: trasposizione se l'altra chiave è questa con i due caratteri scambiati
+                text = letters[key]
+                if position + 1 in by_position and position + 1 < len(text):
+                    consider(key, by_text.get(_swap(text, position), ()))
+                if position - 1 in by_position:
+                    consider(key, by_text.get(_swap(text, position - 1), ()))
+    for minor, major in best.items():
+        clusters.union(minor, major, REASON_TYPO)
+
+    members: Dict[str, List[str]] = {}
+    for key in groups:
+        members.setdefault(clusters.find(key), []).append(key)
+
+    result = []
+    for keys in members.values():
+        if len(keys) == 1 and len(groups[keys[0]]["variants"]) == 1:
+            continue
+        dominant = max(keys, key=lambda k: (groups[k]["sessions"], k))
+        top_variant = max(groups[dominant]["variants"].items(), key=lambda kv: (kv[1], kv[0]))[0]
+        canonical = canonical_value(field, top_variant) or top_variant
+        values = []
+        for key in keys:
+            for raw, sessions in groups[key]["variants"].items():
+                if raw == canonical:
+                    reason = REASON_CANONICAL
+                elif raw == top_variant:
+                    reason = REASON_DOMINANT
+                elif key == dominant:
+                    reason = REASON_VARIANT
+                else:
+                    # Le chiavi senza motivo proprio sono entrate nel gruppo tramite un refuso di un'altra
+                    reason = clusters.reason.get(key, REASON_TYPO)
+                values.append({"value": raw, "sessions": sessions, "reason": reason})
+        values.sort(key=lambda v: (-v["sessions"], v["value"]))
+        total = sum(v["sessions"] for v in values)
+        result.append({
+            "field": field,
+            "canonical": canonical,
+            "dominant": top_variant,
+            "sessions": total,
+            # Misurate sul valore più usato: il canonico può non comparire affatto (es. "brand.it" -> "brand-it")
+            "fragmented_sessions": total - groups[dominant]["variants"][top_variant],
+            "values": values,
+        })
+    result.sort(key=lambda c: (-c["fragmented_sessions"], -c["sessions"], c["canonical"]))
+    return result
+
+
+def audit_vocabulary(rows: Iterable[Tuple[str, str, str, int]], max_clusters: int = MAX_CLUSTERS) -> Dict[str, Any]:
+    """
+    Audit di righe (source, medium, campaign, sessioni). Per campo: valori distinti,
+    gruppi frammentati (al massimo max_clusters) e sessioni fuori dal valore più usato del gruppo;
+    "combinations" dice quante combinazioni distinte restano dopo la normalizzazione.
+    """
+    rows = list(rows)
+    weights: Dict[str, Dict[str, int]] = {field: {} for field in FIELDS}
+    for row in rows:
+        sessions = row[3]
+        for field, value in zip(FIELDS, row):
+            weights[field][value] = weights[field].get(value, 0) + sessions
+
+    fields = {}
+    mapping: Dict[str, Dict[str, str]] = {}
+    for field in FIELDS:
+        clusters = cluster_values(field, weights[field])
+        mapping[field] = {v["value"]: c["canonical"] for c in clusters for v in c["values"]}
+        fields[field] = {
+            "distinct": len(weights[field]),
+            "fragmented_values": sum(len(c["values"]) for c in clusters),
+            "fragmented_sessions": sum(c["fragmented_sessions"] for c in clusters),
+            "cluster_count": len(clusters),
+            "clusters": clusters[:max_clusters],
+        }
+    merged = {
+        tuple(mapping[field].get(value, value) for field, value in zip(FIELDS, row))
+        for row in rows
+    }
+    return {
+        "fields": fields,
+        "combinations": len(rows),
+        "combinations_after_cleanup": len(merged),
+        "sessions": sum(row[3] for row in rows),
+    }
+
+
+def audit_property(property_id, creds, days: int = VOCABULARY_DAYS, max_rows: int = MAX_VOCABULARY_ROWS,
+                   max_clusters: int = MAX_CLUSTERS) -> Dict[str, Any]:
+    """Scarica il vocabolario completo della property ed esegue audit_vocabulary. Solleva le eccezioni di GA4."""
+    import utm_vocabulary
+
+    started = time.perf_counter()
+    vocabulary = utm_vocabulary.fetch_vocabulary(property_id, creds, [DIMENSIONS[f] for f in FIELDS], days=days, max_rows=max_rows)
+    fetched = time.perf_counter()
+    audit = audit_vocabulary(vocabulary["rows"], max_clusters=max_clusters)
+    audit.update({
+        "property_id": str(property_id).replace("properties/", ""),
+        "days": days,
+        "row_count": vocabulary["row_count"],
+        "truncated": vocabulary["truncated"],
+        "fetch_seconds": round(fetched - started, 3),
+        "cluster_seconds": round(time.perf_counter() - fetched, 3),
+    })
+    return audit
+
+
+def read_vocabulary_csv(stream) -> List[Tuple[str, str, str, int]]:
+    """Righe da un CSV con colonne source, medium, campaign, sessions (accetta anche i nomi GA4)."""
+    rows = []
+    for row in csv.DictReader(stream):
+        row = {(k or "").strip().lower(): (v or "").strip() for k, v in row.items()}
+        values = [row.get(f) or row.get(DIMENSIONS[f].lower()) or row.get(f"utm_{f}") or "" for f in FIELDS]
+        try:
+            sessions = int(float(row.get("sessions") or 0))
+        except ValueError:
+            sessions = 0
+        rows.append((*values, sessions))
+    return rows
+
+
+def format_report(audit: Dict[str, Any], limit: int = 20) -> str:
+    lines = [
+        f"Combinazioni: {audit['combinations']:,} ({audit['combinations_after_cleanup']:,} dopo la normalizzazione), "
+        f"sessioni: {audit['sessions']:,}"
+    ]
+    if audit.get("truncated"):
+        lines.append(f"Attenzione: vocabolario troncato ({audit['row_count']:,} combinazioni in GA4)")
+    for field, summary in audit["fields"].items():
+        lines.append("")
+        lines.append(
+            f"[{field}] {summary['distinct']:,} valori distinti, {summary['cluster_count']:,} gruppi frammentati, "
+            f"{summary['fragmented_sessions']:,} sessioni fuori dal valore più usato"
+        )
+        for cluster in summary["clusters"][:limit]:
+            variants = ", ".join(f"{v['value']} ({v['sessions']:,}, {v['reason']})" for v in cluster["values"][:8])
+            more = f" +{len(cluster['values']) - 8}" if len(cluster["values"]) > 8 else ""
+            lines.append(f"  {cluster['canonical']}: {cluster['sessions']:,} sessioni <- {variants}{more}")
+    return "\n".join(lines)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Audit della frammentazione di source/medium/campaign in GA4")
+    parser.add_argument("--property-id", default="", help="property GA4 da analizzare")
+    parser.add_argument("--credentials", default="token.json", help="credenziali OAuth utente (authorized user JSON)")
+    parser.add_argument("--input", default="", help="CSV source, medium, campaign, sessions al posto di GA4 ('-' per stdin)")
+    parser.add_argument("--days", type=int, default=VOCABULARY_DAYS)
+    parser.add_argument("--max-rows", type=int, default=MAX_VOCABULARY_ROWS)
+    parser.add_argument("--limit", type=int, default=20, help="gruppi mostrati per campo")
+    parser.add_argument("--json", action="store_true", help="stampa il risultato completo in JSON")
+    args = parser.parse_args(argv)
+
+    if args.input:
+        stream = sys.stdin if args.input == "-" else open(args.input, "r", encoding="utf-8-sig", newline="")
+        try:
+            started = time.perf_counter()
+            audit = audit_vocabulary(read_vocabulary_csv(stream))
+            audit["cluster_seconds"] = round(time.perf_counter() - started, 3)
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+    elif args.property_id:
+        from google.oauth2.credentials import Credentials
+
+        audit = audit_property(
+            args.property_id, Credentials.from_authorized_user_file(args.credentials),
+            days=args.days, max_rows=args.max_rows,
+        )
+    else:
+        parser.error("serve --property-id oppure --input")
+
+    print(json.dumps(audit, ensure_ascii=False, indent=2) if args.json else format_report(audit, args.limit))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
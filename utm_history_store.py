@@ -0,0 +1,365 @@
+"""
+Storico dei link UTM su SQLite.
+
+Condiviso tra i worker Streamlit e la CLI utm_bulk.py: una riga per
+(user_email, property_id, final_url), aggiornata in upsert. Il file si
+configura con UTM_HISTORY_DB (default utm_history.db accanto all'app).
+Le letture sono sempre filtrate per utente: senza email non restituiscono nulla.
+"""
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional
+
+DB_PATH_ENV = "UTM_HISTORY_DB"
+DEFAULT_DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "utm_history.db")
+
+HISTORY_FIELDS = [
+    "created_at",
+    "user_email",
+    "property_id",
+    "property_name",
+    "campaign_name",
+    "live_date",
+    "utm_source",
+    "utm_medium",
+    "utm_campaign",
+    "final_url",
+    "expected_channel_group",
+]
+KEY_FIELDS = ("user_email", "property_id", "final_url")
+TRACKING_FIELDS = ["status", "message", "sessions", "observed", "checked_at"]
+
+_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS utm_history (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    {", ".join(f"{f} TEXT NOT NULL DEFAULT ''" for f in HISTORY_FIELDS)},
+    UNIQUE (user_email, property_id, final_url)
+);
+CREATE TABLE IF NOT EXISTS tracking_results (
+    history_id INTEGER PRIMARY KEY REFERENCES utm_history (id) ON DELETE CASCADE,
+    status TEXT NOT NULL,
+    message TEXT NOT NULL DEFAULT '',
+    sessions INTEGER NOT NULL DEFAULT 0,
+    observed TEXT NOT NULL DEFAULT '-',
+    checked_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS tracking_partitions (
+    property_id TEXT NOT NULL,
+    campaign_key TEXT NOT NULL,
+    day TEXT NOT NULL,
+    channel TEXT NOT NULL,
+    sessions INTEGER NOT NULL,
+    PRIMARY KEY (property_id, campaign_key, day, channel)
+);
+CREATE TABLE IF NOT EXISTS tracking_sync (
+    property_id TEXT NOT NULL,
+    campaign_key TEXT NOT NULL,
+    synced_through TEXT NOT NULL,
+    synced_at TEXT NOT NULL,
+    PRIMARY KEY (property_id, campaign_key)
+);
+"""
+
+# Colonne aggiunte dopo la prima versione dello schema: (tabella, colonna, definizione, backfill)
+_MIGRATIONS = [
+    (
+        "utm_history",
+        "live_date_iso",
+        "TEXT NOT NULL DEFAULT ''",
+        # live_date è dd/mm/yyyy: la versione yyyy-mm-dd si ordina e si filtra correttamente
+        "UPDATE utm_history SET live_date_iso = substr(live_date, 7, 4) || '-' || substr(live_date, 4, 2) || '-' || substr(live_date, 1, 2) "
+        "WHERE length(live_date) = 10",
+    ),
+]
+
+_INDEXES = """
+CREATE INDEX IF NOT EXISTS idx_history_user_date ON utm_history (user_email, live_date_iso DESC, campaign_name DESC);
+CREATE INDEX IF NOT EXISTS idx_history_user_property ON utm_history (user_email, property_id, live_date_iso DESC);
+CREATE INDEX IF NOT EXISTS idx_history_user_channel ON utm_history (user_email, expected_channel_group, live_date_iso DESC);
+CREATE INDEX IF NOT EXISTS idx_tracking_status ON tracking_results (status);
+"""
+
+_initialized = set()
+_init_lock = threading.Lock()
+
+
+def get_db_path() -> str:
+    return os.environ.get(DB_PATH_ENV, "").strip() or DEFAULT_DB_PATH
+
+
+@contextmanager
+def connect(db_path: Optional[str] = None):
+    """Connessione breve (una per operazione): sicura tra thread e processi, schema creato al primo uso."""
+    path = db_path or get_db_path()
+    conn = sqlite3.connect(path, timeout=30)
+    conn.row_factory = sqlite3.Row
+    try:
+        with _init_lock:
+            if path not in _initialized:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.executescript(_SCHEMA)
+                for table, column, definition, backfill in _MIGRATIONS:
+                    columns = {row["name"] for row in conn.execute(f"PRAGMA table_info({table})")}
+                    if column not in columns:
+                        conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+                        conn.execute(backfill)
+                        conn.commit()
+                conn.executescript(_INDEXES)
+                _initialized.add(path)
+        with conn:
+            yield conn
+    finally:
+        conn.close()
+
+
+def _iso_date(ddmmyyyy: str) -> str:
+    try:
+        return datetime.strptime(ddmmyyyy, "%d/%m/%Y").strftime("%Y-%m-%d")
+    except (TypeError, ValueError):
+        return ""
+
+
+def _row_values(entry: Dict[str, Any]) -> List[str]:
+    values = []
+    for field in HISTORY_FIELDS:
+        value = entry.get(field)
+        if field == "created_at" and not value:
+            value = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        values.append("" if value is None else str(value))
+    values.append(_iso_date(entry.get("live_date")))
+    return values
+
+
+_WRITE_FIELDS = HISTORY_FIELDS + ["live_date_iso"]
+_UPSERT_SQL = f"""
+INSERT INTO utm_history ({", ".join(_WRITE_FIELDS)})
+VALUES ({", ".join("?" for _ in _WRITE_FIELDS)})
+ON CONFLICT (user_email, property_id, final_url) DO UPDATE SET
+    {", ".join(f"{f} = excluded.{f}" for f in _WRITE_FIELDS if f not in KEY_FIELDS and f != "created_at")}
+"""
+
+
+def upsert_entries(entries: Iterable[Dict[str, Any]], db_path: Optional[str] = None) -> int:
+    """Inserisce o aggiorna più link in una sola transazione. Ritorna il numero di righe scritte."""
+    rows = [_row_values(e) for e in entries]
+    if not rows:
+        return 0
+    with connect(db_path) as conn:
+        conn.executemany(_UPSERT_SQL, rows)
+    return len(rows)
+
+
+def upsert_entry(entry: Dict[str, Any], db_path: Optional[str] = None) -> None:
+    upsert_entries([entry], db_path)
+
+
+def list_entries(user_email: str, db_path: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    Tutte le righe dello storico dell'utente in ordine di inserimento, con `id` e l'ultimo
+    esito di verifica tracking salvato (campi tracking_*, None se mai verificato).
+    Lista vuota se `user_email` è vuota.
+    """
+    if not user_email:
+        return []
+    sql = (
+        f"SELECT h.id, {', '.join('h.' + f for f in HISTORY_FIELDS)}, "
+        f"{', '.join(f't.{f} AS tracking_{f}' for f in TRACKING_FIELDS)} "
+        "FROM utm_history h LEFT JOIN tracking_results t ON t.history_id = h.id "
+        "WHERE h.user_email = ? ORDER BY h.id"
+    )
+    with connect(db_path) as conn:
+        return [dict(row) for row in conn.execute(sql, [user_email])]
+
+
+UNVERIFIED_STATUS = "Da verificare"
+
+
+def _filter_clause(user_email, property_id=None, channel=None, status=None, date_from=None, date_to=None):
+    where, params = ["h.user_email = ?"], [user_email]
+    if property_id:
+        where.append("h.property_id = ?")
+        params.append(property_id)
+    if channel:
+        where.append("h.expected_channel_group = ?")
+        params.append(channel)
+    if status == UNVERIFIED_STATUS:
+        where.append("t.status IS NULL")
+    elif status:
+        where.append("t.status = ?")
+        params.append(status)
+    if date_from:
+        where.append("h.live_date_iso >= ?")
+        params.append(date_from)
+    if date_to:
+        where.append("h.live_date_iso <= ?")
+        params.append(date_to)
+    base = "FROM utm_history h LEFT JOIN tracking_results t ON t.history_id = h.id WHERE " + " AND ".join(where)
+    return base, params
+
+
+def count_entries(user_email: str, db_path: Optional[str] = None, **filters) -> int:
+    """Numero di righe dello storico dell'utente che soddisfano i filtri di query_entries (0 senza email)."""
+    if not user_email:
+        return 0
+    base, params = _filter_clause(user_email, **filters)
+    with connect(db_path) as conn:
+        return conn.execute(f"SELECT COUNT(*) {base}", params).fetchone()[0]
+
+
+def query_entries(
+    user_email: str,
+    property_id: Optional[str] = None,
+    channel: Optional[str] = None,
+    status: Optional[str] = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    limit: int = 50,
+    offset: int = 0,
+    db_path: Optional[str] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Una pagina dello storico dell'utente filtrata e ordinata in SQL (data live più recente
+    prima), nello stesso formato di list_entries. Date in formato yyyy-mm-dd; status
+    UNVERIFIED_STATUS = righe mai verificate. Lista vuota se `user_email` è vuota.
+    """
+    if not user_email:
+        return []
+    base, params = _filter_clause(user_email, property_id, channel, status, date_from, date_to)
+    select = (
+        f"SELECT h.id, {', '.join('h.' + f for f in HISTORY_FIELDS)}, "
+        f"{', '.join(f't.{f} AS tracking_{f}' for f in TRACKING_FIELDS)} {base} "
+        "ORDER BY h.live_date_iso DESC, h.campaign_name DESC, h.id DESC LIMIT ? OFFSET ?"
+    )
+    with connect(db_path) as conn:
+        return [dict(row) for row in conn.execute(select, [*params, int(limit), int(offset)])]
+
+
+def get_filter_options(user_email: str, db_path: Optional[str] = None) -> Dict[str, List[Any]]:
+    """Valori distinti per i filtri del tab storico dell'utente: property (id, nome) e canali attesi."""
+    if not user_email:
+        return {"properties": [], "channels": []}
+    where, params = " WHERE user_email = ?", [user_email]
+    with connect(db_path) as conn:
+        properties = [
+            (row["property_id"], row["property_name"])
+            for row in conn.execute(
+                f"SELECT property_id, MAX(property_name) AS property_name FROM utm_history{where} GROUP BY property_id ORDER BY property_id",
+                params,
+            )
+        ]
+        channels = [
+            row[0]
+            for row in conn.execute(
+                f"SELECT DISTINCT expected_channel_group FROM utm_history{where} ORDER BY expected_channel_group", params
+            )
+        ]
+    return {"properties": properties, "channels": channels}
+
+
+def count_values(field: str, user_email: str, property_id: Optional[str] = None, db_path: Optional[str] = None) -> Dict[str, int]:
+    """
+    Quante righe dello storico dell'utente usano ciascun valore di utm_source o utm_medium
+    (per property se indicata). Senza email non ritorna nulla.
+    """
+    if field not in ("utm_source", "utm_medium"):
+        raise ValueError(f"Campo non supportato: {field}")
+    if not user_email:
+        return {}
+    where, params = f" WHERE {field} != '' AND user_email = ?", [user_email]
+    if property_id:
+        where += " AND property_id = ?"
+        params.append(str(property_id).replace("properties/", ""))
+    with connect(db_path) as conn:
+        return {
+            row[0]: row[1]
+            for row in conn.execute(f"SELECT {field}, COUNT(*) FROM utm_history{where} GROUP BY {field}", params)
+        }
+
+
+def save_tracking_result(history_id: int, result: Dict[str, Any], db_path: Optional[str] = None) -> None:
+    """Salva (sovrascrivendo) l'esito di check_tracking_status_for_entry per una riga dello storico."""
+    with connect(db_path) as conn:
+        conn.execute(
+            """
+            INSERT INTO tracking_results (history_id, status, message, sessions, observed, checked_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT (history_id) DO UPDATE SET
+                status = excluded.status, message = excluded.message, sessions = excluded.sessions,
+                observed = excluded.observed, checked_at = excluded.checked_at
+            """,
+            (
+                history_id,
+                result.get("status", ""),
+                result.get("message", ""),
+                int(result.get("sessions") or 0),
+                result.get("observed") or "-",
+                result.get("checked_at") or datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            ),
+        )
+
+
+# --- PARTIZIONI GIORNALIERE DEL TRACKING ---
+# Sessioni per (property, campagna, giorno, canale): le verifiche scaricano da GA4 solo
+# i giorni successivi all'ultima sincronizzazione (vedi utm_tracking). Giorni in formato yyyy-mm-dd.
+
+def get_sync_states(property_id: str, campaign_keys: Iterable[str], db_path: Optional[str] = None) -> Dict[str, str]:
+    """Ultimo giorno sincronizzato (synced_through) per ciascuna campagna che ne ha uno."""
+    keys = list(campaign_keys)
+    if not keys:
+        return {}
+    with connect(db_path) as conn:
+        rows = conn.execute(
+            f"SELECT campaign_key, synced_through FROM tracking_sync "
+            f"WHERE property_id = ? AND campaign_key IN ({', '.join('?' for _ in keys)})",
+            [property_id, *keys],
+        )
+        return {row["campaign_key"]: row["synced_through"] for row in rows}
+
+
+def replace_partitions(
+    property_id: str,
+    partitions: Dict[str, Dict[str, Any]],
+    synced_through: str,
+    prune_before: Optional[str] = None,
+    db_path: Optional[str] = None,
+) -> None:
+    """
+    Sostituisce, in una sola transazione, i giorni >= start di ogni campagna con quelli scaricati.
+    `partitions`: {campaign_key: {"start": giorno, "sessions": {(giorno, canale): sessioni}}}.
+    I giorni precedenti a `prune_before` vengono eliminati.
+    """
+    synced_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    with connect(db_path) as conn:
+        for key, part in partitions.items():
+            conn.execute(
+                "DELETE FROM tracking_partitions WHERE property_id = ? AND campaign_key = ? AND day >= ?",
+                (property_id, key, part["start"]),
+            )
+            conn.executemany(
+                "INSERT INTO tracking_partitions (property_id, campaign_key, day, channel, sessions) VALUES (?, ?, ?, ?, ?)",
+                [(property_id, key, day, channel, sessions) for (day, channel), sessions in part["sessions"].items()],
+            )
+            conn.execute(
+                """
+                INSERT INTO tracking_sync (property_id, campaign_key, synced_through, synced_at) VALUES (?, ?, ?, ?)
+                ON CONFLICT (property_id, campaign_key) DO UPDATE SET
+                    synced_through = excluded.synced_through, synced_at = excluded.synced_at
+                """,
+                (property_id, key, synced_through, synced_at),
+            )
+        if prune_before:
+            conn.execute("DELETE FROM tracking_partitions WHERE property_id = ? AND day < ?", (property_id, prune_before))
+
+
+def get_channel_totals(property_id: str, campaign_key: str, start_day: str, db_path: Optional[str] = None) -> Dict[str, int]:
+    """Sessioni per canale della campagna dal giorno `start_day` in poi."""
+    with connect(db_path) as conn:
+        rows = conn.execute(
+            "SELECT channel, SUM(sessions) AS sessions FROM tracking_partitions "
+            "WHERE property_id = ? AND campaign_key = ? AND day >= ? GROUP BY channel",
+            (property_id, campaign_key, start_day),
+        )
+        return {row["channel"]: int(row["sessions"]) for row in rows}
@@ -0,0 +1,253 @@
+"""
+Verifica del tracking dei link UTM su GA4.
+
+Confronta source/medium/campaign di una riga dello storico con le sessioni GA4
+degli ultimi 30 giorni e il canale osservato con quello atteso. Nessuna
+dipendenza da Streamlit: usata dal tab storico e dal monitor in background
+(tracking_monitor.py).
+
+Le sessioni giornaliere per canale di ogni campagna sono salvate come partizioni
+in utm_history_store: una nuova verifica scarica solo i giorni dopo l'ultima
+sincronizzazione, più RESTATEMENT_DAYS giorni già visti che GA4 può ancora
+aggiornare (dati arrivati in ritardo), e li sostituisce nelle partizioni.
+Le campagne della stessa property vengono sincronizzate con un'unica query;
+"verifica tutte" le divide in blocchi di campagne per mostrare gli esiti man mano.
+"""
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import date, datetime, timedelta
+
+from google.analytics.data_v1beta.types import (
+    DateRange,
+    Dimension,
+    Filter,
+    FilterExpression,
+    Metric,
+    RunReportRequest,
+)
+
+import ga4_mcp_tools
+import ga4_scheduler
+import utm_history_store
+from utm_core import normalize_medium_token, normalize_token, parse_ddmmyyyy_to_date
+
+DEFAULT_GRACE_DAYS = 2
+TRACKING_WINDOW_DAYS = 30  # come "30daysAgo" - "today"
+RESTATEMENT_DAYS = 3
+PARTITION_RETENTION_DAYS = 90
+REPORT_PAGE_SIZE = 10000
+VERIFY_ALL_MAX_WORKERS = 6
+# Campagne per task di "verifica tutte": esiti e avanzamento arrivano a blocchi anche con una sola property
+VERIFY_ALL_CHUNK_CAMPAIGNS = 5
+# Un esito salvato più recente di così non viene ricalcolato da "verifica tutte"
+RESULT_TTL_SECONDS = 10 * 60
+STATUS_ICONS = {"OK": "✅", "WARNING": "⚠️", "ERROR": "❌", "PENDING": "⏳", "DEFERRED": "🔁"}
+
+
+def campaign_key(entry: dict) -> str:
+    """Chiave della campagna nelle partizioni: source|medium|campaign normalizzati."""
+    return "|".join((
+        normalize_token(entry.get("utm_source", "")),
+        normalize_medium_token(entry.get("utm_medium", "")),
+        normalize_token(entry.get("utm_campaign", "")),
+    ))
+
+
+def _property_key(property_id) -> str:
+    return str(property_id or "").replace("properties/", "")
+
+
+def _fetch_daily_sessions(property_id, campaigns, start_day, end_day, creds, background=False):
+    """
+    Sessioni per (campagna, giorno, canale) dal report GA4, paginato.
+    `campaigns` sono i valori utm_campaign cercati: filtrati lato GA4 (senza distinzione
+    tra maiuscole/minuscole) e poi confrontati normalizzati come nel builder.
+    """
+    sessions = {}
+    offset = 0
+    while True:
+        request = RunReportRequest(
+            property=f"properties/{property_id}",
+            date_ranges=[DateRange(start_date=start_day.isoformat(), end_date=end_day.isoformat())],
+            dimensions=[
+                Dimension(name="date"),
+                Dimension(name="sessionSource"),
+                Dimension(name="sessionMedium"),
+                Dimension(name="sessionCampaignName"),
+                Dimension(name="sessionPrimaryChannelGroup"),
+                Dimension(name="sessionDefaultChannelGroup"),
+            ],
+            metrics=[Metric(name="sessions")],
+            dimension_filter=FilterExpression(
+                filter=Filter(
+                    field_name="sessionCampaignName",
+                    in_list_filter=Filter.InListFilter(values=sorted(campaigns), case_sensitive=False),
+                )
+            ),
+            limit=REPORT_PAGE_SIZE,
+            offset=offset,
+        )
+        report = ga4_mcp_tools.run_report_request(request, creds, background=background)
+        for row in report.rows:
+            values = [v.value for v in row.dimension_values]
+            key = "|".join((normalize_token(values[1]), normalize_medium_token(values[2]), normalize_token(values[3])))
+            day = datetime.strptime(values[0], "%Y%m%d").date().isoformat()
+            channel = values[4] or values[5] or "Unassigned"
+            cell = (key, day, channel)
+            sessions[cell] = sessions.get(cell, 0) + int(float(row.metric_values[0].value or 0))
+        offset += len(report.rows)
+        if not report.rows or offset >= report.row_count:
+            return sessions
+
+
+def sync_property_partitions(property_id, entries, creds, background=False, today=None):
+    """
+    Aggiorna le partizioni delle campagne di `entries` (stessa property) scaricando solo i giorni mancanti.
+    Le campagne con lo stesso giorno di partenza condividono la query.
+    """
+    today = today or date.today()
+    prop = _property_key(property_id)
+    window_start = today - timedelta(days=TRACKING_WINDOW_DAYS)
+    campaigns = {}
+    for entry in entries:
+        campaigns.setdefault(campaign_key(entry), set()).add(entry.get("utm_campaign", ""))
+
+    states = utm_history_store.get_sync_states(prop, campaigns)
+    starts = {}
+    for key in campaigns:
+        synced = states.get(key)
+        start = window_start
+        if synced:
+            start = max(window_start, date.fromisoformat(synced) - timedelta(days=RESTATEMENT_DAYS))
+        starts.setdefault(start, []).append(key)
+
+    for start, keys in sorted(starts.items()):
+        wanted = set().union(*(campaigns[k] for k in keys))
+        fetched = _fetch_daily_sessions(prop, wanted, start, today, creds, background=background)
+        partitions = {key: {"start": start.isoformat(), "sessions": {}} for key in keys}
+        for (key, day, channel), sessions in fetched.items():
+            if key in partitions:
+                partitions[key]["sessions"][(day, channel)] = sessions
+        utm_history_store.replace_partitions(
+            prop,
+            partitions,
+            synced_through=today.isoformat(),
+            prune_before=(today - timedelta(days=PARTITION_RETENTION_DAYS)).isoformat(),
+        )
+
+
+def evaluate_tracking_status(entry: dict, sessions_by_channel: dict, grace_days: int = DEFAULT_GRACE_DAYS, today=None):
+    """Stato del tracking dalle sessioni per canale della campagna nella finestra di verifica."""
+    total_sessions = sum(sessions_by_channel.values())
+    observed_channel = "-"
+    if total_sessions:
+        observed_channel = sorted(sessions_by_channel.items(), key=lambda x: x[1], reverse=True)[0][0]
+
+    expected = entry.get("expected_channel_group", "Other")
+    live_date = parse_ddmmyyyy_to_date(entry.get("live_date", ""))
+    today = today or datetime.today().date()
+    after_grace = bool(live_date and today > (live_date + timedelta(days=grace_days)))
+
+    if total_sessions == 0 and after_grace:
+        return {
+            "status": "ERROR",
+            "message": "Nessun traffico rilevato con questi UTM",
+            "sessions": 0,
+            "observed": observed_channel,
+        }
+    if total_sessions > 0 and observed_channel != expected:
+        return {
+            "status": "WARNING",
+            "message": f"Il traffico è finito in {observed_channel} invece di {expected}",
+            "sessions": total_sessions,
+            "observed": observed_channel,
+        }
+    if total_sessions > 0 and observed_channel == expected:
+        return {
+            "status": "OK",
+            "message": "Tracking e canalizzazione corretti",
+            "sessions": total_sessions,
+            "observed": observed_channel,
+        }
+    return {
+        "status": "PENDING",
+        "message": "Campagna recente: in attesa di traffico",
+        "sessions": total_sessions,
+        "observed": observed_channel,
+    }
+
+
+def check_tracking_status_for_entries(entries, creds, grace_days: int = DEFAULT_GRACE_DAYS, background: bool = False):
+    """Verifica più righe dello storico (una sincronizzazione per property). Ritorna gli esiti nello stesso ordine."""
+    today = date.today()
+    window_start = (today - timedelta(days=TRACKING_WINDOW_DAYS)).isoformat()
+    results = [None] * len(entries)
+    by_property = {}
+    for i, entry in enumerate(entries):
+        prop = _property_key(entry.get("property_id"))
+        if not prop:
+            results[i] = {"status": "ERROR", "message": "Property non disponibile", "sessions": 0, "observed": "-"}
+        else:
+            by_property.setdefault(prop, []).append(i)
+
+    for prop, indexes in by_property.items():
+        try:
+            sync_property_partitions(prop, [entries[i] for i in indexes], creds, background=background, today=today)
+            for i in indexes:
+                totals = utm_history_store.get_channel_totals(prop, campaign_key(entries[i]), window_start)
+                results[i] = evaluate_tracking_status(entries[i], totals, grace_days=grace_days, today=today)
+        except ga4_scheduler.GA4TransientError as e:
+            # Quota o servizio GA4 temporaneamente non disponibili: non è un errore di tracking
+            for i in indexes:
+                results[i] = {"status": "DEFERRED", "message": f"Verifica rimandata, GA4 temporaneamente non disponibile: {e}", "sessions": 0, "observed": "-"}
+        except Exception as e:
+            for i in indexes:
+                results[i] = {"status": "ERROR", "message": f"Errore GA4: {e}", "sessions": 0, "observed": "-"}
+    return results
+
+
+def check_tracking_status_for_entry(entry: dict, creds, grace_days: int = DEFAULT_GRACE_DAYS, background: bool = False):
+    return check_tracking_status_for_entries([entry], creds, grace_days=grace_days, background=background)[0]
+
+
+def is_result_fresh(entry: dict, ttl_seconds: int = RESULT_TTL_SECONDS, now=None) -> bool:
+    """True se la riga (da utm_history_store.list_entries) ha un esito salvato entro `ttl_seconds`."""
+    checked_at = entry.get("tracking_checked_at")
+    if not checked_at:
+        return False
+    try:
+        checked = datetime.strptime(checked_at, "%Y-%m-%d %H:%M:%S")
+    except ValueError:
+        return False
+    return ((now or datetime.now()) - checked).total_seconds() < ttl_seconds
+
+
+def _campaign_chunks(entries, chunk_campaigns: int):
+    """Divide le righe di una property in blocchi di al più `chunk_campaigns` campagne; le righe della stessa campagna restano insieme."""
+    by_campaign = {}
+    for entry in entries:
+        by_campaign.setdefault(campaign_key(entry), []).append(entry)
+    groups = list(by_campaign.values())
+    size = max(1, chunk_campaigns)
+    return [[entry for group in groups[i:i + size] for entry in group] for i in range(0, len(groups), size)]
+
+
+def iter_tracking_checks(
+    entries,
+    creds,
+    grace_days: int = DEFAULT_GRACE_DAYS,
+    max_workers: int = VERIFY_ALL_MAX_WORKERS,
+    chunk_campaigns: int = VERIFY_ALL_CHUNK_CAMPAIGNS,
+):
+    """
+    Verifica le righe in parallelo (un task ogni `chunk_campaigns` campagne della stessa property,
+    al massimo `max_workers` insieme) e produce (entry, esito) man mano che i blocchi vengono completati.
+    """
+    by_property = {}
+    for entry in entries:
+        by_property.setdefault(_property_key(entry.get("property_id")), []).append(entry)
+    chunks = [chunk for group in by_property.values() for chunk in _campaign_chunks(group, chunk_campaigns)]
+    with ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="verify-all") as pool:
+        futures = {pool.submit(check_tracking_status_for_entries, chunk, creds, grace_days): chunk for chunk in chunks}
+        for future in as_completed(futures):
+            for entry, result in zip(futures[future], future.result()):
+                yield entry, result
@@ -0,0 +1,340 @@
+"""
+Vocabolario di utm_source / utm_medium osservati in una property e indice fuzzy.
+
+Un valore scritto a mano come "facebok" o "FB" supera validate_naming_rules ma in
+GA4 diventa una sorgente a parte e frammenta i report. ValueIndex risponde con i
+valori noti più vicini (distanza di edit, pesati per sessioni) in decine di
+microsecondi: le chiavi sono ridotte a minuscole senza separatori ("Social-Paid"
+e "social_paid" coincidono) e indicizzate per cancellazioni fino a
+MAX_EDIT_DISTANCE caratteri, quindi una ricerca genera le cancellazioni della
+query, le cerca in un dizionario e calcola la distanza (Damerau, con le
+trasposizioni) solo sui pochi candidati.
+
+Lo stesso indice serve il builder, la CLI utm_bulk.py e il chatbot; per una
+property si costruisce da un report GA4 sessionSource × sessionMedium paginato
+(in cache per INDEX_TTL_SECONDS), offline dallo storico e dalla tabella guida.
+"""
+import bisect
+import re
+import threading
+import time
+from itertools import combinations
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from utm_core import GUIDE_TABLE_DATA, normalize_medium_token, normalize_token
+
+MAX_EDIT_DISTANCE = 2
+# Cancellazioni calcolate solo sui primi caratteri della chiave (come SymSpell): indice
+# e ricerca restano piccoli anche per chiavi lunghe; la distanza vera si calcola dopo
+PREFIX_LENGTH = 7
+# Un valore noto è comunque sospetto se un vicino ha almeno tante volte le sue sessioni
+DOMINANT_RATIO = 5
+# Sotto questa lunghezza una distanza 2 trasforma quasi qualsiasi valore in un altro
+SHORT_KEY_LENGTH = 5
+MAX_SUGGESTIONS = 5
+MIN_PREFIX_LENGTH = 3
+
+VOCABULARY_DAYS = 90
+REPORT_PAGE_SIZE = 10000
+MAX_VOCABULARY_ROWS = 250000
+INDEX_TTL_SECONDS = 60 * 60
+OFFLINE_TTL_SECONDS = 60
+
+# Abbreviazioni frequenti, usate solo se il valore di arrivo esiste nell'indice
+SOURCE_ALIASES = {
+    "fb": "facebook",
+    "meta": "facebook",
+    "ig": "instagram",
+    "insta": "instagram",
+    "li": "linkedin",
+    "yt": "youtube",
+    "tw": "twitter",
+    "gads": "google",
+    "adwords": "google",
+    "googleads": "google",
+    "nl": "newsletter",
+    "mc": "mailchimp",
+}
+MEDIUM_ALIASES = {
+    "ppc": "cpc",
+    "sem": "cpc",
+    "paidsearch": "cpc",
+    "mail": "email",
+    "newsletter": "email",
+    "paidsocial": "social_paid",
+    "organicsocial": "social_org",
+    "display": "cpm",
+}
+
+FIELD_NORMALIZERS = {"source": normalize_token, "medium": normalize_medium_token}
+FIELD_ALIASES = {"source": SOURCE_ALIASES, "medium": MEDIUM_ALIASES}
+
+
+def fold(value: str) -> str:
+    """Chiave di confronto: minuscole, solo lettere e cifre."""
+    return re.sub(r"[^a-z0-9]", "", str(value or "").lower())
+
+
+def _deletes(key: str, max_distance: int):
+    """Tutte le stringhe ottenute togliendo fino a max_distance caratteri (key inclusa)."""
+    yield key
+    for n in range(1, min(max_distance, len(key) - 1) + 1):
+        for positions in combinations(range(len(key)), n):
+            yield "".join(c for i, c in enumerate(key) if i not in positions)
+
+
+def edit_distance(a: str, b: str, max_distance: int = MAX_EDIT_DISTANCE) -> int:
+    """Distanza Damerau (optimal string alignment); max_distance + 1 appena la supera."""
+    if a == b:
+        return 0
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+    previous2 = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = a[i - 1] != b[j - 1]
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if previous2 is not None and i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        if min(current) > max_distance:
+            return max_distance + 1
+        previous2, previous = previous, current
+    return min(previous[-1], max_distance + 1)
+
+
+def _max_distance_for(key: str) -> int:
+    return 1 if len(key) < SHORT_KEY_LENGTH else MAX_EDIT_DISTANCE
+
+
+class ValueIndex:
+    """Valori noti di un campo UTM, raggruppati per chiave (fold) e pesati per sessioni."""
+
+    def __init__(self, weights: Dict[str, float], normalize: Callable[[str], str] = normalize_token,
+                 aliases: Optional[Dict[str, str]] = None):
+        self.normalize = normalize
+        self.aliases = {fold(k): fold(v) for k, v in (aliases or {}).items()}
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        for raw, sessions in weights.items():
+            key = fold(raw)
+            if not key:
+                continue
+            entry = self.entries.setdefault(key, {"key": key, "sessions": 0, "variants": {}})
+            entry["sessions"] += sessions or 0
+            entry["variants"][raw] = entry["variants"].get(raw, 0) + (sessions or 0)
+        for entry in self.entries.values():
+            # Valore suggerito: la variante più usata, nella forma normalizzata del campo
+            top = max(entry["variants"].items(), key=lambda kv: (kv[1], kv[0] == normalize(kv[0])))[0]
+            entry["value"] = normalize(top) or top
+        self._deletes: Dict[str, List[str]] = {}
+        for key in self.entries:
+            for d in set(_deletes(key[:PREFIX_LENGTH], MAX_EDIT_DISTANCE)):
+                self._deletes.setdefault(d, []).append(key)
+        self._sorted_keys = sorted(self.entries)
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def _suggestion(self, key: str, distance: int, reason: str) -> Dict[str, Any]:
+        entry = self.entries[key]
+        return {
+            "value": entry["value"],
+            "distance": distance,
+            "sessions": entry["sessions"],
+            "variants": sorted(entry["variants"], key=entry["variants"].get, reverse=True),
+            "reason": reason,
+        }
+
+    def lookup(self, value: str, limit: int = MAX_SUGGESTIONS) -> List[Dict[str, Any]]:
+        """Valori noti più vicini a `value`, per distanza crescente e poi sessioni decrescenti."""
+        key = fold(value)
+        if not key:
+            return []
+        found: Dict[str, Tuple[int, str]] = {}
+        if key in self.entries:
+            found[key] = (0, "stesso valore")
+        alias = self.aliases.get(key)
+        if alias in self.entries and alias not in found:
+            found[alias] = (0, "abbreviazione")
+        max_distance = _max_distance_for(key)
+        candidates = set()
+        for d in _deletes(key[:PREFIX_LENGTH], max_distance):
+            candidates.update(self._deletes.get(d, ()))
+        for candidate in candidates:
+            if candidate in found:
+                continue
+            distance = edit_distance(key, candidate, max_distance)
+            if distance <= max_distance:
+                found[candidate] = (distance, "simile")
+        if not found and len(key) >= MIN_PREFIX_LENGTH:
+            start = bisect.bisect_left(self._sorted_keys, key)
+            for candidate in self._sorted_keys[start:]:
+                if not candidate.startswith(key):
+                    break
+                found[candidate] = (len(candidate) - len(key), "inizia con")
+        ranked = sorted(found.items(), key=lambda kv: (kv[1][0], -self.entries[kv[0]]["sessions"], kv[0]))
+        return [self._suggestion(k, distance, reason) for k, (distance, reason) in ranked[:limit]]
+
+    def check(self, value: str, limit: int = MAX_SUGGESTIONS) -> Dict[str, Any]:
+        """
+        Esito per un valore digitato: known se coincide con il valore suggerito di un
+        gruppo noto e nessun vicino lo supera di DOMINANT_RATIO volte in sessioni
+        (es. "facebok" con 5.800 sessioni accanto a "facebook" con 58.000); suggestions
+        sono le alternative note, vuote se non c'è nulla di vicino.
+        """
+        normalized = self.normalize(value) or str(value or "").strip()
+        suggestions = self.lookup(value, limit + 1)
+        exact = next((s for s in suggestions if s["distance"] == 0 and s["value"] == normalized), None)
+        others = [s for s in suggestions if s["value"] != normalized]
+        if exact:
+            others = [s for s in others if exact["sessions"] and s["sessions"] >= DOMINANT_RATIO * exact["sessions"]]
+        return {
+            "value": normalized,
+            "known": bool(exact) and not others,
+            "observed_sessions": exact["sessions"] if exact else 0,
+            "suggestions": others[:limit],
+        }
+
+    def top(self, n: int = 50) -> List[str]:
+        """Valori suggeriti dei gruppi con più sessioni."""
+        ranked = sorted(self.entries.values(), key=lambda e: -e["sessions"])
+        return [e["value"] for e in ranked[:n]]
+
+
+def build_index(field: str, weights: Dict[str, float]) -> ValueIndex:
+    return ValueIndex(weights, FIELD_NORMALIZERS[field], FIELD_ALIASES[field])
+
+
+def guide_weights(field: str) -> Dict[str, float]:
+    """Valori della tabella guida (peso 0): ripiego quando non c'è una property."""
+    column = "utm_source" if field == "source" else "utm_medium"
+    weights = {}
+    for row in GUIDE_TABLE_DATA:
+        for value in re.split(r"[,|]", row[column]):
+            value = value.strip()
+            if value and value not in ("-",) and "(" not in value:
+                weights.setdefault(value, 0)
+    return weights
+
+
+def merge_weights(*sources: Dict[str, float]) -> Dict[str, float]:
+    merged: Dict[str, float] = {}
+    for weights in sources:
+        for value, sessions in weights.items():
+            merged[value] = merged.get(value, 0) + (sessions or 0)
+    return merged
+
+
+# --- VOCABOLARIO DA GA4 ---
+
+def fetch_vocabulary(property_id, creds, dimensions: Iterable[str], days: int = VOCABULARY_DAYS,
+                     max_rows: int = MAX_VOCABULARY_ROWS, metric: str = "sessions") -> Dict[str, Any]:
+    """
+    Tutte le combinazioni di `dimensions` con le sessioni degli ultimi `days` giorni,
+    a pagine di REPORT_PAGE_SIZE righe. Ritorna {"rows": [(valori..., sessioni)],
+    "row_count": combinazioni totali, "truncated": True se oltre max_rows}.
+    """
+    from google.analytics.data_v1beta.types import DateRange, Dimension, Metric, RunReportRequest
+    import ga4_mcp_tools
+
+    prop = str(property_id)
+    if not prop.startswith("properties/"):
+        prop = f"properties/{prop}"
+    dimensions = list(dimensions)
+    rows: List[Tuple] = []
+    row_count = None
+    offset = 0
+    while row_count is None or (offset < row_count and offset < max_rows):
+        request = RunReportRequest(
+            property=prop,
+            date_ranges=[DateRange(start_date=f"{days}daysAgo", end_date="today")],
+            dimensions=[Dimension(name=d) for d in dimensions],
+            metrics=[Metric(name=metric)],
+            limit=min(REPORT_PAGE_SIZE, max_rows - offset),
+            offset=offset,
+        )
+        response = ga4_mcp_tools.run_report_request(request, creds)
+        row_count = response.row_count
+        for row in response.rows:
+            rows.append(tuple(v.value for v in row.dimension_values) + (int(float(row.metric_values[0].value or 0)),))
+        if not response.rows:
+            break
+        offset += len(response.rows)
+    return {"rows": rows, "row_count": row_count or 0, "truncated": (row_count or 0) > len(rows)}
+
+
+_property_indexes: Dict[Tuple[str, str], Any] = {}  # (utente, property) -> (costruito alle, {"source", "medium", "row_count"})
+_property_lock = threading.Lock()
+_property_loading: Dict[Tuple[str, str], threading.Lock] = {}
+
+
+def get_property_index(property_id, creds, force_refresh: bool = False) -> Dict[str, Any]:
+    """
+    Indici source e medium della property (sessioni degli ultimi VOCABULARY_DAYS giorni).
+    In cache per utente e property (ga4_mcp_tools.creds_cache_key), così i valori di una
+    property non arrivano a chi non vi ha accesso; senza un utente identificabile si rilegge
+    ogni volta. Un solo caricamento alla volta per chiave. Solleva le eccezioni di GA4 (es. ga4_scheduler.GA4TransientError).
+    """
+    import ga4_mcp_tools
+
+    prop = str(property_id or "").replace("properties/", "")
+    user = ga4_mcp_tools.creds_cache_key(creds)
+    if not user:
+        return _load_property_index(prop, creds)
+    key = (user, prop)
+    with _property_lock:
+        cached = _property_indexes.get(key)
+        loading = _property_loading.setdefault(key, threading.Lock())
+    if cached and not force_refresh and time.monotonic() - cached[0] < INDEX_TTL_SECONDS:
+        return cached[1]
+    with loading:
+        with _property_lock:
+            cached = _property_indexes.get(key)
+        if cached and not force_refresh and time.monotonic() - cached[0] < INDEX_TTL_SECONDS:
+            return cached[1]
+        indexes = _load_property_index(prop, creds)
+        with _property_lock:
+            _property_indexes[key] = (time.monotonic(), indexes)
+        return indexes
+
+
+def _load_property_index(prop: str, creds) -> Dict[str, Any]:
+    vocabulary = fetch_vocabulary(prop, creds, ["sessionSource", "sessionMedium"])
+    sources: Dict[str, float] = {}
+    mediums: Dict[str, float] = {}
+    for source, medium, sessions in vocabulary["rows"]:
+        sources[source] = sources.get(source, 0) + sessions
+        mediums[medium] = mediums.get(medium, 0) + sessions
+    return {
+        "source": build_index("source", sources),
+        "medium": build_index("medium", mediums),
+        "row_count": vocabulary["row_count"],
+    }
+
+
+_offline_indexes: Dict[Tuple[str, str, str], Any] = {}  # (campo, utente, property) -> (costruito alle, ValueIndex)
+
+
+def get_offline_index(field: str, property_id: Optional[str] = None, extra_weights: Optional[Dict[str, float]] = None,
+                      user_email: str = "") -> ValueIndex:
+    """
+    Indice senza GA4: valori già usati nello storico di `user_email` (peso = numero di
+    link), tabella guida e pesi extra; senza email solo tabella guida e pesi extra. Senza
+    pesi extra resta in cache OFFLINE_TTL_SECONDS, così i rerun del builder a ogni tasto
+    non rileggono lo storico.
+    """
+    import utm_history_store
+
+    cache_key = (field, user_email or "", str(property_id or "").replace("properties/", ""))
+    if not extra_weights:
+        with _property_lock:
+            cached = _offline_indexes.get(cache_key)
+        if cached and time.monotonic() - cached[0] < OFFLINE_TTL_SECONDS:
+            return cached[1]
+    history = utm_history_store.count_values(f"utm_{field}", user_email, property_id)
+    index = build_index(field, merge_weights(guide_weights(field), history, extra_weights or {}))
+    if not extra_weights:
+        with _property_lock:
+            _offline_indexes[cache_key] = (time.monotonic(), index)
+    return index